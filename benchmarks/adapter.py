@@ -0,0 +1,78 @@
+import threading
+import urllib.parse
+from io import BytesIO
+from typing import Optional
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from outpatients.models import HTTPClient
+
+
+class FixtureAdapter(BaseAdapter):
+    """ネットワークに接続せず、用意したレスポンス本文を返す requests のアダプター
+
+    ``HTTPClient`` のセッションにマウントし、 Downloader の HTTP 通信を置き換える。
+    レスポンス本文は ``raw`` から読み出すため、ストリーミングでのダウンロードも
+    実際の通信と同じ経路を通る。
+
+    Args:
+        responses (dict): URL をキー、レスポンス本文と Content-Type のタプルを値とする辞書
+        hosts (dict): ホスト名をキー、URL を受け取りレスポンス本文と Content-Type の
+            タプルを返す関数を値とする辞書
+            ``responses`` にない URL のレスポンスを作るのに使う。
+
+    Attributes:
+        requests_count (int): 受け付けたリクエストの数
+        bytes_sent (int): 返したレスポンス本文のバイト数の合計
+
+    """
+
+    def __init__(self, responses: dict, hosts: Optional[dict] = None):
+        super().__init__()
+        self.__responses = responses
+        self.__hosts = hosts if hosts else dict()
+        self.__lock = threading.Lock()
+        self.requests_count = 0
+        self.bytes_sent = 0
+
+    def send(self, request, **kwargs) -> requests.Response:
+        host = urllib.parse.urlsplit(request.url).netloc
+        if request.url in self.__responses:
+            content, content_type = self.__responses[request.url]
+            status_code = 200
+        elif host in self.__hosts:
+            content, content_type = self.__hosts[host](request.url)
+            status_code = 200
+        else:
+            content, content_type = b"Not Found", "text/plain"
+            status_code = 404
+
+        with self.__lock:
+            self.requests_count += 1
+            self.bytes_sent += len(content)
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(
+            {"Content-Type": content_type, "Content-Length": str(len(content))}
+        )
+        response.raw = BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def close(self) -> None:
+        pass
+
+    def mount(self, client: HTTPClient) -> None:
+        """HTTP クライアントのセッションの全ての URL にこのアダプターをマウントする
+
+        Args:
+            client (:obj:`HTTPClient`): Downloader が使う HTTP クライアント
+
+        """
+        client.session.mount("http://", self)
+        client.session.mount("https://", self)
@@ -0,0 +1,255 @@
+import csv
+import hashlib
+import json
+import random
+import urllib.parse
+from io import BytesIO, StringIO
+from typing import NamedTuple
+
+import openpyxl
+
+from outpatients.management.commands import update_outpatients
+
+# 発熱外来一覧の Excel ファイルのリンクを含む HTML ファイルから取得する URL
+EXCEL_PATH = "/fs/benchmark/asahikawa.xlsx"
+EXCEL_URL = "https://www.pref.hokkaido.lg.jp" + EXCEL_PATH
+# 取り込み対象の市町村と、オープンデータの CSV に含める他の市町村
+TARGET_CITY = "旭川市"
+OTHER_CITIES = ["札幌市", "函館市", "釧路市", "帯広市", "北見市", "小樽市"]
+# オープンデータの CSV のうち取り込み対象の市町村の行の割合
+TARGET_CITY_RATIO = 0.4
+# オープンデータにない (YOLP Web API で検索する) 発熱外来の割合
+UNLISTED_RATIO = 0.01
+# 全角に変換する文字の表
+FULL_WIDTH_TABLE = str.maketrans(
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ ",
+    "０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺ　",
+)
+
+
+class Dataset(NamedTuple):
+    """``update_outpatients`` の取り込み元を模した合成データ
+
+    Attributes:
+        rows (int): 発熱外来一覧の行数
+        responses (dict): URL をキー、レスポンス本文と Content-Type のタプルを値とする辞書
+
+    """
+
+    rows: int
+    responses: dict
+
+
+def outpatient_name(index: int) -> str:
+    """合成データの発熱外来の医療機関名を返す"""
+    if index % 5 == 0:
+        return "医療法人社団 旭川第{}病院".format(index)
+    return "旭川第{}クリニック".format(index)
+
+
+def outpatient_address(index: int) -> str:
+    """合成データの発熱外来の住所を返す"""
+    return "{}{}条通{}丁目{}番地".format(
+        TARGET_CITY, index % 10 + 1, index % 24 + 1, index % 100 + 1
+    )
+
+
+def source_html(links_count: int) -> bytes:
+    """北海道公式ホームページの発熱外来一覧のページを模した HTML を返す
+
+    地域ごとの PDF ファイルへのリンクの後に、旭川市の Excel ファイルへのリンクを置く。
+
+    Args:
+        links_count (int): 旭川市以外の地域のリンクの数
+
+    Returns:
+        content (bytes): HTML ファイルの内容
+
+    """
+    div = (
+        '<div class="ss-alignment"><p><a href="/fs/benchmark/{0}.pdf">'
+        + '<img alt="{0:02d}P_地域{0}.jpg" src="/fs/{0}.jpg" /></a></p></div>'
+    )
+    body = "\n".join(div.format(index) for index in range(links_count))
+    body += (
+        '\n<div class="ss-alignment"><p><a href="{}">'.format(EXCEL_PATH)
+        + '<img alt="02E_旭川.jpg" src="/fs/asahikawa.jpg" /></a></p></div>'
+    )
+    return "<html><body><article>\n{}\n</article></body></html>".format(body).encode(
+        "utf-8"
+    )
+
+
+def outpatient_excel(rows: int, seed: int = 0) -> bytes:
+    """発熱外来一覧の Excel ファイルを模した 58 列の Sheet1 を持つ Excel ファイルを返す
+
+    先頭 3 行は見出しで、診療時間は Excel の時刻表記の文字列で書き込む。
+
+    Args:
+        rows (int): 発熱外来の行数
+        seed (int): 乱数のシード
+
+    Returns:
+        content (bytes): Excel ファイルの内容
+
+    """
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Sheet1")
+    worksheet.append(["新型コロナウイルス感染症 外来対応医療機関一覧"])
+    worksheet.append(["見出し"] * 58)
+    worksheet.append(["見出し"] * 58)
+    for index in range(rows):
+        row = [
+            "○" if rng.random() < 0.9 else "",
+            "○" if rng.random() < 0.5 else "",
+            "旭川",
+            outpatient_name(index).translate(FULL_WIDTH_TABLE),
+            TARGET_CITY,
+            "北海道" + outpatient_address(index).translate(FULL_WIDTH_TABLE),
+            "0166-{:02d}-{:04d}".format(index % 100, index % 10000),
+            "かかりつけ患者以外の診療も可" if rng.random() < 0.6 else "",
+            "○" if rng.random() < 0.3 else "",
+        ]
+        for _ in range(7):
+            if rng.random() < 0.2:
+                row += ["00:00:00", "", "00:00:00", "00:00:00", "", "00:00:00"]
+            else:
+                row += [
+                    "{:02d}:{:02d}:00".format(rng.choice([8, 9]), rng.choice([0, 30])),
+                    "～",
+                    "12:00:00",
+                    "13:00:00",
+                    "～",
+                    "{:02d}:00:00".format(rng.choice([17, 18, 19])),
+                ]
+        row += ["○", "○" if rng.random() < 0.5 else "", "", "", "", ""]
+        row.append("備考{}".format(index) if rng.random() < 0.1 else "")
+        worksheet.append(row)
+
+    excel_io = BytesIO()
+    workbook.save(excel_io)
+    return excel_io.getvalue()
+
+
+def opendata_csv(indices: list, seed: int = 0) -> bytes:
+    """北海道オープンデータポータルの医療機関の CSV ファイルを模した 37 列の CSV を返す
+
+    取り込み対象の市町村の行には発熱外来一覧の医療機関名と住所を使い、
+    他の市町村の行と混ぜて並べる。
+
+    Args:
+        indices (list of int): CSV に含める発熱外来の番号のリスト
+        seed (int): 乱数のシード
+
+    Returns:
+        content (bytes): cp932 でエンコードした CSV ファイルの内容
+
+    """
+    rng = random.Random(seed)
+    other_rows = round(len(indices) * (1 - TARGET_CITY_RATIO) / TARGET_CITY_RATIO)
+    entries = [
+        (TARGET_CITY, outpatient_name(index), outpatient_address(index))
+        for index in indices
+    ]
+    for number in range(other_rows):
+        city = rng.choice(OTHER_CITIES)
+        entries.append(
+            (
+                city,
+                "{}第{}医院".format(city, number),
+                "{}{}丁目{}番地".format(city, number % 20 + 1, number % 50 + 1),
+            )
+        )
+    rng.shuffle(entries)
+
+    csv_io = StringIO()
+    writer = csv.writer(csv_io, lineterminator="\r\n")
+    writer.writerow(["列{}".format(index) for index in range(37)])
+    for number, (city, name, address) in enumerate(entries):
+        row = [""] * 37
+        row[0] = "010006"
+        row[1] = str(number)
+        row[2] = "北海道"
+        row[4] = city
+        row[5] = name.translate(FULL_WIDTH_TABLE)
+        row[9] = address.translate(FULL_WIDTH_TABLE)
+        row[11] = "{:.6f}".format(43.0 + rng.random())
+        row[12] = "{:.6f}".format(141.0 + rng.random() * 2)
+        row[36] = "2024-01-01"
+        writer.writerow(row)
+    return csv_io.getvalue().encode("cp932")
+
+
+def yolp_json(query: str) -> bytes:
+    """YOLP Web API のローカルサーチの検索結果を模した JSON を返す
+
+    検索語のハッシュ値から緯度経度を決めるため、同じ検索語には同じ結果を返す。
+
+    Args:
+        query (str): 検索語
+
+    Returns:
+        content (bytes): JSON の内容
+
+    """
+    digest = hashlib.sha256(query.encode("utf-8")).digest()
+    latitude = 43.7 + digest[0] / 2560
+    longitude = 142.3 + digest[1] / 2560
+    return json.dumps(
+        {
+            "ResultInfo": {"Count": 1, "Total": 1, "Start": 1, "Status": 200},
+            "Feature": [
+                {
+                    "Name": query,
+                    "Geometry": {
+                        "Type": "point",
+                        "Coordinates": "{:.6f},{:.6f}".format(longitude, latitude),
+                    },
+                }
+            ],
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+
+def yolp_response(url: str) -> tuple:
+    """YOLP Web API の URL に対するレスポンス本文と Content-Type を返す"""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get("query", [""])
+    return yolp_json(query[0]), "application/json"
+
+
+def build_dataset(rows: int, seed: int = 0) -> Dataset:
+    """``update_outpatients`` が取得する全ての URL の合成データを作成する
+
+    発熱外来の一部はどちらの CSV にも含めず、残りを病院とクリニックの CSV に分ける。
+
+    Args:
+        rows (int): 発熱外来一覧の行数
+        seed (int): 乱数のシード
+
+    Returns:
+        dataset (:obj:`Dataset`): 合成データ
+
+    """
+    rng = random.Random(seed)
+    listed = [index for index in range(rows) if UNLISTED_RATIO <= rng.random()]
+    responses = {
+        update_outpatients.OUTPATIENTS_URL: (
+            source_html(max(rows // 100, 10)),
+            "text/html; charset=utf-8",
+        ),
+        EXCEL_URL: (
+            outpatient_excel(rows, seed),
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        ),
+        update_outpatients.HOSPITAL_OPENDATA_URL: (
+            opendata_csv(listed[::2], seed=seed),
+            "text/csv",
+        ),
+        update_outpatients.CLINIC_OPENDATA_URL: (
+            opendata_csv(listed[1::2], seed=seed + 1),
+            "text/csv",
+        ),
+    }
+    return Dataset(rows, responses)
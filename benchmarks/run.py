@@ -0,0 +1,199 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+import django
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_OUTPUT = Path(__file__).resolve().parent / "results.json"
+# 基準の計測結果と比べて、この割合を超えて遅くなるかメモリ使用量が増えたら退行とする
+DEFAULT_THRESHOLD = 0.2
+# 比較する計測値と、その値が何を表すか
+COMPARED_METRICS = {
+    "median_seconds": "処理時間",
+    "peak_memory_bytes": "最大メモリ使用量",
+}
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="合成データで取り込み処理の処理時間とメモリ使用量を計測する"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="発熱外来一覧の行数 (複数指定可)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="処理時間を計測する回数")
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="最大メモリ使用量を計測しない",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        help="名前にいずれかの文字列を含むベンチマークだけを実行する",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="合成データの乱数のシード")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=DEFAULT_OUTPUT,
+        help="計測結果を書き込む JSON ファイル",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="比較する基準の計測結果の JSON ファイル",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="退行とみなす基準からの増加の割合",
+    )
+    return parser.parse_args(argv)
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """計測結果を基準の計測結果と比べる
+
+    名前と行数が同じ計測結果どうしで、処理時間の中央値と最大メモリ使用量を比べる。
+
+    Args:
+        results (list of dict): 計測結果のリスト
+        baseline (list of dict): 基準の計測結果のリスト
+        threshold (float): 退行とみなす基準からの増加の割合
+
+    Returns:
+        comparisons (list of dict): 名前、行数、計測値の名前、基準の値、今回の値、
+            比率、退行しているかを持つ辞書のリスト
+
+    """
+    baseline_by_key = {(result["name"], result["rows"]): result for result in baseline}
+    comparisons = list()
+    for result in results:
+        base = baseline_by_key.get((result["name"], result["rows"]))
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if not base.get(metric) or result.get(metric) is None:
+                continue
+            ratio = result[metric] / base[metric]
+            comparisons.append(
+                {
+                    "name": result["name"],
+                    "rows": result["rows"],
+                    "metric": metric,
+                    "baseline": base[metric],
+                    "current": result[metric],
+                    "ratio": ratio,
+                    "regressed": 1 + threshold < ratio,
+                }
+            )
+    return comparisons
+
+
+def get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_args(argv)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "opendata.settings")
+    # ScrapeYOLPLocation はアプリケーション ID がないと URL を組み立てられない
+    os.environ.setdefault("YOLP_APP_ID", "benchmark")
+    django.setup()
+    # ダウンロードごとの INFO ログは計測結果の表示の妨げになるため出力しない
+    logging.disable(logging.INFO)
+
+    # Django の設定を読み込んでからモデルを読み込む
+    from django.db import connection
+
+    from benchmarks.datasets import build_dataset
+    from benchmarks.suite import create_admin_user, run_dataset
+
+    old_database_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    results = list()
+    try:
+        create_admin_user()
+        for size in args.sizes:
+            print("合成データを作成しています: {} 行".format(size), file=sys.stderr)
+            dataset = build_dataset(size, seed=args.seed)
+            for result in run_dataset(
+                dataset,
+                repeat=args.repeat,
+                trace_memory=not args.no_memory,
+                only=args.only,
+            ):
+                print(
+                    "{name} ({rows} 行): 中央値 {median_seconds:.3f} 秒、"
+                    "{items} 件、SQL {queries} 件".format(**result),
+                    file=sys.stderr,
+                )
+                results.append(result)
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+    report = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": connection.vendor,
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        comparisons = compare(results, baseline["results"], args.threshold)
+        report["baseline"] = {
+            "path": str(args.baseline),
+            "git_commit": baseline.get("git_commit"),
+            "threshold": args.threshold,
+            "comparisons": comparisons,
+        }
+        for comparison in comparisons:
+            print(
+                "{} {} ({} 行) {}: 基準の {:.2f} 倍".format(
+                    "!!" if comparison["regressed"] else "  ",
+                    comparison["name"],
+                    comparison["rows"],
+                    COMPARED_METRICS[comparison["metric"]],
+                    comparison["ratio"],
+                ),
+                file=sys.stderr,
+            )
+        if any(comparison["regressed"] for comparison in comparisons):
+            exit_code = 1
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(
+        json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    print("計測結果を書き込みました: {}".format(args.output), file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import statistics
+import time
+import tracemalloc
+from io import StringIO
+from typing import Callable, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import override_settings
+
+from benchmarks.adapter import FixtureAdapter
+from benchmarks.datasets import EXCEL_URL, Dataset, yolp_response
+from outpatients.management.commands import update_outpatients
+from outpatients.models import (
+    GeocodeCache,
+    HTTPClient,
+    IngestRun,
+    Location,
+    Outpatient,
+    ScrapeOpendataLocation,
+    ScrapeOutpatient,
+    ScrapeOutpatientSourceURL,
+    Scraper,
+)
+from outpatients.query_budget import QueryRecorder
+from outpatients.schedule import parse_opening_hours
+
+# ベンチマーク中は取り込み元のキャッシュと YOLP Web API の呼び出し回数の制限を無効にする
+# 計測のたびに消去するキャッシュとデータのバージョンは、共有のキャッシュサーバーではなく
+# プロセス内のキャッシュに置く
+BENCHMARK_SETTINGS = {
+    "DOWNLOAD_CACHE_DIR": None,
+    "CACHES": {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "benchmarks",
+        }
+    },
+    "GEOCODING": {"RATE_LIMIT": 0, "MAX_WORKERS": 4},
+}
+
+
+def clear_memoized() -> None:
+    """プロセス内にメモ化した正規化と診療時間の解析結果を消去する"""
+    Scraper.normalizer.cache_clear()
+    parse_opening_hours.cache_clear()
+
+
+def clear_database() -> None:
+    """取り込みで作成したデータとキャッシュを削除する"""
+    Outpatient.objects.all().delete()
+    Location.objects.all().delete()
+    GeocodeCache.objects.all().delete()
+    IngestRun.objects.all().delete()
+    for cache in caches.all():
+        cache.clear()
+
+
+def measure(
+    name: str,
+    dataset: Dataset,
+    run: Callable[[], int],
+    repeat: int,
+    trace_memory: bool,
+    setup: Optional[Callable[[], None]] = None,
+    adapter: Optional[FixtureAdapter] = None,
+) -> dict:
+    """処理を繰り返し実行して、処理時間、処理件数、SQL の件数、最大メモリ使用量を計測する
+
+    最大メモリ使用量は ``tracemalloc`` の計測による遅れが処理時間に影響しないよう、
+    処理時間の計測の後に別に 1 回実行して計測する。
+
+    Args:
+        name (str): ベンチマークの名前
+        dataset (:obj:`Dataset`): 合成データ
+        run (callable): 計測する処理
+            処理した件数を返す。
+        repeat (int): 処理時間を計測する回数
+        trace_memory (bool): 真なら最大メモリ使用量を計測する
+        setup (callable): 毎回の実行の前に呼び出す、計測しない準備の処理
+        adapter (:obj:`FixtureAdapter`): ダウンロードしたバイト数を数えるアダプター
+
+    Returns:
+        result (dict): 計測結果
+
+    """
+    seconds = list()
+    queries = 0
+    bytes_downloaded = 0
+    items = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        clear_memoized()
+        bytes_before = adapter.bytes_sent if adapter else 0
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started_at = time.perf_counter()
+            items = run()
+            seconds.append(time.perf_counter() - started_at)
+        queries = recorder.count
+        bytes_downloaded = (adapter.bytes_sent if adapter else 0) - bytes_before
+
+    peak_memory_bytes = None
+    if trace_memory:
+        if setup:
+            setup()
+        clear_memoized()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak_memory_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    median_seconds = statistics.median(seconds)
+    return {
+        "name": name,
+        "rows": dataset.rows,
+        "items": items,
+        "repeat": repeat,
+        "median_seconds": median_seconds,
+        "min_seconds": min(seconds),
+        "max_seconds": max(seconds),
+        "items_per_second": items / median_seconds if median_seconds else None,
+        "peak_memory_bytes": peak_memory_bytes,
+        "queries": queries,
+        "bytes_downloaded": bytes_downloaded,
+    }
+
+
+def run_dataset(
+    dataset: Dataset,
+    repeat: int = 3,
+    trace_memory: bool = True,
+    only: Optional[list] = None,
+) -> list:
+    """1 つの合成データで全てのベンチマークを実行する
+
+    データベースは呼び出し側で用意し、 ``update_outpatients`` が使う ``admin``
+    ユーザーを作成しておく。
+
+    Args:
+        dataset (:obj:`Dataset`): 合成データ
+        repeat (int): 処理時間を計測する回数
+        trace_memory (bool): 真なら最大メモリ使用量を計測する
+        only (list of str): 指定した場合は名前が含まれるベンチマークだけを実行する
+
+    Returns:
+        results (list of dict): 計測結果のリスト
+
+    """
+    adapter = FixtureAdapter(
+        dataset.responses, hosts={"map.yahooapis.jp": yolp_response}
+    )
+    # --geocode で発熱外来を検索する Geocoder もこの設定から作成される
+    with override_settings(**BENCHMARK_SETTINGS):
+        HTTPClient.reset_default()
+        adapter.mount(HTTPClient.get_default())
+        try:
+            return [
+                measure(name, dataset, run, repeat, trace_memory, setup, adapter)
+                for name, run, setup in get_benchmarks()
+                if not only or any(pattern in name for pattern in only)
+            ]
+        finally:
+            HTTPClient.reset_default()
+
+
+def get_benchmarks() -> list:
+    """ベンチマークの名前、計測する処理、準備の処理のタプルのリストを返す"""
+
+    def scrape_source_url() -> int:
+        url = ScrapeOutpatientSourceURL.get(update_outpatients.OUTPATIENTS_URL)
+        if url != EXCEL_URL:
+            raise RuntimeError("Excel ファイルの URL を抽出できませんでした。")
+        return 1
+
+    def scrape_outpatient(engine: str) -> Callable[[], int]:
+        return lambda: len(ScrapeOutpatient(EXCEL_URL, engine=engine).lists)
+
+    def scrape_opendata_location() -> int:
+        return len(
+            ScrapeOpendataLocation(update_outpatients.HOSPITAL_OPENDATA_URL).lists
+        )
+
+    def update() -> int:
+        call_command("update_outpatients", "--force", "--geocode", stdout=StringIO())
+        return Outpatient.objects.count()
+
+    def ensure_imported() -> None:
+        if not Outpatient.objects.exists():
+            update()
+
+    return [
+        ("ScrapeOutpatientSourceURL", scrape_source_url, None),
+        ("ScrapeOutpatient[pandas]", scrape_outpatient("pandas"), None),
+        ("ScrapeOutpatient[openpyxl]", scrape_outpatient("openpyxl"), None),
+        ("ScrapeOpendataLocation", scrape_opendata_location, None),
+        ("update_outpatients[initial]", update, clear_database),
+        ("update_outpatients[unchanged]", update, ensure_imported),
+    ]
+
+
+def create_admin_user() -> None:
+    """``update_outpatients`` がデータの作成者にする ``admin`` ユーザーを作成する"""
+    get_user_model().objects.get_or_create(username="admin")
@@ -79,6 +79,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The rendered top page is cached per data version. update_outpatients runs in
+# another process, so the backend must be shared between processes (file, Redis,
+# Memcached or database cache) for its version bumps to reach the web server.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", str(BASE_DIR / ".django_cache")),
+    }
+}
+
+OUTPATIENTS_CACHE_ALIAS = "default"
+
+OUTPATIENTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -153,6 +173,52 @@ LOGGING = {
     },
 }
 
+# HTTP client shared by the downloaders used in update_outpatients
+
+DOWNLOADER = {
+    # (connect, read) timeout in seconds
+    "TIMEOUT": (10, 60),
+    "RETRIES": 3,
+    "BACKOFF_FACTOR": 1.0,
+    "POOL_MAXSIZE": 10,
+    "MAX_CONNECTIONS_PER_HOST": 2,
+    "USER_AGENT": "Mozilla/5.0",
+}
+
+# Conditional-GET cache for the files downloaded by update_outpatients
+
+DOWNLOAD_CACHE_DIR = os.environ.get(
+    "DOWNLOAD_CACHE_DIR", str(BASE_DIR / ".download_cache")
+)
+
+# Reader used by ScrapeOutpatient for the outpatient Excel workbook:
+# "pandas" (DataFrame, column-wise transform) or "openpyxl" (read-only, row stream)
+
+OUTPATIENT_EXCEL_ENGINE = os.environ.get("OUTPATIENT_EXCEL_ENGINE", "pandas")
+
+# Maximum number of distinct scraped strings whose normalised form is memoised
+
+NORMALIZE_CACHE_SIZE = 16384
+
+# YOLP geocoding of outpatients without open-data coordinates (update_outpatients --geocode)
+
+GEOCODING = {
+    "CITY_CODE": "01204",
+    "INDUSTRY_CODE": "0401",
+    # YOLP requests per second across all worker threads
+    "RATE_LIMIT": 5.0,
+    "MAX_WORKERS": 4,
+    # seconds before a cached result (found / not found) is looked up again
+    "TTL": 60 * 60 * 24 * 90,
+    "NEGATIVE_TTL": 60 * 60 * 24 * 7,
+}
+
+# Raise instead of logging a warning when a view exceeds its @query_budget.
+# Off by default: the count includes queries issued by a database cache backend,
+# so an overrun is logged rather than turned into a 500. The test suite enables it.
+
+QUERY_BUDGET_STRICT = False
+
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
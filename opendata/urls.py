@@ -8,4 +8,5 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("outpatients/", include("outpatients.urls")),
     path("accounts/", include("accounts.urls")),
+    path("api/", include("outpatients.api_urls")),
 ]
@@ -0,0 +1,162 @@
+import hashlib
+
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from outpatients.cache import get_data_version
+from outpatients.forms import OutpatientFilterForm
+from outpatients.models import Location, Outpatient
+from outpatients.serializers import (
+    LocationSerializer,
+    NearestQuerySerializer,
+    OutpatientSerializer,
+    SearchQuerySerializer,
+)
+from outpatients.spatial import get_spatial_index
+
+
+def get_etag(request, *args, **kwargs) -> str:
+    """データのバージョンとリクエストの URL から ETag を計算する
+
+    データのバージョンはキャッシュから取得するため、 304 Not Modified を返す場合は
+    データベースにアクセスしない。現在診療中で絞り込む場合は、結果が変わりうる
+    1 分ごとに異なる ETag にする。
+
+    """
+    key = get_data_version() + request.get_full_path()
+    if request.GET.get("open_now"):
+        key += timezone.localtime().strftime("%Y%m%d%H%M")
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class IdCursorPagination(CursorPagination):
+    ordering = "id"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class ReadOnlyAPIViewSet(viewsets.ReadOnlyModelViewSet):
+    """一覧と詳細を返す読み取り専用 API の基底クラス
+
+    カーソル方式でページ分割し、 ``?fields=`` で指定した項目だけを読み込んで返す。
+    レスポンスには ETag を付与する。
+
+    """
+
+    pagination_class = IdCursorPagination
+
+    def get_queryset(self):
+        queryset = self.filter_queryset_by_params(self.queryset.all())
+        requested_fields = self.get_serializer_class().get_requested_fields(
+            self.request
+        )
+        if requested_fields:
+            queryset = queryset.only("id", *requested_fields)
+        return queryset
+
+    def filter_queryset_by_params(self, queryset):
+        return queryset
+
+    @method_decorator(etag(get_etag))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(etag(get_etag))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class OutpatientViewSet(ReadOnlyAPIViewSet):
+    """発熱外来の一覧と詳細
+
+    一覧は画面と同じく ``q`` 、 ``city`` 、 ``public_health_care_center`` 、
+    ``is_pediatrics`` などの条件で絞り込める。
+
+    """
+
+    queryset = Outpatient.objects.all()
+    serializer_class = OutpatientSerializer
+
+    def filter_queryset_by_params(self, queryset):
+        return OutpatientFilterForm(self.request.query_params).filter(queryset)
+
+    @action(detail=False)
+    @method_decorator(etag(get_etag))
+    def nearest(self, request):
+        """``lat`` 、 ``lon`` の地点から近い順に ``k`` 件の発熱外来を返す
+
+        一覧と同じ条件で絞り込める。 ``open_now`` を指定すると現在診療中の発熱外来だけを
+        返す。各発熱外来には位置情報と距離 (km) を付与する。
+
+        """
+        query = NearestQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        form = OutpatientFilterForm(request.query_params)
+        allowed_ids = None
+        if form.has_changed():
+            allowed_ids = form.filter(Outpatient.objects.all()).values_list(
+                "id", flat=True
+            )
+        neighbors = get_spatial_index().nearest(
+            query.validated_data["lat"],
+            query.validated_data["lon"],
+            k=query.validated_data["k"],
+            allowed_ids=allowed_ids,
+        )
+
+        outpatients = Outpatient.objects.select_related("location").in_bulk(
+            [neighbor.outpatient_id for neighbor in neighbors]
+        )
+        results = list()
+        for neighbor in neighbors:
+            outpatient = outpatients.get(neighbor.outpatient_id)
+            if outpatient is None or outpatient.location is None:
+                continue
+            result = self.get_serializer(outpatient).data
+            result["latitude"] = outpatient.location.latitude
+            result["longitude"] = outpatient.location.longitude
+            result["distance"] = round(neighbor.distance, 3)
+            results.append(result)
+        return Response(results)
+
+    @action(detail=False)
+    @method_decorator(etag(get_etag))
+    def search(self, request):
+        """``q`` のキーワードを含む発熱外来を一致の度合いが高い順に ``limit`` 件返す
+
+        医療機関名、住所、備考を検索する。一覧と同じ条件で絞り込める。
+
+        """
+        query = SearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        outpatients = self.get_queryset()[: query.validated_data["limit"]]
+        return Response(self.get_serializer(outpatients, many=True).data)
+
+
+class LocationViewSet(ReadOnlyAPIViewSet):
+    """医療機関の位置情報の一覧と詳細
+
+    一覧は ``medical_institution_name`` で絞り込める。
+
+    """
+
+    queryset = Location.objects.all()
+    serializer_class = LocationSerializer
+
+    def filter_queryset_by_params(self, queryset):
+        medical_institution_name = self.request.query_params.get(
+            "medical_institution_name"
+        )
+        if medical_institution_name:
+            queryset = queryset.filter(
+                medical_institution_name=medical_institution_name
+            )
+        return queryset
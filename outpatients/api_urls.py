@@ -0,0 +1,9 @@
+from rest_framework import routers
+
+from outpatients import api
+
+router = routers.DefaultRouter()
+router.register("outpatients", api.OutpatientViewSet)
+router.register("locations", api.LocationViewSet)
+
+urlpatterns = router.urls
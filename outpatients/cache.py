@@ -0,0 +1,111 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DATA_VERSION_KEY = "outpatients:data_version"
+
+
+def get_cache():
+    """発熱外来データのキャッシュに使うキャッシュバックエンドを返す
+
+    Returns:
+        cache (:obj:`BaseCache`): 設定ファイルの ``OUTPATIENTS_CACHE_ALIAS`` のキャッシュ
+
+    """
+    return caches[getattr(settings, "OUTPATIENTS_CACHE_ALIAS", "default")]
+
+
+def get_data_version() -> str:
+    """発熱外来データのバージョンを返す
+
+    バージョンがまだない場合、またはキャッシュから消えていた場合は新しく発行する。
+
+    Returns:
+        data_version (str): 発熱外来データのバージョン
+
+    """
+    cache = get_cache()
+    data_version = cache.get(DATA_VERSION_KEY)
+    if data_version is None:
+        cache.add(DATA_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        data_version = cache.get(DATA_VERSION_KEY)
+    return data_version
+
+
+def bump_data_version() -> None:
+    """発熱外来データのバージョンを更新し、古いバージョンのキャッシュを無効にする
+
+    トランザクション中に呼び出した場合は、コミット後に更新する。
+
+    """
+    transaction.on_commit(
+        lambda: get_cache().set(DATA_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    )
+
+
+def get_or_set(key: str, default):
+    """データのバージョンごとにキャッシュした値を返す
+
+    Args:
+        key (str): 値を識別するキー
+        default (callable): キャッシュがない場合に値を返す関数
+
+    Returns:
+        value (object): キャッシュした値
+
+    """
+    cache = get_cache()
+    cache_key = "outpatients:{}:{}".format(get_data_version(), key)
+    value = cache.get(cache_key)
+    if value is None:
+        value = default()
+        cache.set(
+            cache_key,
+            value,
+            timeout=getattr(settings, "OUTPATIENTS_PAGE_CACHE_TIMEOUT", 60 * 60 * 24),
+        )
+    return value
+
+
+def get_or_render(key: str, render) -> bytes:
+    """データのバージョンごとにキャッシュした描画結果を返す
+
+    Args:
+        key (str): 描画結果を識別するキー
+        render (callable): キャッシュがない場合に描画結果の bytes を返す関数
+
+    Returns:
+        content (bytes): 描画結果
+
+    """
+    return get_or_set(key, render)
+
+
+_versioned_lock = threading.Lock()
+_versioned_objects = dict()
+
+
+def get_or_build(name: str, build):
+    """データのバージョンごとに作成したオブジェクトをプロセス内に保持して返す
+
+    データのバージョンが変わっていれば作り直すため、取り込みや編集の後は
+    次の呼び出しで新しいオブジェクトが使われる。
+
+    Args:
+        name (str): オブジェクトを識別する名前
+        build (callable): オブジェクトを作成する関数
+
+    Returns:
+        obj (object): 現在のデータのバージョンで作成したオブジェクト
+
+    """
+    data_version = get_data_version()
+    with _versioned_lock:
+        version, obj = _versioned_objects.get(name, (None, None))
+        if version != data_version:
+            obj = build()
+            _versioned_objects[name] = (data_version, obj)
+        return obj
@@ -1,6 +1,11 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db.models import Case, When
+from django.http import QueryDict
+from django.utils import timezone
 
 from outpatients.models import Outpatient
+from outpatients.search import get_search_index
 
 
 class OutpatientForm(forms.ModelForm):
@@ -29,3 +34,130 @@ class OutpatientForm(forms.ModelForm):
             "is_home_visitation_for_positive_patients",
             "memo",
         )
+
+    def _post_clean(self):
+        super()._post_clean()
+        # 作成者はフォームの項目ではないため、 ModelForm は医療機関名と作成者の
+        # 一意制約を検証しない。作成者を設定したインスタンスでは一意制約も検証する
+        if self.instance.created_by_id is None:
+            return
+        exclude = self._get_validation_exclusions()
+        exclude.discard("created_by")
+        try:
+            self.instance.validate_constraints(exclude=exclude)
+        except ValidationError as e:
+            self._update_errors(e)
+
+
+class OutpatientFilterForm(forms.Form):
+    """発熱外来一覧の絞り込み条件"""
+
+    BOOLEAN_FIELDS = (
+        "is_positive_patients",
+        "is_target_not_family",
+        "is_pediatrics",
+        "is_online_for_positive_patients",
+        "is_home_visitation_for_positive_patients",
+    )
+    # キーワード検索で一覧に表示する件数の上限
+    SEARCH_LIMIT = 500
+
+    q = forms.CharField(label="キーワード", required=False)
+    city = forms.CharField(label="市町村", required=False)
+    public_health_care_center = forms.CharField(label="保健所", required=False)
+    is_positive_patients = forms.NullBooleanField(
+        label="陽性者の治療に関与する医療機関", required=False
+    )
+    is_target_not_family = forms.NullBooleanField(
+        label="かかりつけ患者以外の診療", required=False
+    )
+    is_pediatrics = forms.NullBooleanField(label="小児対応の可否", required=False)
+    is_online_for_positive_patients = forms.NullBooleanField(
+        label="オンライン診療", required=False
+    )
+    is_home_visitation_for_positive_patients = forms.NullBooleanField(
+        label="訪問診療", required=False
+    )
+    open_now = forms.BooleanField(label="現在診療中", required=False)
+
+    def filter(self, queryset):
+        """入力された条件で発熱外来の QuerySet を絞り込む
+
+        Args:
+            queryset (:obj:`QuerySet`): 発熱外来の QuerySet
+
+        Returns:
+            queryset (:obj:`QuerySet`): 絞り込んだ発熱外来の QuerySet
+                入力が正しくない場合は絞り込まずに返す。キーワードを指定した場合は
+                一致の度合いが高い順に並べる。
+
+        """
+        queryset = queryset.filter(**self.get_conditions())
+        if not self.is_valid():
+            return queryset
+
+        if self.cleaned_data["open_now"]:
+            queryset = queryset.open_at(timezone.now())
+        if self.cleaned_data["q"]:
+            # 医療機関名、住所、備考の検索索引で一致した発熱外来を得点の高い順に並べる
+            outpatient_ids = [
+                result.outpatient_id
+                for result in get_search_index().search(
+                    self.cleaned_data["q"], limit=self.SEARCH_LIMIT
+                )
+            ]
+            if not outpatient_ids:
+                return queryset.none()
+            queryset = queryset.filter(id__in=outpatient_ids).order_by(
+                Case(
+                    *[
+                        When(id=outpatient_id, then=rank)
+                        for rank, outpatient_id in enumerate(outpatient_ids)
+                    ]
+                ),
+                "id",
+            )
+        return queryset
+
+    def get_query(self) -> QueryDict:
+        """入力された条件を正規化したクエリ文字列にする
+
+        入力された条件だけを項目の定義順に並べ、表記の違いをなくす。
+
+        Returns:
+            query (:obj:`QueryDict`): 正規化したクエリ文字列
+                入力が正しくない場合は空のクエリ文字列を返す。
+
+        """
+        query = QueryDict(mutable=True)
+        if not self.is_valid():
+            return query
+
+        for name, value in self.cleaned_data.items():
+            if isinstance(self.fields[name], forms.NullBooleanField):
+                if value is not None:
+                    query[name] = "true" if value else "false"
+            elif value:
+                query[name] = "true" if value is True else value
+        return query
+
+    def get_conditions(self) -> dict:
+        """入力された条件を QuerySet の ``filter`` に渡す辞書にする
+
+        Returns:
+            conditions (dict): 絞り込み条件の辞書
+                入力が正しくない場合、または条件がない場合は空の辞書を返す。
+                ``q`` と ``open_now`` は索引や日時を使って絞り込むため含めない。
+
+        """
+        if not self.is_valid():
+            return dict()
+
+        conditions = dict()
+        for field in ("city", "public_health_care_center"):
+            if self.cleaned_data[field]:
+                conditions[field] = self.cleaned_data[field]
+        for field in self.BOOLEAN_FIELDS:
+            if self.cleaned_data[field] is not None:
+                conditions[field] = self.cleaned_data[field]
+        return conditions
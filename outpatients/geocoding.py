@@ -0,0 +1,204 @@
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import requests
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from outpatients.models import GeocodeCache, HTTPClient, Scraper, ScrapeYOLPLocation
+
+logger = logging.getLogger(__name__)
+
+
+class Coordinates(NamedTuple):
+    latitude: float
+    longitude: float
+
+
+class RateLimiter:
+    """複数のスレッドから呼び出される処理の頻度を 1 秒あたりの回数以下に抑える
+
+    Args:
+        rate (float): 1 秒あたりに許可する回数
+            0 以下なら制限しない。
+
+    """
+
+    def __init__(self, rate: float):
+        self.__interval = 1.0 / rate if 0 < rate else 0.0
+        self.__lock = threading.Lock()
+        self.__next_at = time.monotonic()
+
+    def acquire(self) -> None:
+        """前回の呼び出しから間隔が空くまで待つ"""
+        with self.__lock:
+            now = time.monotonic()
+            wait = self.__next_at - now
+            self.__next_at = max(self.__next_at, now) + self.__interval
+        if 0 < wait:
+            time.sleep(wait)
+
+
+class Geocoder:
+    """施設名から緯度経度を検索し、結果をデータベースにキャッシュする
+
+    YOLP Web API の検索は、正規化した施設名、住所コード、業種コードをキーとして
+    ``GeocodeCache`` に保存し、有効期限内は再び検索しない。検索結果がなかった場合も
+    保存し、別の有効期限が切れるまでは再び検索しない。
+
+    Args:
+        city_code (str): 検索する市区町村の住所コード
+        industry_code (str): 検索する業種コード
+        rate_limit (float): 1 秒あたりの YOLP Web API の呼び出し回数の上限
+        max_workers (int): 並行して検索するスレッドの数
+        ttl (:obj:`datetime.timedelta`): 検索結果のキャッシュの有効期限
+        negative_ttl (:obj:`datetime.timedelta`): 検索結果がなかったことの有効期限
+        client (:obj:`HTTPClient`): ダウンロードに使う HTTP クライアント
+
+    """
+
+    def __init__(
+        self,
+        city_code: str = "01204",
+        industry_code: str = "0401",
+        rate_limit: float = 5.0,
+        max_workers: int = 4,
+        ttl: datetime.timedelta = datetime.timedelta(days=90),
+        negative_ttl: datetime.timedelta = datetime.timedelta(days=7),
+        client: Optional[HTTPClient] = None,
+    ):
+        self.__city_code = city_code
+        self.__industry_code = industry_code
+        self.__rate_limiter = RateLimiter(rate_limit)
+        self.__max_workers = max_workers
+        self.__ttl = ttl
+        self.__negative_ttl = negative_ttl
+        self.__client = client
+        self.__api_calls = 0
+
+    @classmethod
+    def from_settings(cls, **kwargs) -> "Geocoder":
+        """設定ファイルの ``GEOCODING`` の値で作成する"""
+        options = {
+            key.lower(): value
+            for key, value in getattr(settings, "GEOCODING", dict()).items()
+        }
+        for key in ("ttl", "negative_ttl"):
+            if key in options:
+                options[key] = datetime.timedelta(seconds=options[key])
+        options.update(kwargs)
+        return cls(**options)
+
+    def geocode(self, name: str) -> Optional[Coordinates]:
+        """施設名から緯度経度を検索する
+
+        Args:
+            name (str): 施設名
+
+        Returns:
+            coordinates (:obj:`Coordinates`): 緯度経度
+                見つからなかった場合は None を返す。
+
+        """
+        return self.geocode_many([name]).get(name)
+
+    def geocode_many(self, names: list) -> dict:
+        """複数の施設名から緯度経度をまとめて検索する
+
+        キャッシュにない施設名だけを、呼び出し回数の上限を守りながら並行して検索する。
+        通信エラーなどで検索できなかった施設名はキャッシュせず、結果にも含めない。
+
+        Args:
+            names (list of str): 施設名のリスト
+
+        Returns:
+            coordinates (dict): 施設名をキー、 :obj:`Coordinates` を値とする辞書
+                見つからなかった施設名の値は None にする。
+
+        """
+        keys = {name: Scraper.normalizer.normalize(name) for name in names if name}
+        results_by_key = self._load_cache(set(keys.values()))
+
+        missing = dict()
+        for name, key in keys.items():
+            if key not in results_by_key:
+                missing.setdefault(key, name)
+        if missing:
+            self.__api_calls += len(missing)
+            with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+                fetched = dict(
+                    zip(missing.keys(), executor.map(self._search, missing.values()))
+                )
+            # 通信エラーなどで検索できなかった施設名 (False) はキャッシュしない
+            fetched = {
+                key: result for key, result in fetched.items() if result is not False
+            }
+            self._store_cache(fetched)
+            results_by_key.update(fetched)
+
+        return {
+            name: results_by_key[key]
+            for name, key in keys.items()
+            if key in results_by_key
+        }
+
+    def _load_cache(self, keys: set) -> dict:
+        now = timezone.now()
+        cache_entries = GeocodeCache.objects.filter(
+            name_key__in=keys,
+            city_code=self.__city_code,
+            industry_code=self.__industry_code,
+        ).filter(
+            Q(found=True, fetched_at__gte=now - self.__ttl)
+            | Q(found=False, fetched_at__gte=now - self.__negative_ttl)
+        )
+        return {
+            entry.name_key: (
+                Coordinates(entry.latitude, entry.longitude) if entry.found else None
+            )
+            for entry in cache_entries
+        }
+
+    def _store_cache(self, results: dict) -> None:
+        now = timezone.now()
+        GeocodeCache.objects.bulk_create(
+            [
+                GeocodeCache(
+                    name_key=key,
+                    city_code=self.__city_code,
+                    industry_code=self.__industry_code,
+                    found=coordinates is not None,
+                    latitude=coordinates.latitude if coordinates else None,
+                    longitude=coordinates.longitude if coordinates else None,
+                    fetched_at=now,
+                )
+                for key, coordinates in results.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["name_key", "city_code", "industry_code"],
+            update_fields=["found", "latitude", "longitude", "fetched_at"],
+        )
+
+    def _search(self, name: str):
+        self.__rate_limiter.acquire()
+        try:
+            lists = ScrapeYOLPLocation(
+                name, self.__city_code, self.__industry_code, self.__client
+            ).lists
+        except (RuntimeError, requests.RequestException) as e:
+            logger.warning("%s の緯度経度を取得できませんでした: %s", name, e)
+            return False
+
+        # 検索結果がない場合、 ScrapeYOLPLocation は緯度経度を 0 にして返す
+        if not lists or (lists[0]["latitude"] == 0 and lists[0]["longitude"] == 0):
+            return None
+        return Coordinates(lists[0]["latitude"], lists[0]["longitude"])
+
+    @property
+    def api_calls(self) -> int:
+        return self.__api_calls
@@ -0,0 +1,208 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from django.db import connection
+from django.utils import timezone
+
+from outpatients.query_budget import QueryRecorder
+
+# 段階ごとに数える値
+COUNTERS = ("bytes_downloaded", "rows_parsed", "rows_written")
+
+_local = threading.local()
+
+
+def _get_stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = list()
+    return _local.stack
+
+
+class Stage:
+    """実行レポートの 1 つの段階の計測値
+
+    処理時間、SQL の件数、カウンターの値は、内側の段階の分も含む。
+
+    Attributes:
+        name (str): 段階の名前
+            内側の段階は外側の段階の名前を ``.`` でつないだ名前にする。
+        parent (:obj:`Stage`): 外側の段階
+        seconds (float): 処理時間 (秒)
+        queries (int): 発行した SQL の件数
+        counters (dict): ``COUNTERS`` の名前をキーとするカウンターの値
+
+    """
+
+    def __init__(self, name: str, parent: Optional["Stage"] = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.seconds = 0.0
+        self.queries = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.__attributes = attributes
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            **self.__attributes,
+            "seconds": round(self.seconds, 6),
+            "queries": self.queries,
+            **self.counters,
+        }
+
+
+class RunReport:
+    """段階ごとの処理時間と件数を集めた実行レポート
+
+    ``stage`` で計測を始めたスレッドでは、モジュールの ``stage`` と ``count`` で
+    内側の段階の計測とカウンターの加算ができる。並行して実行する処理は、
+    それぞれのスレッドで ``stage`` を呼び出して計測する。
+
+    Args:
+        name (str): 計測する処理の名前
+
+    """
+
+    def __init__(self, name: str):
+        self.__name = name
+        self.__started_at = timezone.now()
+        self.__started = time.perf_counter()
+        self.__seconds = None
+        self.__stages = list()
+        self.__lock = threading.Lock()
+        self.__attributes = dict()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **attributes):
+        """段階の処理時間、SQL の件数、カウンターの値を計測する
+
+        Args:
+            name (str): 段階の名前
+            **attributes: 段階の計測値と合わせて出力する値
+
+        Yields:
+            stage (:obj:`Stage`): 計測中の段階
+
+        """
+        stack = _get_stack()
+        parent = stack[-1][1] if stack and stack[-1][0] is self else None
+        stage = Stage(
+            parent.name + "." + name if parent else name, parent, **attributes
+        )
+        with self.__lock:
+            self.__stages.append(stage)
+
+        recorder = QueryRecorder()
+        stack.append((self, stage))
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                yield stage
+        finally:
+            stage.seconds = time.perf_counter() - started
+            stage.queries = recorder.count
+            stack.pop()
+
+    def set(self, **attributes) -> None:
+        """実行レポートに出力する値を設定する"""
+        self.__attributes.update(attributes)
+
+    def finish(self) -> None:
+        """実行全体の処理時間を確定する"""
+        self.__seconds = time.perf_counter() - self.__started
+
+    def to_dict(self) -> dict:
+        """実行レポートを JSON に変換できる辞書で返す
+
+        ``totals`` には、最も外側の段階の SQL の件数とカウンターの値の合計を入れる。
+
+        """
+        with self.__lock:
+            stages = list(self.__stages)
+        seconds = self.__seconds
+        if seconds is None:
+            seconds = time.perf_counter() - self.__started
+
+        outermost_stages = [stage for stage in stages if stage.parent is None]
+        totals = {
+            "queries": sum(stage.queries for stage in outermost_stages),
+            **{
+                counter: sum(stage.counters[counter] for stage in outermost_stages)
+                for counter in COUNTERS
+            },
+        }
+        return {
+            "name": self.__name,
+            **self.__attributes,
+            "started_at": self.__started_at.isoformat(),
+            "seconds": round(seconds, 6),
+            "totals": totals,
+            "stages": [stage.to_dict() for stage in stages],
+        }
+
+    def emit(
+        self, logger: logging.Logger, path: Optional[Union[str, Path]] = None
+    ) -> dict:
+        """実行レポートをログに出力し、指定があればファイルに書き込む
+
+        ログには 1 行の JSON を出力し、構造化ログ用に ``extra`` の ``report`` にも
+        辞書を渡す。
+
+        Args:
+            logger (:obj:`logging.Logger`): 出力先のロガー
+            path (str or :obj:`Path`): 書き込む JSON ファイルのパス
+
+        Returns:
+            report (dict): 実行レポートの辞書
+
+        """
+        report = self.to_dict()
+        logger.info(
+            "実行レポート: %s",
+            json.dumps(report, ensure_ascii=False, separators=(",", ":")),
+            extra={"report": report},
+        )
+        if path:
+            Path(path).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+        return report
+
+
+def stage(name: str, **attributes):
+    """実行中の段階の内側の段階を計測するコンテキストマネージャーを返す
+
+    このスレッドで計測中の段階がなければ何もしない。
+
+    Args:
+        name (str): 段階の名前
+        **attributes: 段階の計測値と合わせて出力する値
+
+    Returns:
+        context_manager: 計測中の :obj:`Stage` 、または None を返すコンテキストマネージャー
+
+    """
+    stack = _get_stack()
+    if not stack:
+        return contextlib.nullcontext()
+    report, _ = stack[-1]
+    return report.stage(name, **attributes)
+
+
+def count(**counters) -> None:
+    """このスレッドで計測中の全ての段階のカウンターに加算する
+
+    計測中の段階がなければ何もしない。
+
+    Args:
+        **counters: ``COUNTERS`` の名前をキー、加算する値を値とする引数
+
+    """
+    for _, running_stage in _get_stack():
+        for counter, value in counters.items():
+            running_stage.counters[counter] += value
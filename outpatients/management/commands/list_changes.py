@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from outpatients.models import ChangeLog, IngestRun
+
+
+class Command(BaseCommand):
+    help = "取り込みによる発熱外来と位置情報の変更履歴を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "since",
+            type=int,
+            nargs="?",
+            help="この取り込みより後の変更履歴を表示する (省略すると取り込みの一覧を表示する)",
+        )
+        parser.add_argument(
+            "until",
+            type=int,
+            nargs="?",
+            help="この取り込みまでの変更履歴を表示する (省略すると最新の取り込みまで)",
+        )
+        parser.add_argument(
+            "--target",
+            choices=ChangeLog.Target.values,
+            help="表示する変更履歴の対象",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="取り込みの一覧に表示する件数",
+        )
+
+    def handle(self, *args, **options):
+        if options["since"] is None:
+            self.list_runs(options["limit"])
+            return
+
+        if options["until"] is not None and options["until"] < options["since"]:
+            raise CommandError("until には since 以降の取り込みを指定してください。")
+
+        change_logs = ChangeLog.objects.between(
+            options["since"], options["until"]
+        ).select_related("run")
+        if options["target"]:
+            change_logs = change_logs.filter(target=options["target"])
+
+        count = 0
+        for change_log in change_logs.iterator():
+            count += 1
+            self.stdout.write(
+                "#{} {} {}: {}".format(
+                    change_log.run_id,
+                    change_log.get_target_display(),
+                    change_log.get_action_display(),
+                    change_log.medical_institution_name,
+                )
+            )
+            for field, (old, new) in (change_log.changes or dict()).items():
+                self.stdout.write("    {}: {!r} → {!r}".format(field, old, new))
+        self.stdout.write("変更履歴: {} 件".format(count))
+
+    def list_runs(self, limit: int) -> None:
+        """最近の取り込みの一覧を表示する
+
+        Args:
+            limit (int): 表示する件数
+
+        """
+        for run in IngestRun.objects.order_by("-id")[:limit]:
+            self.stdout.write(
+                "#{} {} - {}".format(
+                    run.id,
+                    timezone.localtime(run.started_at).strftime("%Y-%m-%d %H:%M:%S"),
+                    (
+                        timezone.localtime(run.finished_at).strftime(
+                            "%Y-%m-%d %H:%M:%S"
+                        )
+                        if run.finished_at
+                        else "未完了"
+                    ),
+                )
+            )
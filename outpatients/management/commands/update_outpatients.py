@@ -1,9 +1,18 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.utils import timezone
 
-from outpatients.models import (Location, Outpatient, ScrapeOpendataLocation,
-                                ScrapeOutpatient, ScrapeOutpatientSourceURL)
+from outpatients import instrumentation
+from outpatients.geocoding import Geocoder
+from outpatients.instrumentation import RunReport
+from outpatients.models import (IngestRun, Location, OpeningHours, Outpatient,
+                                ScrapeOpendataLocation, ScrapeOutpatient,
+                                ScrapeOutpatientSourceURL, Scraper,
+                                UpsertResult)
 
 OUTPATIENTS_URL = "https://www.pref.hokkaido.lg.jp/hf/kst/youkou.html"
 HOSPITAL_OPENDATA_URL = (
@@ -15,40 +24,286 @@ CLINIC_OPENDATA_URL = (
     + "02_%E8%A8%BA%E7%99%82%E6%89%80_%E5%8C%97%E6%B5%B7%E9%81%93_%E7%B7%AF%E5%BA%A6%E7%B5%8C%E5%BA%A6%E4%BB%98%E3%81%8D.csv"
 )
 
+logger = logging.getLogger(__name__)
+
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="ファイルが更新されていなくてもデータベースを更新する",
+        )
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=3,
+            help="ファイルを並行してダウンロードするスレッド数",
+        )
+        parser.add_argument(
+            "--geocode",
+            action="store_true",
+            help="位置情報が見つからない発熱外来の緯度経度を YOLP Web API で検索する",
+        )
+        parser.add_argument(
+            "--report-file",
+            help="段階ごとの処理時間と件数の実行レポートを書き込む JSON ファイル",
+        )
+
     def handle(self, *args, **options):
+        # 実行レポートは失敗した場合も、失敗した段階までの計測値を出力する
+        self.report = RunReport("update_outpatients")
+        self.report.set(force=options["force"], geocode=options["geocode"])
+        try:
+            self.ingest(**options)
+        except BaseException as e:
+            self.report.set(status="failed", error=repr(e))
+            raise
+        else:
+            self.report.set(status="succeeded")
+        finally:
+            self.report.finish()
+            self.report.emit(logger, options["report_file"])
+
+    def ingest(self, **options) -> None:
+        """発熱外来一覧と位置情報をダウンロードしてデータベースを更新する"""
         admin_user = User.objects.get(username="admin")
+        # 取り込み元の検証子はダウンロードした時点で保存されるため、前回の取り込みが
+        # 途中で失敗していた場合は、取り込み元が更新されていなくても更新を省略しない
+        last_run = IngestRun.objects.order_by("-id").first()
+        skip_if_not_modified = not options["force"]
+        if skip_if_not_modified and (last_run is None or last_run.finished_at is None):
+            if last_run is not None:
+                self.stdout.write(
+                    "前回の取り込みが完了していないため、更新されていないデータも取り込みます。"
+                )
+            skip_if_not_modified = False
+        run = IngestRun.objects.create()
+        self.report.set(run_id=run.id)
 
-        # 後で比較するため現在の発熱外来の医療機関名の一覧を取得しておく
-        current_medical_institutions_list = (
-            Outpatient.objects.medical_institution_names_list()
-        )
+        # 発熱外来一覧と病院、クリニックの位置情報を並行してダウンロード
+        with self.report.stage("fetch"):
+            (
+                outpatients_scraper,
+                hospital_location_scraper,
+                clinic_location_scraper,
+            ) = self.fetch(skip_if_not_modified, options["max_workers"])
 
         # 発熱外来情報を更新
-        source_url = ScrapeOutpatientSourceURL.get(OUTPATIENTS_URL)
-        outpatients_scraper = ScrapeOutpatient(source_url)
-        new_medical_institutions_list = list()
-        for outpatient in outpatients_scraper.lists:
-            new_medical_institutions_list.append(outpatient["medical_institution_name"])
-            Outpatient.objects.upsert(source=outpatient, user=admin_user)
+        if outpatients_scraper.not_modified and skip_if_not_modified:
+            self.stdout.write("発熱外来一覧が更新されていないため、更新を省略します。")
+        else:
+            with self.report.stage("upsert_outpatients"):
+                upsert_result, deleted_count = self.upsert_outpatients(
+                    outpatients_scraper.lists, admin_user, run
+                )
+            self.write_result("発熱外来", upsert_result, deleted_count)
 
-        # 存在しなくなった発熱外来情報を削除
-        deleted_medical_institutions_list = list(
-            set(current_medical_institutions_list) - set(new_medical_institutions_list)
+        # 病院とクリニックの位置情報を更新
+        # 削除対象を判定するため、片方だけ更新されている場合は両方のデータを抽出する
+        if (
+            hospital_location_scraper.not_modified
+            and clinic_location_scraper.not_modified
+            and skip_if_not_modified
+        ):
+            self.stdout.write("位置情報が更新されていないため、更新を省略します。")
+        else:
+            with self.report.stage("upsert_locations"):
+                locations = (
+                    hospital_location_scraper.lists + clinic_location_scraper.lists
+                )
+                with transaction.atomic():
+                    upsert_result = Location.objects.bulk_upsert(
+                        sources=locations, user=admin_user, run=run
+                    )
+
+                    # 存在しなくなった位置情報を削除
+                    # YOLP Web API で検索した発熱外来の位置情報はオープンデータにないため、
+                    # --geocode を指定しない実行でも発熱外来が残っている限り残す
+                    keep_names = [
+                        location["medical_institution_name"] for location in locations
+                    ] + Location.objects.geocoded_names_list()
+                    deleted_count = Location.objects.delete_missing(
+                        keep_names, run=run
+                    )
+                instrumentation.count(
+                    rows_written=upsert_result.inserted
+                    + upsert_result.updated
+                    + deleted_count
+                )
+            self.write_result("位置情報", upsert_result, deleted_count)
+
+        # 医療機関名と住所が対応する位置情報を発熱外来に紐付ける
+        with self.report.stage("link_locations"):
+            instrumentation.count(rows_written=Outpatient.objects.link_locations())
+            unlinked_names = Outpatient.objects.unlinked_names_list()
+        if unlinked_names and options["geocode"]:
+            with self.report.stage("geocode"):
+                self.geocode(unlinked_names, admin_user, run)
+            with self.report.stage("link_locations"):
+                instrumentation.count(rows_written=Outpatient.objects.link_locations())
+                unlinked_names = Outpatient.objects.unlinked_names_list()
+        fuzzy_linked_list = Outpatient.objects.fuzzy_linked_list()
+        if fuzzy_linked_list:
+            self.stdout.write(
+                "医療機関名の類似度で位置情報を紐付けた発熱外来: {} 件\n{}".format(
+                    len(fuzzy_linked_list),
+                    "\n".join(
+                        "{} → {} ({:.2f})".format(*fuzzy_linked)
+                        for fuzzy_linked in fuzzy_linked_list
+                    ),
+                )
+            )
+        if unlinked_names:
+            self.stdout.write(
+                "位置情報が見つからない発熱外来: {} 件\n{}".format(
+                    len(unlinked_names), "\n".join(unlinked_names)
+                )
+            )
+
+        cache_info = Scraper.normalizer.cache_info()
+        self.stdout.write(
+            "正規化キャッシュ: ヒット {} 件、ミス {} 件、ヒット率 {:.1%}".format(
+                cache_info.hits, cache_info.misses, Scraper.normalizer.hit_rate
+            )
         )
-        with transaction.atomic():
-            for medical_institution in deleted_medical_institutions_list:
-                Outpatient.objects.delete(medical_institution)
 
-        # 病院の位置情報を更新
-        hospital_location_scraper = ScrapeOpendataLocation(HOSPITAL_OPENDATA_URL)
-        with transaction.atomic():
-            for location in hospital_location_scraper.lists:
-                Location.objects.upsert(source=location, user=admin_user)
+        run.finish()
+        self.stdout.write(
+            "取り込み #{}: 変更履歴 {} 件".format(run.id, run.change_logs.count())
+        )
+
+    def upsert_outpatients(
+        self, outpatients: list, user: User, run: IngestRun
+    ) -> tuple:
+        """発熱外来一覧を登録・更新し、なくなった発熱外来を削除する
+
+        Args:
+            outpatients (list of dict): 発熱外来一覧から抽出した発熱外来データのリスト
+            user (:obj:`User`): 発熱外来データの作成者
+            run (:obj:`IngestRun`): 変更履歴を記録する取り込みの実行
+
+        Returns:
+            result (tuple): :obj:`UpsertResult` と削除した件数のタプル
 
-        # クリニックの位置情報を更新
-        clinic_location_scraper = ScrapeOpendataLocation(CLINIC_OPENDATA_URL)
+        """
+        new_medical_institutions_list = [
+            outpatient["medical_institution_name"] for outpatient in outpatients
+        ]
+        started_at = timezone.now()
         with transaction.atomic():
-            for location in clinic_location_scraper.lists:
-                Location.objects.upsert(source=location, user=admin_user)
+            upsert_result = Outpatient.objects.bulk_upsert(
+                sources=outpatients, user=user, run=run
+            )
+
+            # 存在しなくなった発熱外来情報を削除
+            deleted_count = Outpatient.objects.delete_missing(
+                new_medical_institutions_list, run=run
+            )
+            instrumentation.count(
+                rows_written=upsert_result.inserted
+                + upsert_result.updated
+                + deleted_count
+            )
+
+            # 新規登録、更新した発熱外来の診療時間を作り直す
+            with instrumentation.stage("rebuild_opening_hours"):
+                instrumentation.count(
+                    rows_written=OpeningHours.objects.rebuild(
+                        Outpatient.objects.filter(update_at__gte=started_at)
+                    )
+                )
+        return upsert_result, deleted_count
+
+    def geocode(self, names: list, user: User, run: IngestRun) -> None:
+        """YOLP Web API で検索した緯度経度を位置情報として登録する
+
+        Args:
+            names (list of str): 検索する医療機関名のリスト
+            user (:obj:`User`): 位置情報の作成者
+            run (:obj:`IngestRun`): 変更履歴を記録する取り込みの実行
+
+        """
+        geocoder = Geocoder.from_settings()
+        coordinates = geocoder.geocode_many(names)
+        locations = [
+            {
+                "medical_institution_name": name,
+                "latitude": result.latitude,
+                "longitude": result.longitude,
+                "is_geocoded": True,
+            }
+            for name, result in coordinates.items()
+            if result is not None
+        ]
+        upsert_result = Location.objects.bulk_upsert(
+            sources=locations, user=user, run=run
+        )
+        instrumentation.count(
+            rows_written=upsert_result.inserted + upsert_result.updated
+        )
+        self.stdout.write(
+            "緯度経度の検索: {} 件中 {} 件が見つかりました (API 呼び出し {} 件)".format(
+                len(names), len(locations), geocoder.api_calls
+            )
+        )
+        self.write_result("検索した位置情報", upsert_result, 0)
+
+    def write_result(
+        self, label: str, upsert_result: UpsertResult, deleted_count: int
+    ) -> None:
+        self.stdout.write(
+            "{}: 新規 {} 件、更新 {} 件、変更なし {} 件、削除 {} 件".format(
+                label,
+                upsert_result.inserted,
+                upsert_result.updated,
+                upsert_result.unchanged,
+                deleted_count,
+            )
+        )
+
+    def fetch(self, skip_if_not_modified: bool, max_workers: int) -> tuple:
+        """発熱外来一覧と病院、クリニックの位置情報をスレッドプールで並行して取得する
+
+        データベースには触れず、ダウンロードと抽出だけを行う。
+
+        Args:
+            skip_if_not_modified (bool): 真なら更新されていないファイルの抽出を省略する
+            max_workers (int): ダウンロードに使うスレッド数
+
+        Returns:
+            scrapers (tuple): 発熱外来一覧、病院の位置情報、クリニックの位置情報のスクレイパー
+
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            outpatients_future = executor.submit(
+                self._fetch_outpatients, skip_if_not_modified
+            )
+            hospital_location_future = executor.submit(
+                self._fetch_locations, HOSPITAL_OPENDATA_URL, skip_if_not_modified
+            )
+            clinic_location_future = executor.submit(
+                self._fetch_locations, CLINIC_OPENDATA_URL, skip_if_not_modified
+            )
+            return (
+                outpatients_future.result(),
+                hospital_location_future.result(),
+                clinic_location_future.result(),
+            )
+
+    def _fetch_outpatients(self, skip_if_not_modified: bool) -> ScrapeOutpatient:
+        with self.report.stage("fetch_outpatients"):
+            source_url = ScrapeOutpatientSourceURL.get(OUTPATIENTS_URL)
+            return ScrapeOutpatient(
+                source_url, skip_if_not_modified=skip_if_not_modified
+            )
+
+    def _fetch_locations(
+        self, csv_url: str, skip_if_not_modified: bool
+    ) -> ScrapeOpendataLocation:
+        # 更新されていない CSV はもう一方が更新されていた場合に限り後から抽出する
+        with self.report.stage("fetch_locations", url=csv_url):
+            location_scraper = ScrapeOpendataLocation(csv_url)
+            if not (location_scraper.not_modified and skip_if_not_modified):
+                location_scraper.lists
+            return location_scraper
@@ -0,0 +1,168 @@
+import difflib
+import re
+from typing import NamedTuple, Optional
+
+from outpatients.text import fold
+
+# 取り込み元によって付いたり付かなかったりする法人の種類
+CORPORATION_PATTERN = re.compile(
+    "(?:地方)?独立行政法人|(?:一般|公益)?(?:社団|財団)法人|社会医療法人|医療法人"
+    + "|社会福祉法人|(?:社団|財団)"
+)
+# 名称の比較で無視する記号
+SYMBOL_PATTERN = re.compile(r"[・･、。,.\-‐－ー―()（）「」『』\[\]【】]")
+# 旧字体と新字体の対応
+OLD_STYLE_TABLE = str.maketrans(
+    {
+        "醫": "医",
+        "會": "会",
+        "齒": "歯",
+        "齋": "斎",
+        "齊": "斉",
+        "澤": "沢",
+        "邊": "辺",
+        "邉": "辺",
+        "髙": "高",
+        "﨑": "崎",
+        "嵜": "崎",
+        "濱": "浜",
+        "國": "国",
+        "櫻": "桜",
+        "廣": "広",
+        "藥": "薬",
+        "學": "学",
+        "團": "団",
+        "眞": "真",
+        "惠": "恵",
+        "德": "徳",
+        "淸": "清",
+        "龍": "竜",
+        "條": "条",
+        "舘": "館",
+    }
+)
+# 住所の先頭の都道府県と市、または郡と町村
+ADDRESS_PREFIX_PATTERN = re.compile(
+    "^(?:北海道)?(?:[^市]{1,4}市|[^郡]{1,4}郡[^町村]{1,4}[町村])"
+)
+# 住所の先頭から何文字でブロックを分けるか
+BLOCK_LENGTH = 3
+
+
+class Match(NamedTuple):
+    location_id: int
+    confidence: float
+
+
+def name_key(name: Optional[str]) -> str:
+    """医療機関名の表記の揺れをなくした比較用のキーを返す
+
+    ``fold`` の変換に加え、旧字体を新字体に変換し、記号と法人の種類を取り除く。
+
+    Args:
+        name (str): 医療機関名
+
+    Returns:
+        key (str): 比較用のキー
+
+    """
+    key = fold(name).translate(OLD_STYLE_TABLE)
+    key = SYMBOL_PATTERN.sub("", key)
+    return CORPORATION_PATTERN.sub("", key)
+
+
+def block_key(address: Optional[str]) -> str:
+    """住所から都道府県と市町村を除いた先頭の数文字を返す
+
+    同じブロックの位置情報だけを名称の類似度で比較する。
+
+    Args:
+        address (str): 住所
+
+    Returns:
+        key (str): ブロックのキー
+            住所がない場合は空文字列を返す。
+
+    """
+    address = ADDRESS_PREFIX_PATTERN.sub("", fold(address).translate(OLD_STYLE_TABLE))
+    return address[:BLOCK_LENGTH]
+
+
+def similarity(key: str, other_key: str) -> float:
+    """2 つの名称のキーの類似度を 0 から 1 の範囲で返す
+
+    一方が他方に含まれる場合は、法人名などの有無の違いとみなして高い値を返す。
+
+    """
+    if not key or not other_key:
+        return 0.0
+    if key == other_key:
+        return 1.0
+
+    ratio = difflib.SequenceMatcher(None, key, other_key, autojunk=False).ratio()
+    shorter, longer = sorted((key, other_key), key=len)
+    if 4 <= len(shorter) and shorter in longer:
+        ratio = max(ratio, 0.9)
+    return ratio
+
+
+class LocationMatcher:
+    """医療機関名と住所から、対応する位置情報を探す
+
+    名称のキーが一致する位置情報を索引から探し、見つからない場合は住所の先頭が同じ
+    ブロックの中だけで名称の類似度を計算する。
+
+    Args:
+        locations (list of dict): ``id`` 、 ``medical_institution_name`` 、 ``address``
+            を持つ位置情報の辞書のリスト
+        threshold (float): 類似度で紐付ける場合に必要な最小の類似度
+
+    """
+
+    def __init__(self, locations: list, threshold: float = 0.8):
+        self.__threshold = threshold
+        self.__by_name = dict()
+        self.__by_block = dict()
+        for location in locations:
+            key = name_key(location["medical_institution_name"])
+            block = block_key(location.get("address"))
+            self.__by_name.setdefault(key, list()).append((location["id"], block))
+            if block:
+                self.__by_block.setdefault(block, list()).append((location["id"], key))
+
+    def match(self, name: str, address: Optional[str] = None) -> Optional[Match]:
+        """医療機関名と住所に対応する位置情報を返す
+
+        Args:
+            name (str): 医療機関名
+            address (str): 住所
+
+        Returns:
+            match (:obj:`Match`): 位置情報の ID と一致度
+                対応する位置情報がない場合は None を返す。
+
+        """
+        key = name_key(name)
+        if not key:
+            return None
+
+        block = block_key(address)
+        candidates = self.__by_name.get(key)
+        if candidates:
+            # 同じ名称の位置情報が複数ある場合は住所のブロックが同じものを優先する
+            location_id, _ = min(
+                candidates, key=lambda candidate: (candidate[1] != block, candidate[0])
+            )
+            return Match(location_id, 1.0)
+
+        best = None
+        for location_id, location_key in self.__by_block.get(block, list()):
+            score = similarity(key, location_key)
+            if score < self.__threshold:
+                continue
+            if best is None or (score, -location_id) > (
+                best.confidence,
+                -best.location_id,
+            ):
+                best = Match(location_id, score)
+        return best
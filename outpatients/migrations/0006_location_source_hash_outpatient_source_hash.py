@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0005_location"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="source_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=64,
+                verbose_name="取り込み元データのハッシュ値",
+            ),
+        ),
+        migrations.AddField(
+            model_name="outpatient",
+            name="source_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=64,
+                verbose_name="取り込み元データのハッシュ値",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0006_location_source_hash_outpatient_source_hash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(fields=["city", "id"], name="outpatient_city_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(
+                fields=["public_health_care_center", "id"],
+                name="outpatient_center_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(
+                condition=models.Q(("is_pediatrics", True)),
+                fields=["id"],
+                name="outpatient_pediatrics_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(
+                condition=models.Q(("is_target_not_family", True)),
+                fields=["id"],
+                name="outpatient_not_family_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(
+                condition=models.Q(("is_positive_patients", True)),
+                fields=["id"],
+                name="outpatient_positive_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(
+                condition=models.Q(("is_online_for_positive_patients", True)),
+                fields=["id"],
+                name="outpatient_online_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outpatient",
+            index=models.Index(
+                condition=models.Q(("is_home_visitation_for_positive_patients", True)),
+                fields=["id"],
+                name="outpatient_home_visit_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_locations(apps, schema_editor):
+    Location = apps.get_model("outpatients", "Location")
+    Outpatient = apps.get_model("outpatients", "Outpatient")
+    Outpatient.objects.update(
+        location=models.Subquery(
+            Location.objects.filter(
+                medical_institution_name=models.OuterRef("medical_institution_name")
+            )
+            .order_by("id")
+            .values("id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0007_outpatient_outpatient_city_id_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outpatient",
+            name="location",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="outpatients",
+                to="outpatients.location",
+                verbose_name="位置情報",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="location",
+            name="medical_institution_name",
+            field=models.CharField(
+                db_index=True, max_length=256, verbose_name="医療機関名"
+            ),
+        ),
+        migrations.RunPython(link_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from outpatients.schedule import WEEKDAY_FIELDS, parse_weekly_schedule
+
+
+def build_opening_hours(apps, schema_editor):
+    OpeningHours = apps.get_model("outpatients", "OpeningHours")
+    Outpatient = apps.get_model("outpatients", "Outpatient")
+    OpeningHours.objects.bulk_create(
+        [
+            OpeningHours(
+                outpatient_id=values["id"],
+                weekday=weekday,
+                start_minute=start,
+                end_minute=end,
+            )
+            for values in Outpatient.objects.values("id", *WEEKDAY_FIELDS)
+            for weekday, start, end in parse_weekly_schedule(values)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0008_outpatient_location_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OpeningHours",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("weekday", models.PositiveSmallIntegerField(verbose_name="曜日")),
+                (
+                    "start_minute",
+                    models.PositiveSmallIntegerField(verbose_name="開始時刻 (分)"),
+                ),
+                (
+                    "end_minute",
+                    models.PositiveSmallIntegerField(verbose_name="終了時刻 (分)"),
+                ),
+                (
+                    "outpatient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="opening_hours",
+                        to="outpatients.outpatient",
+                        verbose_name="発熱外来",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["weekday", "start_minute", "end_minute"],
+                        name="opening_hours_weekday_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_opening_hours, migrations.RunPython.noop),
+    ]
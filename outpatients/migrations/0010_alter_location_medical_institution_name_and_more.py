@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0010_merge_duplicate_names"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="location",
+            name="medical_institution_name",
+            field=models.CharField(max_length=256, verbose_name="医療機関名"),
+        ),
+        migrations.AddConstraint(
+            model_name="location",
+            constraint=models.UniqueConstraint(
+                fields=("medical_institution_name", "created_by"),
+                name="location_name_created_by_uniq",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="outpatient",
+            constraint=models.UniqueConstraint(
+                fields=("medical_institution_name", "created_by"),
+                name="outpatient_name_created_by_uniq",
+            ),
+        ),
+    ]
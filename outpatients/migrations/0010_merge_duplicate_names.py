@@ -0,0 +1,51 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:18
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """医療機関名と作成者が同じデータのうち、最後に更新したもの以外を削除する
+
+    削除する位置情報に紐付いていた発熱外来は、残す位置情報に紐付け直す。
+
+    """
+    Location = apps.get_model("outpatients", "Location")
+    Outpatient = apps.get_model("outpatients", "Outpatient")
+    for model in (Location, Outpatient):
+        duplicates = (
+            model.objects.values("medical_institution_name", "created_by")
+            .annotate(count=models.Count("id"))
+            .filter(count__gt=1)
+        )
+        for duplicate in duplicates:
+            survivor_id, *duplicate_ids = (
+                model.objects.filter(
+                    medical_institution_name=duplicate["medical_institution_name"],
+                    created_by=duplicate["created_by"],
+                )
+                .order_by("-update_at", "-id")
+                .values_list("id", flat=True)
+            )
+            if model is Location:
+                Outpatient.objects.filter(location_id__in=duplicate_ids).update(
+                    location_id=survivor_id
+                )
+            model.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+    """一意制約を追加する前に、医療機関名と作成者が同じデータをまとめる
+
+    PostgreSQL では外部キーの検証がコミットまで遅延されるため、削除と紐付け直しを
+    一意制約の追加と同じトランザクションで行うと ALTER TABLE が失敗する。
+    マイグレーションごとにトランザクションが分かれるよう、別のマイグレーションにする。
+
+    """
+
+    dependencies = [
+        ("outpatients", "0009_openinghours"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0010_alter_location_medical_institution_name_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodeCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name_key",
+                    models.CharField(max_length=256, verbose_name="正規化した施設名"),
+                ),
+                (
+                    "city_code",
+                    models.CharField(max_length=16, verbose_name="住所コード"),
+                ),
+                (
+                    "industry_code",
+                    models.CharField(max_length=16, verbose_name="業種コード"),
+                ),
+                (
+                    "found",
+                    models.BooleanField(default=False, verbose_name="検索結果の有無"),
+                ),
+                (
+                    "latitude",
+                    models.FloatField(blank=True, null=True, verbose_name="緯度"),
+                ),
+                (
+                    "longitude",
+                    models.FloatField(blank=True, null=True, verbose_name="経度"),
+                ),
+                ("fetched_at", models.DateTimeField(verbose_name="取得日時")),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="geocodecache",
+            constraint=models.UniqueConstraint(
+                fields=("name_key", "city_code", "industry_code"),
+                name="geocode_cache_key_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+
+def set_exact_match_confidence(apps, schema_editor):
+    # これまでの紐付けは医療機関名の完全一致によるもの
+    Outpatient = apps.get_model("outpatients", "Outpatient")
+    Outpatient.objects.filter(location__isnull=False).update(
+        location_match_confidence=1.0
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0011_geocodecache_geocodecache_geocode_cache_key_uniq"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="address",
+            field=models.TextField(blank=True, null=True, verbose_name="住所"),
+        ),
+        migrations.AddField(
+            model_name="outpatient",
+            name="location_match_confidence",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="位置情報の一致度"
+            ),
+        ),
+        migrations.RunPython(set_exact_match_confidence, migrations.RunPython.noop),
+    ]
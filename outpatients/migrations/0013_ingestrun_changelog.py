@@ -0,0 +1,107 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:29
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0012_location_address_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="開始日時"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="終了日時"
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "target",
+                    models.CharField(
+                        choices=[("outpatient", "発熱外来"), ("location", "位置情報")],
+                        max_length=16,
+                        verbose_name="対象",
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("insert", "新規"),
+                            ("update", "更新"),
+                            ("delete", "削除"),
+                        ],
+                        max_length=8,
+                        verbose_name="変更の種類",
+                    ),
+                ),
+                (
+                    "medical_institution_name",
+                    models.CharField(max_length=256, verbose_name="医療機関名"),
+                ),
+                (
+                    "changes",
+                    models.JSONField(
+                        blank=True,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                        verbose_name="変更した項目",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="記録日時"),
+                ),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="change_logs",
+                        to="outpatients.ingestrun",
+                        verbose_name="取り込みの実行",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["target", "medical_institution_name", "run"],
+                        name="change_log_history_idx",
+                    )
+                ],
+            },
+        ),
+    ]
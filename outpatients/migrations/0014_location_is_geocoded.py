@@ -0,0 +1,20 @@
+# Generated by Django 4.2.9 on 2026-10-17 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("outpatients", "0013_ingestrun_changelog"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="is_geocoded",
+            field=models.BooleanField(
+                default=False, verbose_name="YOLP Web API で検索した位置情報"
+            ),
+        ),
+    ]
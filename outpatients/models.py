@@ -1,29 +1,287 @@
+import codecs
 import csv
+import datetime
+import functools
+import hashlib
 import json
 import logging
 import os
 import re
+import threading
 import unicodedata
 import urllib.parse
 from abc import ABCMeta, abstractmethod
 from io import BytesIO, StringIO
-from typing import Union
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional, Union
 
 import numpy as np
+import openpyxl
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from dotenv import load_dotenv
 from markupsafe import escape
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from outpatients import instrumentation
+from outpatients.cache import bump_data_version
+from outpatients.matching import LocationMatcher, block_key
+from outpatients.schedule import MINUTES_PER_DAY, WEEKDAY_FIELDS, parse_weekly_schedule
 
 load_dotenv()
 YOLP_APP_ID = os.environ.get("YOLP_APP_ID")
 
 
-class OutpatientManager(models.Manager):
+class UpsertResult(NamedTuple):
+    """一括登録・更新の結果の件数"""
+
+    inserted: int
+    updated: int
+    unchanged: int
+
+
+class DataVersionQuerySet(models.QuerySet):
+    """まとめて削除した場合もデータのバージョンを更新する QuerySet
+
+    管理画面の一括削除などで ``QuerySet.delete`` を使った場合も、キャッシュした
+    描画結果や検索索引を無効にする。
+
+    """
+
+    def delete(self):
+        deleted_count, deleted_per_model = super().delete()
+        if deleted_count:
+            bump_data_version()
+        return deleted_count, deleted_per_model
+
+
+class BulkManagerMixin:
+    """医療機関名をキーとした一括登録・更新・削除処理
+
+    スクレイピングしたデータを 1 件ずつ ``update_or_create`` するのではなく、
+    既存データのキーとハッシュ値を 1 回のクエリで取得してから、新規分を
+    ``bulk_create`` 、内容が変わったものだけを ``bulk_update`` でまとめて書き込む。
+    削除も 1 回のクエリで行う。
+
+    """
+
+    @staticmethod
+    def fingerprint(source: dict) -> str:
+        """スクレイピングしたデータの辞書から内容のハッシュ値を計算する
+
+        Args:
+            source (dict): スクレイピングしたデータの辞書
+
+        Returns:
+            source_hash (str): 辞書の内容の SHA-256 ハッシュ値
+
+        """
+        serialized = json.dumps(
+            source, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def bulk_upsert(
+        self,
+        sources: list,
+        user: User,
+        batch_size: int = 500,
+        run: Optional["IngestRun"] = None,
+    ) -> UpsertResult:
+        """医療機関名をキーにデータを一括で登録・更新する
+
+        保存済みのハッシュ値と同じ内容のデータは書き込まない。
+
+        Args:
+            sources (list of dict): 登録・更新したいデータの辞書のリスト
+                同じ医療機関名のデータが複数ある場合は後のものを優先する。
+            user (:obj:`User`): データの作成者
+            batch_size (int): 1 回の SQL で書き込むレコード数
+            run (:obj:`IngestRun`): 変更履歴を記録する取り込みの実行
+                指定した場合は新規登録と、値が変わった項目ごとの更新を記録する。
+
+        Returns:
+            result (:obj:`UpsertResult`): 新規登録、更新、変更なしの件数
+
+        """
+        sources_by_name = {
+            source["medical_institution_name"]: source for source in sources
+        }
+        if not sources_by_name:
+            return UpsertResult(0, 0, 0)
+
+        with transaction.atomic(using=self.db):
+            existing_rows = {
+                name: (pk, source_hash)
+                for name, pk, source_hash in self.filter(
+                    created_by=user,
+                    medical_institution_name__in=sources_by_name.keys(),
+                ).values_list("medical_institution_name", "id", "source_hash")
+            }
+            objects = list()
+            inserted_names = list()
+            updated_sources = dict()
+            for name, source in sources_by_name.items():
+                source_hash = self.fingerprint(source)
+                if name in existing_rows:
+                    pk, existing_hash = existing_rows[name]
+                    if source_hash == existing_hash:
+                        continue
+                    updated_sources[pk] = source
+                else:
+                    inserted_names.append(name)
+                objects.append(
+                    self.model(created_by=user, source_hash=source_hash, **source)
+                )
+            inserted = len(inserted_names)
+
+            # 医療機関名と作成者の一意制約を使い、新規登録と更新を 1 回の SQL で行う
+            if objects:
+                update_fields = sorted(
+                    {key for source in sources_by_name.values() for key in source}
+                    - {"medical_institution_name"}
+                ) + ["source_hash", "update_at"]
+                if run is not None:
+                    # 更新前の値と比べるため、書き込む前に変更履歴を作成する
+                    change_logs = [
+                        ChangeLog(
+                            run=run,
+                            target=self.model._meta.model_name,
+                            action=ChangeLog.Action.INSERT,
+                            medical_institution_name=name,
+                        )
+                        for name in inserted_names
+                    ] + self._get_update_change_logs(run, updated_sources)
+                self.bulk_create(
+                    objects,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=["medical_institution_name", "created_by"],
+                    update_fields=update_fields,
+                )
+                if run is not None:
+                    ChangeLog.objects.bulk_create(change_logs, batch_size=batch_size)
+                bump_data_version()
+
+        return UpsertResult(
+            inserted=inserted,
+            updated=len(objects) - inserted,
+            unchanged=len(sources_by_name) - len(objects),
+        )
+
+    def _get_update_change_logs(self, run: "IngestRun", updated_sources: dict) -> list:
+        """更新するデータの、値が変わる項目だけを記録した変更履歴のリストを返す
+
+        Args:
+            run (:obj:`IngestRun`): 取り込みの実行
+            updated_sources (dict): 更新するデータの ID をキー、
+                スクレイピングしたデータの辞書を値とする辞書
+
+        Returns:
+            change_logs (list of :obj:`ChangeLog`): 保存前の変更履歴のリスト
+
+        """
+        if not updated_sources:
+            return list()
+
+        fields = {key for source in updated_sources.values() for key in source}
+        change_logs = list()
+        for current in self.filter(pk__in=updated_sources.keys()).values("id", *fields):
+            source = updated_sources[current["id"]]
+            changes = {
+                field: [current[field], value]
+                for field, value in sorted(source.items())
+                if current[field] != value
+            }
+            # フォーム等で保存したデータはハッシュ値だけが変わる場合がある
+            if changes:
+                change_logs.append(
+                    ChangeLog(
+                        run=run,
+                        target=self.model._meta.model_name,
+                        action=ChangeLog.Action.UPDATE,
+                        medical_institution_name=source["medical_institution_name"],
+                        changes=changes,
+                    )
+                )
+        return change_logs
+
+    def delete_missing(
+        self, keep_names: list, run: Optional["IngestRun"] = None
+    ) -> int:
+        """指定した医療機関名のリストに含まれないデータをまとめて削除する
+
+        Args:
+            keep_names (list of str): 残したい医療機関名のリスト
+            run (:obj:`IngestRun`): 変更履歴を記録する取り込みの実行
+
+        Returns:
+            deleted_count (int): 削除した件数
+
+        """
+        missing = self.exclude(medical_institution_name__in=set(keep_names))
+        if run is not None:
+            ChangeLog.objects.bulk_create(
+                ChangeLog(
+                    run=run,
+                    target=self.model._meta.model_name,
+                    action=ChangeLog.Action.DELETE,
+                    medical_institution_name=name,
+                )
+                for name in missing.order_by("id").values_list(
+                    "medical_institution_name", flat=True
+                )
+            )
+        _, deleted_per_model = missing.delete()
+        return deleted_per_model.get(self.model._meta.label, 0)
+
+
+class OutpatientQuerySet(DataVersionQuerySet):
+    def open_at(self, when: datetime.datetime) -> models.QuerySet:
+        """指定した日時に診療している発熱外来に絞り込む
+
+        取り込み時に作成した ``OpeningHours`` を検索するため、診療時間の文字列は
+        解析しない。前日から日付をまたいで続く診療時間も対象とする。
+
+        Args:
+            when (:obj:`datetime.datetime`): 日時
+                タイムゾーン付きの場合は設定ファイルのタイムゾーンに変換する。
+
+        Returns:
+            queryset (:obj:`QuerySet`): 絞り込んだ発熱外来の QuerySet
+
+        """
+        if timezone.is_aware(when):
+            when = timezone.localtime(when)
+        weekday = when.weekday()
+        minute = when.hour * 60 + when.minute
+        return self.filter(
+            Exists(
+                OpeningHours.objects.filter(outpatient=OuterRef("pk")).filter(
+                    Q(weekday=weekday, start_minute__lte=minute, end_minute__gt=minute)
+                    | Q(
+                        weekday=(weekday - 1) % 7,
+                        start_minute__lte=minute + MINUTES_PER_DAY,
+                        end_minute__gt=minute + MINUTES_PER_DAY,
+                    )
+                )
+            )
+        )
+
+
+class OutpatientManager(
+    BulkManagerMixin, models.Manager.from_queryset(OutpatientQuerySet)
+):
     def upsert(self, source: dict, user: User) -> bool:
         outpatient, created = self.update_or_create(
             medical_institution_name=source["medical_institution_name"],
@@ -33,14 +291,92 @@ class OutpatientManager(models.Manager):
         return created
 
     def delete(self, medical_institution_name: str) -> bool:
-        if self.filter(medical_institution_name=medical_institution_name).exists():
-            self.filter(medical_institution_name=medical_institution_name).delete()
-            return True
-        else:
-            return False
+        deleted_count, _ = self.filter(
+            medical_institution_name=medical_institution_name
+        ).delete()
+        return 0 < deleted_count
 
     def medical_institution_names_list(self) -> list:
-        return list(self.values_list("medical_institution_name", flat=True))
+        return list(
+            self.order_by("id").values_list("medical_institution_name", flat=True)
+        )
+
+    def link_locations(self, threshold: float = 0.8, batch_size: int = 1000) -> int:
+        """医療機関名と住所が対応する位置情報を発熱外来に紐付ける
+
+        ``LocationMatcher`` で位置情報を探し、紐付け先か一致度が変わる発熱外来だけを
+        まとめて更新する。対応する位置情報がない発熱外来は紐付けを解除する。
+
+        Args:
+            threshold (float): 名称の類似度で紐付ける場合に必要な最小の類似度
+            batch_size (int): 1 回の SQL で更新する件数
+
+        Returns:
+            updated_count (int): 紐付けを変更した件数
+
+        """
+        matcher = LocationMatcher(
+            Location.objects.values("id", "medical_institution_name", "address"),
+            threshold=threshold,
+        )
+        changed_outpatients = list()
+        for outpatient in self.values(
+            "id",
+            "medical_institution_name",
+            "address",
+            "location_id",
+            "location_match_confidence",
+        ).iterator():
+            match = matcher.match(
+                outpatient["medical_institution_name"], outpatient["address"]
+            )
+            location_id, confidence = match if match else (None, None)
+            if (location_id, confidence) != (
+                outpatient["location_id"],
+                outpatient["location_match_confidence"],
+            ):
+                changed_outpatients.append(
+                    Outpatient(
+                        id=outpatient["id"],
+                        location_id=location_id,
+                        location_match_confidence=confidence,
+                    )
+                )
+
+        if changed_outpatients:
+            self.bulk_update(
+                changed_outpatients,
+                ["location", "location_match_confidence"],
+                batch_size=batch_size,
+            )
+            bump_data_version()
+        return len(changed_outpatients)
+
+    def fuzzy_linked_list(self) -> list:
+        """医療機関名の類似度で位置情報を紐付けた発熱外来のリストを返す
+
+        Returns:
+            fuzzy_linked_list (list of tuple): 発熱外来の医療機関名、位置情報の医療機関名、
+                一致度のタプルのリスト
+
+        """
+        return list(
+            self.filter(location_match_confidence__lt=1.0)
+            .order_by("id")
+            .values_list(
+                "medical_institution_name",
+                "location__medical_institution_name",
+                "location_match_confidence",
+            )
+        )
+
+    def unlinked_names_list(self) -> list:
+        """位置情報が紐付いていない発熱外来の医療機関名のリストを返す"""
+        return list(
+            self.filter(location__isnull=True)
+            .order_by("id")
+            .values_list("medical_institution_name", flat=True)
+        )
 
 
 class Outpatient(models.Model):
@@ -74,6 +410,20 @@ class Outpatient(models.Model):
         "訪問診療", default=False
     )
     memo = models.TextField("備考", blank=True, null=True)
+    location = models.ForeignKey(
+        "Location",
+        verbose_name="位置情報",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="outpatients",
+    )
+    location_match_confidence = models.FloatField(
+        "位置情報の一致度", blank=True, null=True
+    )
+    source_hash = models.CharField(
+        "取り込み元データのハッシュ値", max_length=64, blank=True, default=""
+    )
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, verbose_name="作成者", on_delete=models.CASCADE
     )
@@ -81,11 +431,147 @@ class Outpatient(models.Model):
     update_at = models.DateTimeField("更新日", auto_now=True)
     objects = OutpatientManager()
 
+    class Meta:
+        constraints = [
+            # 取り込み時に医療機関名と作成者で検索、登録するための一意制約と索引
+            models.UniqueConstraint(
+                fields=["medical_institution_name", "created_by"],
+                name="outpatient_name_created_by_uniq",
+            ),
+        ]
+        indexes = [
+            # 発熱外来一覧の絞り込みとページ分割で使う索引
+            # 真偽値の条件は該当する行だけの部分索引を ID 順に読めるようにする
+            models.Index(fields=["city", "id"], name="outpatient_city_id_idx"),
+            models.Index(
+                fields=["public_health_care_center", "id"],
+                name="outpatient_center_id_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_pediatrics=True),
+                name="outpatient_pediatrics_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_target_not_family=True),
+                name="outpatient_not_family_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_positive_patients=True),
+                name="outpatient_positive_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_online_for_positive_patients=True),
+                name="outpatient_online_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_home_visitation_for_positive_patients=True),
+                name="outpatient_home_visit_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.medical_institution_name
 
+    def save(self, *args, **kwargs):
+        # フォーム等で個別に保存した内容は取り込み元データと一致しないため、
+        # 次回の取り込みで上書きされるようハッシュ値を消去する
+        self.source_hash = ""
+        # 全ての位置情報を読み込まないよう、医療機関名が同じか住所のブロックを含む
+        # 位置情報だけを候補にする。表記の揺れのある別のブロックの位置情報は、
+        # 取り込み時の ``link_locations`` で紐付ける
+        candidates = Q(medical_institution_name=self.medical_institution_name)
+        block = block_key(self.address)
+        if block:
+            candidates |= Q(address__contains=block)
+        match = LocationMatcher(
+            Location.objects.filter(candidates).values(
+                "id", "medical_institution_name", "address"
+            )
+        ).match(self.medical_institution_name, self.address)
+        self.location_id, self.location_match_confidence = (
+            match if match else (None, None)
+        )
+        super().save(*args, **kwargs)
+        OpeningHours.objects.rebuild(Outpatient.objects.filter(pk=self.pk))
+        bump_data_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_data_version()
+        return result
+
+
+class OpeningHoursManager(models.Manager):
+    def rebuild(self, outpatients: models.QuerySet, batch_size: int = 1000) -> int:
+        """発熱外来の曜日ごとの診療時間の文字列を解析し、診療時間を作り直す
+
+        Args:
+            outpatients (:obj:`QuerySet`): 診療時間を作り直す発熱外来の QuerySet
+            batch_size (int): 1 回の SQL で書き込むレコード数
+
+        Returns:
+            created_count (int): 作成した診療時間の件数
+
+        """
+        opening_hours = list()
+        outpatient_ids = list()
+        for values in outpatients.values("id", *WEEKDAY_FIELDS).iterator():
+            outpatient_ids.append(values["id"])
+            opening_hours.extend(
+                self.model(
+                    outpatient_id=values["id"],
+                    weekday=weekday,
+                    start_minute=start,
+                    end_minute=end,
+                )
+                for weekday, start, end in parse_weekly_schedule(values)
+            )
+
+        with transaction.atomic(using=self.db):
+            for i in range(0, len(outpatient_ids), batch_size):
+                self.filter(
+                    outpatient_id__in=outpatient_ids[i : i + batch_size]
+                ).delete()
+            self.bulk_create(opening_hours, batch_size=batch_size)
+        return len(opening_hours)
+
+
+class OpeningHours(models.Model):
+    """発熱外来の曜日ごとの診療時間
+
+    ``Outpatient`` の ``mon`` から ``sun`` の文字列を解析した、その日の 0 時からの分単位の
+    区間。日付をまたぐ区間は終了時刻が 1440 分を超える。
 
-class LocationManager(models.Manager):
+    """
+
+    outpatient = models.ForeignKey(
+        Outpatient,
+        verbose_name="発熱外来",
+        on_delete=models.CASCADE,
+        related_name="opening_hours",
+    )
+    weekday = models.PositiveSmallIntegerField("曜日")
+    start_minute = models.PositiveSmallIntegerField("開始時刻 (分)")
+    end_minute = models.PositiveSmallIntegerField("終了時刻 (分)")
+    objects = OpeningHoursManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["weekday", "start_minute", "end_minute"],
+                name="opening_hours_weekday_idx",
+            ),
+        ]
+
+
+class LocationManager(
+    BulkManagerMixin, models.Manager.from_queryset(DataVersionQuerySet)
+):
     def upsert(self, source: dict, user: User) -> bool:
         outpatient, created = self.update_or_create(
             medical_institution_name=source["medical_institution_name"],
@@ -95,17 +581,35 @@ class LocationManager(models.Manager):
         return created
 
     def delete(self, medical_institution_name: str) -> bool:
-        if self.filter(medical_institution_name=medical_institution_name).exists():
-            self.filter(medical_institution_name=medical_institution_name).delete()
-            return True
-        else:
-            return False
+        deleted_count, _ = self.filter(
+            medical_institution_name=medical_institution_name
+        ).delete()
+        return 0 < deleted_count
+
+    def geocoded_names_list(self) -> list:
+        """発熱外来が残っている、YOLP Web API で検索した位置情報の医療機関名のリストを返す"""
+        return list(
+            self.filter(
+                is_geocoded=True,
+                medical_institution_name__in=Outpatient.objects.values(
+                    "medical_institution_name"
+                ),
+            )
+            .order_by("id")
+            .values_list("medical_institution_name", flat=True)
+        )
 
 
 class Location(models.Model):
     medical_institution_name = models.CharField("医療機関名", max_length=256)
+    address = models.TextField("住所", blank=True, null=True)
     latitude = models.FloatField("緯度", default=0)
     longitude = models.FloatField("経度", default=0)
+    # オープンデータにないため、オープンデータの取り込みでは削除しない
+    is_geocoded = models.BooleanField("YOLP Web API で検索した位置情報", default=False)
+    source_hash = models.CharField(
+        "取り込み元データのハッシュ値", max_length=64, blank=True, default=""
+    )
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, verbose_name="作成者", on_delete=models.CASCADE
     )
@@ -113,58 +617,651 @@ class Location(models.Model):
     update_at = models.DateTimeField("更新日", auto_now=True)
     objects = LocationManager()
 
+    class Meta:
+        constraints = [
+            # 取り込み時と発熱外来への紐付け時に医療機関名で検索するための一意制約と索引
+            models.UniqueConstraint(
+                fields=["medical_institution_name", "created_by"],
+                name="location_name_created_by_uniq",
+            ),
+        ]
+
     def __str__(self):
         return self.medical_institution_name
 
+    def save(self, *args, **kwargs):
+        # フォーム等で個別に保存した内容は取り込み元データと一致しないため、
+        # 次回の取り込みで上書きされるようハッシュ値を消去する
+        self.source_hash = ""
+        super().save(*args, **kwargs)
+        bump_data_version()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_data_version()
+        return result
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def bump_data_version_on_user_delete(sender, **kwargs):
+    # 利用者の削除に伴う発熱外来と位置情報の削除は QuerySet.delete を通らないため、
+    # 利用者を削除した時点でデータのバージョンを更新する
+    bump_data_version()
+
+
+class GeocodeCache(models.Model):
+    """YOLP Web API で施設名から検索した緯度経度のキャッシュ
+
+    検索結果がなかった場合も ``found`` を偽にして保存し、同じ検索を繰り返さない。
+
+    """
+
+    name_key = models.CharField("正規化した施設名", max_length=256)
+    city_code = models.CharField("住所コード", max_length=16)
+    industry_code = models.CharField("業種コード", max_length=16)
+    found = models.BooleanField("検索結果の有無", default=False)
+    latitude = models.FloatField("緯度", blank=True, null=True)
+    longitude = models.FloatField("経度", blank=True, null=True)
+    fetched_at = models.DateTimeField("取得日時")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name_key", "city_code", "industry_code"],
+                name="geocode_cache_key_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name_key
+
+
+class IngestRun(models.Model):
+    """``update_outpatients`` コマンドの 1 回の実行
+
+    終了日時が空の実行は、実行中か途中で失敗したもの。
+
+    """
+
+    started_at = models.DateTimeField("開始日時", auto_now_add=True)
+    finished_at = models.DateTimeField("終了日時", blank=True, null=True)
+
+    def __str__(self):
+        return "#{} {}".format(self.id, timezone.localtime(self.started_at))
+
+    def finish(self) -> None:
+        """終了日時を記録する"""
+        self.finished_at = timezone.now()
+        self.save(update_fields=["finished_at"])
+
+
+class ChangeLogQuerySet(models.QuerySet):
+    def between(
+        self,
+        since: Union[int, IngestRun],
+        until: Optional[Union[int, IngestRun]] = None,
+    ) -> models.QuerySet:
+        """2 つの実行の間に記録した変更履歴に絞り込む
+
+        Args:
+            since (int or :obj:`IngestRun`): この実行より後の変更履歴を返す
+            until (int or :obj:`IngestRun`): この実行までの変更履歴を返す
+                省略した場合は最新の実行までの変更履歴を返す。
+
+        Returns:
+            queryset (:obj:`QuerySet`): 実行、記録の順に並べた変更履歴の QuerySet
+
+        """
+        queryset = self.filter(run__gt=since)
+        if until is not None:
+            queryset = queryset.filter(run__lte=until)
+        return queryset.order_by("run", "id")
+
+    def history(self, target: str, medical_institution_name: str) -> models.QuerySet:
+        """1 件の発熱外来または位置情報の変更履歴に絞り込む
+
+        Args:
+            target (str): ``outpatient`` または ``location``
+            medical_institution_name (str): 医療機関名
+
+        Returns:
+            queryset (:obj:`QuerySet`): 実行、記録の順に並べた変更履歴の QuerySet
+
+        """
+        return self.filter(
+            target=target, medical_institution_name=medical_institution_name
+        ).order_by("run", "id")
+
+
+class ChangeLog(models.Model):
+    """取り込みによる発熱外来と位置情報の変更履歴
+
+    更新の場合は、値が変わった項目だけを ``{項目名: [変更前, 変更後]}`` の形式で
+    ``changes`` に記録する。新規登録と削除は医療機関名だけを記録する。
+
+    """
+
+    class Target(models.TextChoices):
+        OUTPATIENT = "outpatient", "発熱外来"
+        LOCATION = "location", "位置情報"
+
+    class Action(models.TextChoices):
+        INSERT = "insert", "新規"
+        UPDATE = "update", "更新"
+        DELETE = "delete", "削除"
+
+    run = models.ForeignKey(
+        IngestRun,
+        verbose_name="取り込みの実行",
+        on_delete=models.CASCADE,
+        related_name="change_logs",
+    )
+    target = models.CharField("対象", max_length=16, choices=Target.choices)
+    action = models.CharField("変更の種類", max_length=8, choices=Action.choices)
+    medical_institution_name = models.CharField("医療機関名", max_length=256)
+    changes = models.JSONField(
+        "変更した項目", blank=True, null=True, encoder=DjangoJSONEncoder
+    )
+    created_at = models.DateTimeField("記録日時", auto_now_add=True)
+    objects = ChangeLogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # 1 件の発熱外来または位置情報の変更履歴を検索するための索引
+            models.Index(
+                fields=["target", "medical_institution_name", "run"],
+                name="change_log_history_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return "{} {} {}".format(
+            self.get_target_display(),
+            self.get_action_display(),
+            self.medical_institution_name,
+        )
+
+
+class DownloadCache:
+    """ダウンロードしたファイルのディスクキャッシュ
+
+    レスポンスの本文を ``ETag`` 、 ``Last-Modified`` ヘッダーと合わせて保存し、
+    次回のダウンロード時に条件付きリクエストのヘッダーを組み立てる。
+    キャッシュは URL の SHA-256 ハッシュをファイル名として保存する。
+    URL にはアプリケーション ID などの秘密情報が含まれる場合があるため、
+    メタデータには URL を保存しない。
+
+    Attributes:
+        cache_dir (:obj:`Path`): キャッシュを保存するディレクトリ
+
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        """
+        Args:
+            cache_dir (str or :obj:`Path`): キャッシュを保存するディレクトリ
+
+        """
+        self.__cache_dir = Path(cache_dir)
+
+    @property
+    def cache_dir(self) -> Path:
+        return self.__cache_dir
+
+    @classmethod
+    def from_settings(cls) -> Optional["DownloadCache"]:
+        """設定ファイルの ``DOWNLOAD_CACHE_DIR`` からキャッシュを生成する
+
+        Returns:
+            download_cache (:obj:`DownloadCache`): ダウンロードキャッシュ
+                ``DOWNLOAD_CACHE_DIR`` が設定されていない場合は None を返す。
+
+        """
+        cache_dir = getattr(settings, "DOWNLOAD_CACHE_DIR", None)
+        if cache_dir:
+            return cls(cache_dir)
+        else:
+            return None
+
+    def conditional_headers(self, url: str) -> dict:
+        """キャッシュ済みの検証子から条件付きリクエストのヘッダーを返す
+
+        Args:
+            url (str): ダウンロードするファイルの URL
+
+        Returns:
+            headers (dict): ``If-None-Match`` 、 ``If-Modified-Since`` ヘッダーの辞書
+                キャッシュがない場合は空の辞書を返す。
+
+        """
+        meta = self._load_meta(url)
+        if meta is None or not self._body_path(url).exists():
+            return dict()
+
+        headers = dict()
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, url: str) -> Optional[bytes]:
+        """キャッシュ済みのレスポンス本文を返す
+
+        Args:
+            url (str): ダウンロードしたファイルの URL
+
+        Returns:
+            content (bytes): キャッシュ済みのレスポンス本文
+                キャッシュがない場合は None を返す。
+
+        """
+        try:
+            return self._body_path(url).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def iter_load(self, url: str, chunk_size: int) -> Optional[Iterator[bytes]]:
+        """キャッシュ済みのレスポンス本文を指定したサイズずつ返すイテレーターを返す
+
+        Args:
+            url (str): ダウンロードしたファイルの URL
+            chunk_size (int): 1 回に読み込むバイト数
+
+        Returns:
+            chunks (iterator of bytes): キャッシュ済みのレスポンス本文のイテレーター
+                キャッシュがない場合は None を返す。
+
+        """
+        body_path = self._body_path(url)
+        if not body_path.exists():
+            return None
+
+        def iter_chunks():
+            with body_path.open("rb") as body_file:
+                while chunk := body_file.read(chunk_size):
+                    yield chunk
+
+        return iter_chunks()
+
+    def iter_store(
+        self, url: str, chunks: Iterator[bytes], headers: dict
+    ) -> Iterator[bytes]:
+        """レスポンス本文を読み込みながらキャッシュに書き込む
+
+        本文を最後まで読み込んだ時点でキャッシュを置き換える。
+        途中で読み込みをやめた場合、キャッシュは更新しない。
+
+        Args:
+            url (str): ダウンロードしたファイルの URL
+            chunks (iterator of bytes): レスポンス本文のイテレーター
+            headers (dict): レスポンスヘッダー
+
+        Yields:
+            chunk (bytes): レスポンス本文の断片
+
+        """
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            yield from chunks
+            return
+
+        self.__cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path = self._body_path(url)
+        tmp_path = body_path.with_name(body_path.name + ".tmp")
+        completed = False
+        try:
+            with tmp_path.open("wb") as tmp_file:
+                for chunk in chunks:
+                    tmp_file.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                os.replace(tmp_path, body_path)
+                meta = {"etag": etag, "last_modified": last_modified}
+                self._write_atomic(
+                    self._meta_path(url),
+                    json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+                )
+            else:
+                tmp_path.unlink(missing_ok=True)
+
+    def store(self, url: str, content: bytes, headers: dict) -> bool:
+        """レスポンス本文と検証子をキャッシュに保存する
+
+        Args:
+            url (str): ダウンロードしたファイルの URL
+            content (bytes): レスポンス本文
+            headers (dict): レスポンスヘッダー
+
+        Returns:
+            result (bool): 検証子があり、キャッシュに保存したら真を返す
+
+        """
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return False
+
+        self.__cache_dir.mkdir(parents=True, exist_ok=True)
+        meta = {"etag": etag, "last_modified": last_modified}
+        self._write_atomic(self._body_path(url), content)
+        self._write_atomic(
+            self._meta_path(url),
+            json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+        )
+        return True
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _body_path(self, url: str) -> Path:
+        return self.__cache_dir / (self._key(url) + ".body")
+
+    def _meta_path(self, url: str) -> Path:
+        return self.__cache_dir / (self._key(url) + ".json")
+
+    def _load_meta(self, url: str) -> Optional[dict]:
+        try:
+            return json.loads(self._meta_path(url).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_atomic(self, path: Path, content: bytes) -> None:
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+
+
+class HTTPClient:
+    """Downloader が共有する HTTP クライアント
+
+    ``requests.Session`` のコネクションプールを使い回し、タイムアウト、
+    バックオフ付きのリトライ、ホストごとの同時接続数の上限を設定する。
+
+    Attributes:
+        session (:obj:`requests.Session`): コネクションプールを持つセッション
+        timeout (tuple of float): 接続タイムアウトと読み込みタイムアウトの秒数
+
+    """
+
+    __default = None
+    __default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        timeout: tuple = (10, 60),
+        retries: int = 3,
+        backoff_factor: float = 1.0,
+        pool_maxsize: int = 10,
+        max_connections_per_host: int = 2,
+        user_agent: str = "Mozilla/5.0",
+    ):
+        """
+        Args:
+            timeout (tuple of float): 接続タイムアウトと読み込みタイムアウトの秒数
+            retries (int): 接続エラーやサーバーエラー時にリトライする最大回数
+            backoff_factor (float): リトライ間隔の指数バックオフの係数
+            pool_maxsize (int): ホストごとに保持するコネクションの最大数
+            max_connections_per_host (int): ホストごとの同時リクエスト数の上限
+            user_agent (str): リクエストヘッダーの User-Agent
+
+        """
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.__session = requests.Session()
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+        self.__session.headers["User-Agent"] = user_agent
+        self.__timeout = tuple(timeout)
+        self.__max_connections_per_host = max_connections_per_host
+        self.__host_semaphores = dict()
+        self.__host_semaphores_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        return self.__session
+
+    @property
+    def timeout(self) -> tuple:
+        return self.__timeout
+
+    @classmethod
+    def get_default(cls) -> "HTTPClient":
+        """設定ファイルの ``DOWNLOADER`` から生成した共有クライアントを返す
+
+        Returns:
+            client (:obj:`HTTPClient`): プロセス内で共有する HTTP クライアント
+
+        """
+        with cls.__default_lock:
+            if cls.__default is None:
+                options = getattr(settings, "DOWNLOADER", dict())
+                cls.__default = cls(
+                    **{key.lower(): value for key, value in options.items()}
+                )
+            return cls.__default
+
+    @classmethod
+    def reset_default(cls) -> None:
+        """共有クライアントを破棄し、次回の取得時に設定から作り直す"""
+        with cls.__default_lock:
+            if cls.__default is not None:
+                cls.__default.session.close()
+            cls.__default = None
+
+    def get(
+        self, url: str, headers: Optional[dict] = None, stream: bool = False
+    ) -> requests.Response:
+        """ホストごとの同時接続数の上限を守って GET リクエストを送信する
+
+        Args:
+            url (str): リクエストする URL
+            headers (dict): 追加のリクエストヘッダー
+            stream (bool): 真ならレスポンス本文を読み込まずに返す
+                同時接続数の上限はレスポンスヘッダーを受信するまでの間だけ適用する。
+
+        Returns:
+            response (:obj:`requests.Response`): レスポンス
+
+        """
+        with self._get_host_semaphore(url):
+            if stream:
+                return self.__session.get(
+                    url, headers=headers, timeout=self.__timeout, stream=True
+                )
+            return self.__session.get(url, headers=headers, timeout=self.__timeout)
+
+    def _get_host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urllib.parse.urlsplit(url).netloc
+        with self.__host_semaphores_lock:
+            if host not in self.__host_semaphores:
+                self.__host_semaphores[host] = threading.BoundedSemaphore(
+                    self.__max_connections_per_host
+                )
+            return self.__host_semaphores[host]
+
 
 class Downloader(metaclass=ABCMeta):
-    def __init__(self):
-        @property
-        @abstractmethod
-        def content(self):
-            pass
+    """Web サイトからファイルをダウンロードするクラスの基底クラス
+
+    ダウンロードには共有の :obj:`HTTPClient` を使う。
+    ``DOWNLOAD_CACHE_DIR`` が設定されていれば、前回のダウンロード結果を
+    ディスクにキャッシュし、条件付きリクエストで更新の有無を確認する。
+
+    Attributes:
+        not_modified (bool): ファイルが前回のダウンロードから更新されていなければ真
+
+    """
+
+    def __init__(self, client: Optional[HTTPClient] = None, use_cache: bool = True):
+        """
+        Args:
+            client (:obj:`HTTPClient`): ダウンロードに使う HTTP クライアント
+                指定しない場合は共有クライアントを使う。
+            use_cache (bool): 偽の場合はディスクキャッシュを使わない
+
+        """
+        self.__client = client if client else HTTPClient.get_default()
+        self.__use_cache = use_cache
+        self.__not_modified = False
+
+    @property
+    @abstractmethod
+    def content(self):
+        pass
+
+    @property
+    def not_modified(self) -> bool:
+        return self.__not_modified
+
+    def _download(self, url: str, headers: Optional[dict] = None) -> bytes:
+        """条件付きリクエストでファイルをダウンロードし、レスポンス本文を返す
+
+        Args:
+            url (str): ダウンロードするファイルの URL
+            headers (dict): リクエストヘッダー
+
+        Returns:
+            content (bytes): レスポンス本文
+                サーバーが 304 Not Modified を返した場合はキャッシュ済みの本文を返す。
+
+        """
+        logger = logging.getLogger(__name__)
+        download_cache = DownloadCache.from_settings() if self.__use_cache else None
+        request_headers = dict(headers) if headers else dict()
+        if download_cache:
+            request_headers.update(download_cache.conditional_headers(url))
+
+        with instrumentation.stage("download", url=url):
+            response = self.__client.get(url, headers=request_headers)
+            response.raise_for_status()
+
+            if response.status_code == 304 and download_cache:
+                content = download_cache.load(url)
+                if content is not None:
+                    self.__not_modified = True
+                    logger.info(
+                        "ファイルが更新されていないため、キャッシュを使用します。"
+                    )
+                    return content
+
+            instrumentation.count(bytes_downloaded=len(response.content))
+            if download_cache:
+                download_cache.store(url, response.content, response.headers)
+            return response.content
+
+    def _stream(
+        self, url: str, headers: Optional[dict] = None, chunk_size: int = 65536
+    ) -> Iterator[bytes]:
+        """条件付きリクエストを送信し、レスポンス本文を少しずつ返すイテレーターを返す
+
+        リクエストはこのメソッドの呼び出し時に送信するため、戻り値を読み込む前に
+        ``not_modified`` を参照できる。
+
+        Args:
+            url (str): ダウンロードするファイルの URL
+            headers (dict): リクエストヘッダー
+            chunk_size (int): 1 回に読み込むバイト数
+
+        Returns:
+            chunks (iterator of bytes): レスポンス本文のイテレーター
+                サーバーが 304 Not Modified を返した場合はキャッシュ済みの本文を返す。
+
+        """
+        logger = logging.getLogger(__name__)
+        download_cache = DownloadCache.from_settings() if self.__use_cache else None
+        request_headers = dict(headers) if headers else dict()
+        if download_cache:
+            request_headers.update(download_cache.conditional_headers(url))
+
+        response = self.__client.get(url, headers=request_headers, stream=True)
+        response.raise_for_status()
+        if response.status_code == 304 and download_cache:
+            chunks = download_cache.iter_load(url, chunk_size)
+            if chunks is not None:
+                response.close()
+                self.__not_modified = True
+                logger.info("ファイルが更新されていないため、キャッシュを使用します。")
+                return chunks
+
+        chunks = self._count_bytes(response.iter_content(chunk_size=chunk_size))
+        if download_cache:
+            return download_cache.iter_store(url, chunks, response.headers)
+        return chunks
+
+    @staticmethod
+    def _count_bytes(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        # ストリーミングでは読み込んだ時点の段階にダウンロードしたバイト数を加算する
+        for chunk in chunks:
+            instrumentation.count(bytes_downloaded=len(chunk))
+            yield chunk
 
 
 class DownloadCSV(Downloader):
     """CSV ファイルの StringIO データの取得
 
     Web サイトから CSV ファイルをダウンロードして内容を StringIO で返す。
+    ``iter_lines`` を使うと、ファイル全体をメモリに読み込まずに 1 行ずつ
+    デコードしながら読み込める。
 
     Attributes:
         content (:obj:`StringIO`): ダウンロードした CSV ファイルの StringIO データ
 
     """
 
-    def __init__(self, url: str, encoding: str = "utf-8"):
+    def __init__(
+        self, url: str, encoding: str = "utf-8", client: Optional[HTTPClient] = None
+    ):
         """
         Args:
             url (str): Web サイトの CSV ファイルの URL
             encoding (str): CSV ファイルの文字コード
+            client (:obj:`HTTPClient`): ダウンロードに使う HTTP クライアント
 
         """
-        Downloader.__init__(self)
-        self.__content = self._get_csv_content(url, encoding=encoding)
+        Downloader.__init__(self, client)
+        self.__encoding = encoding
+        self.__chunks = self._stream(url)
+        self.__content = None
 
     @property
     def content(self) -> StringIO:
+        if self.__content is None:
+            self.__content = StringIO("".join(self.iter_lines()))
         return self.__content
 
-    def _get_csv_content(self, url: str, encoding: str) -> StringIO:
-        """Web サイトから CSV ファイルの StringIO データを取得
+    def iter_lines(self) -> Iterator[str]:
+        """CSV ファイルをダウンロードしながら 1 行ずつデコードして返す
 
-        Args:
-            url (str): CSV ファイルの URL
-            encoding (str): CSV ファイルの文字コード
+        レスポンス本文は 1 回しか読み込めないため、 ``content`` と併用する場合は
+        先に ``content`` を参照すること。
 
-        Returns:
-            content (:obj:`StringIO`): ダウンロードした CSV ファイルの StringIO データ
+        Yields:
+            line (str): 改行文字を含む CSV ファイルの 1 行
 
         """
         logger = logging.getLogger(__name__)
-        response = requests.get(url)
-        csv_io = StringIO(response.content.decode(encoding))
+        decoder = codecs.getincrementaldecoder(self.__encoding)()
+        buffer = ""
+        for chunk in self.__chunks:
+            buffer += decoder.decode(chunk)
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                yield line + "\n"
+
+        buffer += decoder.decode(b"", final=True)
+        if buffer:
+            yield buffer
+
         logger.info("CSV ファイルのダウンロードに成功しました。")
-        return csv_io
 
 
 class DownloadJSON(Downloader):
@@ -177,13 +1274,17 @@ class DownloadJSON(Downloader):
 
     """
 
-    def __init__(self, url: str):
+    def __init__(
+        self, url: str, client: Optional[HTTPClient] = None, use_cache: bool = True
+    ):
         """
         Args:
             url (str): Web サイトの JSON ファイルの URL
+            client (:obj:`HTTPClient`): ダウンロードに使う HTTP クライアント
+            use_cache (bool): 偽の場合はディスクキャッシュを使わない
 
         """
-        Downloader.__init__(self)
+        Downloader.__init__(self, client, use_cache)
         self.__content = self._get_json_content(url)
 
     @property
@@ -201,9 +1302,9 @@ class DownloadJSON(Downloader):
 
         """
         logger = logging.getLogger(__name__)
-        response = requests.get(url)
+        content = self._download(url)
         logger.info("JSON ファイルのダウンロードに成功しました。")
-        return response.content
+        return content
 
 
 class DownloadExcel(Downloader):
@@ -217,13 +1318,14 @@ class DownloadExcel(Downloader):
 
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, client: Optional[HTTPClient] = None):
         """
         Args:
             url (str): Web サイトの Excel ファイルの URL
+            client (:obj:`HTTPClient`): ダウンロードに使う HTTP クライアント
 
         """
-        Downloader.__init__(self)
+        Downloader.__init__(self, client)
         self.__content = self._get_excel_content(url)
 
     @property
@@ -241,9 +1343,9 @@ class DownloadExcel(Downloader):
 
         """
         logger = logging.getLogger(__name__)
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+        content = self._download(url)
         logger.info("Excel ファイルのダウンロードに成功しました。")
-        return BytesIO(response.content)
+        return BytesIO(content)
 
 
 class DownloadHTML(Downloader):
@@ -257,13 +1359,14 @@ class DownloadHTML(Downloader):
 
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, client: Optional[HTTPClient] = None):
         """
         Args:
             url (str): WebサイトのHTMLファイルのURL
+            client (:obj:`HTTPClient`): ダウンロードに使うHTTPクライアント
 
         """
-        Downloader.__init__(self)
+        Downloader.__init__(self, client)
         self.__url = url
         self.__content = self._get_html_content(self.__url)
 
@@ -286,13 +1389,41 @@ class DownloadHTML(Downloader):
 
         """
         logger = logging.getLogger(__name__)
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        response = requests.get(url)
+        content = self._download(url)
         logger.info("HTMLファイルのダウンロードに成功しました。")
-        return response.content
+        return content
 
 
-class Scraper:
+class Normalizer:
+    """スクレイピングした文字列の正規化処理
+
+    同じ文字列 (「○」や時刻、市町村名など) が何度も現れるため、正規化の結果を
+    上限付きの LRU キャッシュに保存して再利用する。
+
+    Attributes:
+        hit_rate (float): キャッシュのヒット率
+
+    """
+
+    MULTIPLE_SPACES_PATTERN = re.compile("( +)")
+    WHITESPACE_TABLE = str.maketrans({"　": " ", "\r": " ", "\n": " "})
+
+    def __init__(self, maxsize: int = 16384):
+        """
+        Args:
+            maxsize (int): 正規化の結果をキャッシュする文字列の最大数
+
+        """
+        self.__normalize = functools.lru_cache(maxsize=maxsize)(self._normalize)
+
+    @property
+    def hit_rate(self) -> float:
+        cache_info = self.cache_info()
+        total = cache_info.hits + cache_info.misses
+        if total == 0:
+            return 0.0
+        return cache_info.hits / total
+
     def normalize(self, text: str) -> str:
         """文字列から余計な空白等を取り除き、全角数字等を正規化して返す
 
@@ -306,12 +1437,9 @@ class Scraper:
         if not isinstance(text, str):
             return ""
 
-        if text == "0":
-            return ""
+        return self.__normalize(text)
 
-        return unicodedata.normalize("NFKC", self._format_string(text))
-
-    def _format_string(self, text: str) -> str:
+    def format_string(self, text: str) -> str:
         """改行を半角スペースに置換し、文字列から連続する半角スペースを除去する
 
         Args:
@@ -322,14 +1450,78 @@ class Scraper:
 
         """
         if isinstance(text, str):
-            return re.sub(
-                "( +)",
-                " ",
-                text.replace("　", " ").replace("\r", " ").replace("\n", " ").strip(),
+            return self.MULTIPLE_SPACES_PATTERN.sub(
+                " ", text.translate(self.WHITESPACE_TABLE).strip()
             )
         else:
             return ""
 
+    def cache_info(self) -> functools._CacheInfo:
+        """正規化キャッシュの統計情報を返す
+
+        Returns:
+            cache_info (:obj:`functools._CacheInfo`): ヒット数、ミス数、最大数、現在の数
+
+        """
+        return self.__normalize.cache_info()
+
+    def cache_clear(self) -> None:
+        """正規化キャッシュと統計情報を消去する"""
+        self.__normalize.cache_clear()
+
+    def _normalize(self, text: str) -> str:
+        if text == "0":
+            return ""
+
+        return unicodedata.normalize("NFKC", self.format_string(text))
+
+
+class Scraper:
+    normalizer = Normalizer(getattr(settings, "NORMALIZE_CACHE_SIZE", 16384))
+
+    def normalize(self, text: str) -> str:
+        """文字列から余計な空白等を取り除き、全角数字等を正規化して返す
+
+        Args:
+            text (str): 正規化したい文字列
+
+        Returns:
+            nomalized_text (str): 正規化後の文字列
+
+        """
+        return self.normalizer.normalize(text)
+
+    def normalize_series(self, series: pd.Series) -> pd.Series:
+        """``normalize`` と同じ正規化を列全体に適用する
+
+        列内の重複を除いた文字列だけを正規化し、結果を元の並びに展開する。
+
+        Args:
+            series (:obj:`pd.Series`): 正規化したい文字列の列
+                欠損値は空文字列として扱う。
+
+        Returns:
+            normalized_series (:obj:`pd.Series`): 正規化後の文字列の列
+
+        """
+        codes, uniques = pd.factorize(series.fillna(""))
+        normalized_uniques = np.array(
+            [self.normalize(text) for text in uniques], dtype=object
+        )
+        return pd.Series(normalized_uniques[codes], index=series.index, dtype=object)
+
+    def _format_string(self, text: str) -> str:
+        """改行を半角スペースに置換し、文字列から連続する半角スペースを除去する
+
+        Args:
+            text (str): 整形前の文字列
+
+        Returns:
+            formatted_str (str): 整形後の文字列
+
+        """
+        return self.normalizer.format_string(text)
+
 
 class ScrapeOutpatientSourceURL:
     """旭川市新型コロナウイルス発熱外来データ Excel ファイルのリンクの抽出
@@ -382,25 +1574,60 @@ class ScrapeOutpatient(Scraper):
     Attributes:
         outpatient_data (list of dict): 旭川市の発熱外来データ
             旭川市の新型コロナウイルス発熱外来データを表す辞書のリスト
+        not_modified (bool): Excel ファイルが前回のダウンロードから更新されていなければ真
 
     """
 
-    def __init__(self, excel_url: str):
+    # 発熱外来データの抽出に使う Excel ファイルの列数
+    COLUMNS_COUNT = 58
+    AVAILABLE_PATTERN = re.compile("^(?:.*)[○|〇](?:.*)$")
+    TIME_FORMAT_PATTERN = re.compile("^.*([0-9]{2}):([0-9]{2}):([0-9]{2})$")
+
+    def __init__(
+        self,
+        excel_url: str,
+        skip_if_not_modified: bool = False,
+        engine: Optional[str] = None,
+    ):
         """
         Args:
             excel_url (str): 北海道公式ホームページ発熱外来一覧表 Excel ファイルの URL
+            skip_if_not_modified (bool): 真なら Excel ファイルが更新されていない場合に
+                データの抽出を省略し、空のリストを返す
+            engine (str): Excel ファイルの読み込み方法
+                ``pandas`` なら DataFrame に読み込んで列単位で変換し、 ``openpyxl`` なら
+                読み取り専用モードで 1 行ずつ読み込んで変換する。指定しない場合は設定ファイルの
+                ``OUTPATIENT_EXCEL_ENGINE`` を使う。
 
         """
-        excel_lists = self._get_excel_lists(excel_url)
-        self.__lists = list()
-        for excel_row in excel_lists:
-            if excel_row:
-                self.__lists.append(self._get_outpatient(excel_row))
+        self.__not_modified = False
+        self.__skip_if_not_modified = skip_if_not_modified
+        if engine is None:
+            engine = getattr(settings, "OUTPATIENT_EXCEL_ENGINE", "pandas")
+
+        if engine == "pandas":
+            excel_frame = self._get_excel_frame(excel_url)
+            with instrumentation.stage("normalize"):
+                self.__lists = self._get_outpatients(excel_frame)
+        elif engine == "openpyxl":
+            # 1 行ずつ読み込みながら変換するため、読み込みと変換を分けずに計測する
+            with instrumentation.stage("read_excel"):
+                self.__lists = [
+                    self._get_outpatient(excel_row)
+                    for excel_row in self._iter_excel_rows(excel_url)
+                ]
+                instrumentation.count(rows_parsed=len(self.__lists))
+        else:
+            raise ValueError("Excel ファイルの読み込み方法の指定が正しくありません。")
 
     @property
     def lists(self) -> list:
         return self.__lists
 
+    @property
+    def not_modified(self) -> bool:
+        return self.__not_modified
+
     def _get_excel_lists(self, excel_url: str) -> list:
         """
         Args:
@@ -411,18 +1638,152 @@ class ScrapeOutpatient(Scraper):
                 北海道の新型コロナウイルス発熱外来一覧表 Excel データから抽出した表データを、
                 二次元配列のリストで返す。
 
+        """
+        return self._get_excel_frame(excel_url).values.tolist()
+
+    def _get_excel_frame(self, excel_url: str) -> pd.DataFrame:
+        """
+        Args:
+            excel_url (str): 北海道公式ホームページ発熱外来一覧表 Excel ファイルの URL
+
+        Returns:
+            excel_frame (:obj:`pd.DataFrame`): 北海道の発熱外来 Excel データ
+                北海道の新型コロナウイルス発熱外来一覧表 Excel データから抽出した表データを、
+                全ての値を文字列とした DataFrame で返す。
+
+        """
+        excel_file = DownloadExcel(excel_url)
+        self.__not_modified = excel_file.not_modified
+        if self.__not_modified and self.__skip_if_not_modified:
+            return pd.DataFrame()
+
+        with instrumentation.stage("read_excel"):
+            df = pd.read_excel(
+                excel_file.content,
+                sheet_name="Sheet1",
+                header=None,
+                index_col=None,
+                skiprows=[0, 1, 2],
+                usecols=lambda column: column < self.COLUMNS_COUNT,
+                dtype=str,
+            )
+            # 末尾の列が空の場合は列が省略されるため、足りない列を補う
+            df = df.reindex(columns=range(self.COLUMNS_COUNT))
+            df.replace(np.nan, "", inplace=True)
+            instrumentation.count(rows_parsed=len(df))
+        return df
+
+    def _iter_excel_rows(self, excel_url: str) -> Iterator[list]:
+        """Excel ファイルを読み取り専用モードで開き、 1 行ずつ文字列のリストで返す
+
+        DataFrame を作らずに必要な列だけを読み込むため、大きな Excel ファイルでも
+        メモリ使用量を抑えられる。 ``_get_excel_frame`` と同じく先頭 3 行を読み飛ばし、
+        末尾の空行は返さない。
+
+        Args:
+            excel_url (str): 北海道公式ホームページ発熱外来一覧表 Excel ファイルの URL
+
+        Yields:
+            excel_row (list of str): Excel ファイルの 1 行分のデータ
+
         """
         excel_file = DownloadExcel(excel_url)
-        df = pd.read_excel(
-            excel_file.content,
-            sheet_name="Sheet1",
-            header=None,
-            index_col=None,
-            skiprows=[0, 1, 2],
-            dtype=str,
+        self.__not_modified = excel_file.not_modified
+        if self.__not_modified and self.__skip_if_not_modified:
+            return
+
+        workbook = openpyxl.load_workbook(
+            excel_file.content, read_only=True, data_only=True
         )
-        df.replace(np.nan, "", inplace=True)
-        return df.values.tolist()
+        try:
+            blank_rows_count = 0
+            for row in workbook["Sheet1"].iter_rows(
+                min_row=4, max_col=self.COLUMNS_COUNT, values_only=True
+            ):
+                excel_row = [self._cell_to_string(value) for value in row]
+                excel_row += [""] * (self.COLUMNS_COUNT - len(excel_row))
+                if not any(excel_row):
+                    blank_rows_count += 1
+                    continue
+
+                # 途中の空行は pandas で読み込んだ場合と同じく空の行として返す
+                for _ in range(blank_rows_count):
+                    yield [""] * self.COLUMNS_COUNT
+                blank_rows_count = 0
+                yield excel_row
+        finally:
+            workbook.close()
+
+    def _cell_to_string(self, value) -> str:
+        """openpyxl で読み込んだセルの値を pandas の ``dtype=str`` と同じ文字列に変換
+
+        Args:
+            value: セルの値
+
+        Returns:
+            text (str): セルの値を表す文字列
+
+        """
+        if value is None:
+            return ""
+
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+
+        return str(value)
+
+    def _get_outpatients(self, excel_frame: pd.DataFrame) -> list:
+        """Excel データの DataFrame を列単位で変換して発熱外来データのリストを返す
+
+        ``_get_outpatient`` を各行に適用した場合と同じ辞書のリストを返す。
+
+        Args:
+            excel_frame (:obj:`pd.DataFrame`): 北海道の発熱外来 Excel データ
+                全ての値が文字列の DataFrame
+
+        Returns:
+            outpatient_data (list of dict): 発熱外来データ
+                Excel ファイルから抽出した発熱外来データの辞書のリスト
+
+        """
+        if excel_frame.empty:
+            return list()
+
+        def column(index: int) -> pd.Series:
+            return self.normalize_series(excel_frame.iloc[:, index])
+
+        is_positive_patients = self._get_available_series(column(1))
+        outpatients = pd.DataFrame(
+            {
+                "is_outpatient": self._get_available_series(column(0)),
+                "is_positive_patients": is_positive_patients,
+                "public_health_care_center": column(2),
+                "medical_institution_name": column(3).str.replace(" ", "", regex=False),
+                "city": column(4),
+                "address": column(5).str.replace("北海道", "", regex=False),
+                "phone_number": column(6),
+                "is_target_not_family": column(7) == "かかりつけ患者以外の診療も可",
+                "is_pediatrics": self._get_available_series(column(8)),
+            }
+        )
+        for day, start in zip(
+            ["mon", "tue", "wed", "thu", "fri", "sat", "sun"], range(9, 51, 6)
+        ):
+            outpatients[day] = self._get_opening_hours_series(
+                [column(index) for index in range(start, start + 6)]
+            )
+
+        outpatients["is_face_to_face_for_positive_patients"] = (
+            is_positive_patients & self._get_available_series(column(51))
+        )
+        outpatients["is_online_for_positive_patients"] = (
+            is_positive_patients & self._get_available_series(column(52))
+        )
+        outpatients["is_home_visitation_for_positive_patients"] = (
+            is_positive_patients & self._get_available_series(column(53))
+        )
+        outpatients["memo"] = column(57)
+        return outpatients.to_dict("records")
 
     def _get_outpatient(self, excel_row: list) -> dict:
         """
@@ -490,12 +1851,60 @@ class ScrapeOutpatient(Scraper):
 
         """
         result = False
-        ok_match = re.search("^(.*)[○|〇](.*)$", text)
+        ok_match = self.AVAILABLE_PATTERN.search(text)
         if ok_match:
             result = True
 
         return result
 
+    def _get_available_series(self, series: pd.Series) -> pd.Series:
+        """``_get_available`` を列全体に適用する
+
+        Args:
+            series (:obj:`pd.Series`): 正規化済みの文字列の列
+
+        Returns:
+            result (:obj:`pd.Series`): 文字列がマルなら真、そうでなければ偽の列
+
+        """
+        return series.str.contains(self.AVAILABLE_PATTERN, regex=True)
+
+    def _get_opening_hours_series(self, target_list: list) -> pd.Series:
+        """``_get_opening_hours`` を列全体に適用する
+
+        Args:
+            target_list (list of :obj:`pd.Series`): 診療時間を表す 6 列分の文字列の列
+
+        Returns:
+            opening_hours (:obj:`pd.Series`): 診療時間を表す文字列の列
+
+        """
+        am_start = self._strip_if_time_format_series(target_list[0])
+        am_end = self._strip_if_time_format_series(target_list[2])
+        pm_start = self._strip_if_time_format_series(target_list[3])
+        pm_end = self._strip_if_time_format_series(target_list[5])
+        has_am = (am_start != "00:00") | (am_end != "00:00")
+        has_pm = (pm_start != "00:00") | (pm_end != "00:00")
+        am = am_start + "～" + am_end
+        pm = pm_start + "～" + pm_end
+        opening_hours = (am + "、" + pm).str.replace(
+            "～00:00、00:00～", "～", regex=False
+        )
+        opening_hours = opening_hours.where(has_am & has_pm, am.where(has_am, pm))
+        return opening_hours.where(has_am | has_pm, "")
+
+    def _strip_if_time_format_series(self, series: pd.Series) -> pd.Series:
+        """``_strip_if_time_format`` を列全体に適用する
+
+        Args:
+            series (:obj:`pd.Series`): 正規化済みの文字列の列
+
+        Returns:
+            stripped_series (:obj:`pd.Series`): 時刻表記から秒の部分を削除した列
+
+        """
+        return series.str.replace(self.TIME_FORMAT_PATTERN, r"\1:\2", regex=True)
+
     def _get_opening_hours(self, target_list: list) -> str:
         """診療時間を表すリストを結合して文字列で返す
 
@@ -540,9 +1949,7 @@ class ScrapeOutpatient(Scraper):
         if not isinstance(target_text, str):
             return None
 
-        time_format_match = re.search(
-            "^.*([0-9]{2}):([0-9]{2}):([0-9]{2})$", target_text
-        )
+        time_format_match = self.TIME_FORMAT_PATTERN.search(target_text)
         if time_format_match:
             return time_format_match.group(1) + ":" + time_format_match.group(2)
         else:
@@ -554,44 +1961,73 @@ class ScrapeOpendataLocation(Scraper):
 
     Attributes:
         lists (list of dict): 緯度経度データを表す辞書のリスト
+        not_modified (bool): CSV ファイルが前回のダウンロードから更新されていなければ真
 
     """
 
-    def __init__(self, csv_url: str):
+    def __init__(self, csv_url: str, skip_if_not_modified: bool = False):
         """
         Args:
             csv_url (str): 北海道オープンデータポータルの CSV ファイルの URL
+            skip_if_not_modified (bool): 真なら CSV ファイルが更新されていない場合に
+                データの抽出を省略し、空のリストを返す
 
         """
-        self.__lists = list()
-        download_csv = DownloadCSV(url=csv_url, encoding="cp932")
-        for row in self._get_table_values(download_csv):
-            location_data = self._extract_location_data(row)
-            if location_data:
-                self.__lists.append(location_data)
+        self.__lists = None
+        self.__download_csv = DownloadCSV(url=csv_url, encoding="cp932")
+        self.__not_modified = self.__download_csv.not_modified
+        self.__skip = self.__not_modified and skip_if_not_modified
+
+    def __iter__(self) -> Iterator[dict]:
+        """CSV ファイルをダウンロードしながら緯度経度データを 1 件ずつ返す
+
+        Yields:
+            location_data (dict): 緯度経度の辞書データ
+
+        """
+        if self.__lists is not None:
+            yield from self.__lists
+            return
+
+        if self.__skip:
+            return
+
+        rows_count = 0
+        try:
+            for row in self._get_table_values(self.__download_csv):
+                rows_count += 1
+                location_data = self._extract_location_data(row)
+                if location_data:
+                    yield location_data
+        finally:
+            instrumentation.count(rows_parsed=rows_count)
 
     @property
     def lists(self) -> list:
+        if self.__lists is None:
+            # ストリーミングでダウンロードしながら抽出するため、ダウンロードも含めて計測する
+            with instrumentation.stage("parse_csv"):
+                self.__lists = list(iter(self))
         return self.__lists
 
-    def _get_table_values(self, download_csv: DownloadCSV) -> list:
-        """CSV から内容を抽出してリストに格納
+    @property
+    def not_modified(self) -> bool:
+        return self.__not_modified
+
+    def _get_table_values(self, download_csv: DownloadCSV) -> Iterator[list]:
+        """CSV から内容を 1 行ずつ抽出して返す
 
         Args:
             downloaded_csv (:obj:`DownloadedCSV`): CSV ファイルのデータ
                 ダウンロードした CSV ファイルの StringIO データを要素に持つオブジェクト
 
-        Returns:
-            table_values (list of list): CSV の内容で構成される二次元配列
+        Yields:
+            row (list): CSV の 1 行分のデータ
 
         """
-        table_values = list()
-        reader = csv.reader(download_csv.content)
-        next(reader)
-        for row in reader:
-            table_values.append(row)
-
-        return table_values
+        reader = csv.reader(download_csv.iter_lines())
+        next(reader, None)
+        yield from reader
 
     def _extract_location_data(self, row: list) -> dict:
         """北海道オープンデータポータルの CSV データから緯度経度情報を抽出
@@ -606,16 +2042,19 @@ class ScrapeOpendataLocation(Scraper):
         if len(row) != 37:
             return None
 
-        row = list(map(lambda x: self.normalize(x), row))
-        city = row[4]
+        # 対象外の市町村の行は他の列を正規化する前に除外する
+        city = self.normalize(row[4])
         if city != "旭川市":
             return None
 
         try:
             location_data = {
-                "medical_institution_name": row[5].replace(" ", ""),
-                "longitude": float(row[12]),
-                "latitude": float(row[11]),
+                "medical_institution_name": self.normalize(row[5]).replace(" ", ""),
+                "address": self.normalize(row[9]),
+                "longitude": float(self.normalize(row[12])),
+                "latitude": float(self.normalize(row[11])),
+                # 同じ医療機関名の検索した位置情報を上書きした場合も、削除の対象にする
+                "is_geocoded": False,
             }
         except ValueError:
             return None
@@ -631,10 +2070,19 @@ class ScrapeYOLPLocation:
 
     """
 
-    def __init__(self, facility_name: str):
+    def __init__(
+        self,
+        facility_name: str,
+        city_code: str = "01204",
+        industry_code: str = "0401",
+        client: Optional[HTTPClient] = None,
+    ):
         """
         Args:
             facility_name (str): 緯度経度情報を取得したい施設の名称
+            city_code (str): 検索する市区町村の住所コード
+            industry_code (str): 検索する業種コード
+            client (:obj:`HTTPClient`): ダウンロードに使う HTTP クライアント
 
         """
         self.__lists = list()
@@ -643,8 +2091,6 @@ class ScrapeYOLPLocation:
         else:
             raise TypeError("施設名の指定が正しくありません。")
 
-        city_code = "01204"
-        industry_code = "0401"
         if YOLP_APP_ID:
             app_id = YOLP_APP_ID
         else:
@@ -662,7 +2108,9 @@ class ScrapeYOLPLocation:
             + industry_code
             + "&sort=-match&detail=simple&output=json"
         )
-        download_json = DownloadJSON(json_url)
+        # URL にアプリケーション ID を含むため、ディスクキャッシュには保存しない
+        # 検索結果のキャッシュは GeocodeCache が持つ
+        download_json = DownloadJSON(json_url, client, use_cache=False)
         for search_result in self._get_search_results(download_json):
             location_data = self._extract_location_data(search_result)
             location_data["medical_institution_name"] = urllib.parse.unquote(
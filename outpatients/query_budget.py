@@ -0,0 +1,73 @@
+import functools
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """ビューの実行中に発行した SQL の件数が上限を超えた"""
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` に渡し、発行した SQL の件数と実行時間を記録する
+
+    Attributes:
+        count (int): 発行した SQL の件数
+        duration (float): SQL の実行時間の合計 (秒)
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started_at
+
+
+def query_budget(max_queries: int):
+    """ビューが発行する SQL の件数の上限を宣言するデコレーター
+
+    SQL の件数と実行時間をログに記録する。上限を超えた場合は警告をログに記録し、
+    設定ファイルの ``QUERY_BUDGET_STRICT`` が真なら ``QueryBudgetExceeded`` を送出する。
+    件数にはテンプレートの描画中やログイン中の利用者の取得で発行した SQL も含む。
+
+    Args:
+        max_queries (int): 1 回のリクエストで発行してよい SQL の件数
+
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                response = view(request, *args, **kwargs)
+
+            logger.debug(
+                "%s: SQL %d 件、 %.1f ms",
+                view.__name__,
+                recorder.count,
+                recorder.duration * 1000,
+            )
+            if max_queries < recorder.count:
+                message = "{} の SQL が上限の {} 件を超えました: {} 件".format(
+                    view.__name__, max_queries, recorder.count
+                )
+                if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        return wrapper
+
+    return decorator
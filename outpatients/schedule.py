@@ -0,0 +1,60 @@
+import functools
+import re
+import unicodedata
+
+WEEKDAY_FIELDS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MINUTES_PER_DAY = 24 * 60
+INTERVAL_PATTERN = re.compile(
+    r"([0-9]{1,2})[:時]([0-9]{2})?分?\s*[～~〜\-－ー―]\s*([0-9]{1,2})[:時]([0-9]{2})?分?"
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_opening_hours(text: str) -> tuple:
+    """診療時間の文字列を、その日の 0 時からの分単位の区間に変換する
+
+    ``08:30～11:30、13:00～17:00`` のような ``_get_opening_hours`` が作成する形式のほか、
+    ``8時30分～17時`` のような表記も読み取る。終了時刻が開始時刻より前の区間は翌日まで
+    続くものとし、終了時刻に 1 日分の分数を加える。
+
+    Args:
+        text (str): 診療時間を表す文字列
+
+    Returns:
+        intervals (tuple of tuple): 開始と終了の分の組のタプル
+            時刻を読み取れない場合は空のタプルを返す。
+
+    """
+    if not text:
+        return tuple()
+
+    intervals = list()
+    for match in INTERVAL_PATTERN.finditer(unicodedata.normalize("NFKC", text)):
+        start_hour, start_minute, end_hour, end_minute = match.groups()
+        start = int(start_hour) * 60 + int(start_minute or 0)
+        end = int(end_hour) * 60 + int(end_minute or 0)
+        if MINUTES_PER_DAY < start or MINUTES_PER_DAY < end:
+            continue
+        if end == start:
+            continue
+        if end < start:
+            end += MINUTES_PER_DAY
+        intervals.append((start, end))
+    return tuple(intervals)
+
+
+def parse_weekly_schedule(values: dict) -> list:
+    """曜日ごとの診療時間の文字列を、曜日と分単位の区間のリストに変換する
+
+    Args:
+        values (dict): ``mon`` から ``sun`` をキーとする診療時間の文字列の辞書
+
+    Returns:
+        schedule (list of tuple): 曜日 (月曜日が 0) 、開始の分、終了の分の組のリスト
+
+    """
+    return [
+        (weekday, start, end)
+        for weekday, field in enumerate(WEEKDAY_FIELDS)
+        for start, end in parse_opening_hours(values.get(field) or "")
+    ]
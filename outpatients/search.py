@@ -0,0 +1,148 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from outpatients.cache import get_or_build
+from outpatients.models import Outpatient
+from outpatients.text import WHITESPACE_PATTERN, fold
+
+# 検索対象の項目と、その項目で一致した場合の得点
+SEARCH_FIELDS = {"medical_institution_name": 3, "address": 2, "memo": 1}
+# 医療機関名が検索語で始まる場合に加える得点
+PREFIX_BONUS = 1
+
+
+class SearchResult(NamedTuple):
+    outpatient_id: int
+    score: int
+
+
+def ngrams(folded_text: str) -> set:
+    """文字列に含まれる 1 文字と 2 文字の部分文字列の集合を返す
+
+    Args:
+        folded_text (str): ``fold`` で変換した文字列
+
+    Returns:
+        grams (set of str): 部分文字列の集合
+
+    """
+    return set(folded_text) | {
+        folded_text[i : i + 2] for i in range(len(folded_text) - 1)
+    }
+
+
+class SearchIndex:
+    """発熱外来の医療機関名、住所、備考の n-gram 転置索引
+
+    検索語の 2 文字ごとの部分文字列をすべて含む発熱外来を転置索引の積集合で絞り込み、
+    候補だけ検索語が実際に含まれているかを確かめて得点を計算する。
+
+    Args:
+        documents (list of dict): ``id`` と検索対象の項目を持つ辞書のリスト
+
+    """
+
+    def __init__(self, documents: list):
+        self.__ids = list()
+        self.__texts = list()
+        postings = dict()
+        for position, document in enumerate(documents):
+            texts = {field: fold(document.get(field)) for field in SEARCH_FIELDS}
+            self.__ids.append(document["id"])
+            self.__texts.append(texts)
+            for gram in set().union(*(ngrams(text) for text in texts.values())):
+                postings.setdefault(gram, list()).append(position)
+        self.__postings = {
+            gram: np.asarray(positions, dtype=np.int32)
+            for gram, positions in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.__ids)
+
+    @classmethod
+    def from_queryset(cls, queryset) -> "SearchIndex":
+        """発熱外来の QuerySet から検索索引を作成する
+
+        Args:
+            queryset (:obj:`QuerySet`): 発熱外来の QuerySet
+
+        Returns:
+            index (:obj:`SearchIndex`): 検索索引
+
+        """
+        return cls(queryset.order_by("id").values("id", *SEARCH_FIELDS).iterator())
+
+    def search(self, query: str, limit: Optional[int] = None) -> list:
+        """検索語をすべて含む発熱外来を得点の高い順に返す
+
+        Args:
+            query (str): 空白で区切った検索語
+            limit (int): 返す件数の上限
+
+        Returns:
+            results (list of :obj:`SearchResult`): 発熱外来の ID と得点
+                得点が同じ場合は ID の昇順に並べる。
+
+        """
+        terms = [fold(term) for term in WHITESPACE_PATTERN.split(query or "")]
+        terms = [term for term in terms if term]
+        if not terms:
+            return list()
+
+        grams = set().union(
+            *(
+                {term[i : i + 2] for i in range(len(term) - 1)} or {term}
+                for term in terms
+            )
+        )
+        postings = sorted(
+            (self.__postings.get(gram) for gram in grams),
+            key=lambda positions: -1 if positions is None else len(positions),
+        )
+        if postings[0] is None:
+            return list()
+        candidates = postings[0]
+        for positions in postings[1:]:
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+            if not len(candidates):
+                return list()
+
+        results = list()
+        for position in candidates.tolist():
+            score = self.__score(self.__texts[position], terms)
+            if score:
+                results.append(SearchResult(self.__ids[position], score))
+        results.sort(key=lambda result: (-result.score, result.outpatient_id))
+        return results[:limit]
+
+    @staticmethod
+    def __score(texts: dict, terms: list) -> int:
+        score = 0
+        for term in terms:
+            term_score = sum(
+                weight
+                for field, weight in SEARCH_FIELDS.items()
+                if term in texts[field]
+            )
+            if not term_score:
+                return 0
+            if texts["medical_institution_name"].startswith(term):
+                term_score += PREFIX_BONUS
+            score += term_score
+        return score
+
+
+def get_search_index() -> SearchIndex:
+    """最新のデータから作成した発熱外来の検索索引を返す
+
+    データのバージョンが変わっていれば作り直す。
+
+    Returns:
+        index (:obj:`SearchIndex`): 検索索引
+
+    """
+    return get_or_build(
+        "search_index", lambda: SearchIndex.from_queryset(Outpatient.objects.all())
+    )
@@ -0,0 +1,99 @@
+from rest_framework import serializers
+
+from outpatients.models import Location, Outpatient
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """``?fields=`` で指定した項目だけを返す ModelSerializer
+
+    例えば ``?fields=id,medical_institution_name`` とすると、その 2 項目だけを返す。
+    存在しない項目名は無視する。
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested_fields = self.get_requested_fields(self.context.get("request"))
+        if requested_fields:
+            for field_name in set(self.fields) - set(requested_fields):
+                self.fields.pop(field_name)
+
+    @classmethod
+    def get_requested_fields(cls, request) -> list:
+        """リクエストの ``fields`` パラメーターから返す項目名のリストを取得する
+
+        Args:
+            request (:obj:`Request`): リクエスト
+
+        Returns:
+            requested_fields (list of str): 返す項目名のリスト
+                指定がない場合や有効な項目名がない場合は空のリストを返す。
+
+        """
+        if request is None:
+            return list()
+
+        fields = request.query_params.get("fields", "")
+        return [
+            field_name
+            for field_name in (field.strip() for field in fields.split(","))
+            if field_name in cls.Meta.fields
+        ]
+
+
+class OutpatientSerializer(DynamicFieldsModelSerializer):
+    class Meta:
+        model = Outpatient
+        fields = (
+            "id",
+            "is_outpatient",
+            "is_positive_patients",
+            "public_health_care_center",
+            "medical_institution_name",
+            "city",
+            "address",
+            "phone_number",
+            "is_target_not_family",
+            "is_pediatrics",
+            "mon",
+            "tue",
+            "wed",
+            "thu",
+            "fri",
+            "sat",
+            "sun",
+            "is_face_to_face_for_positive_patients",
+            "is_online_for_positive_patients",
+            "is_home_visitation_for_positive_patients",
+            "memo",
+            "created_at",
+            "update_at",
+        )
+
+
+class LocationSerializer(DynamicFieldsModelSerializer):
+    class Meta:
+        model = Location
+        fields = (
+            "id",
+            "medical_institution_name",
+            "latitude",
+            "longitude",
+            "created_at",
+            "update_at",
+        )
+
+
+class NearestQuerySerializer(serializers.Serializer):
+    """近くの発熱外来の検索条件"""
+
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    """発熱外来のキーワード検索の条件"""
+
+    q = serializers.CharField()
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
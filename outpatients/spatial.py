@@ -0,0 +1,225 @@
+import math
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from outpatients.cache import get_or_build
+from outpatients.models import Outpatient
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class Neighbor(NamedTuple):
+    outpatient_id: int
+    distance: float
+
+
+def haversine(
+    latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray
+) -> np.ndarray:
+    """1 地点から複数の地点までの大圏距離をまとめて計算する
+
+    Args:
+        latitude (float): 基準地点の緯度
+        longitude (float): 基準地点の経度
+        latitudes (:obj:`np.ndarray`): 各地点の緯度
+        longitudes (:obj:`np.ndarray`): 各地点の経度
+
+    Returns:
+        distances (:obj:`np.ndarray`): 各地点までの距離 (km)
+
+    """
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = (
+        np.sin((latitudes - latitude) / 2) ** 2
+        + np.cos(latitude)
+        * np.cos(latitudes)
+        * np.sin((longitudes - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """緯度経度を一定の間隔の格子に分けて地点を登録した空間索引
+
+    検索地点の周りの格子から順に候補を集め、見つかった候補だけ距離を計算するため、
+    全件の距離を計算せずに近い順の地点を求められる。
+
+    Args:
+        ids (list of int): 地点の ID のリスト
+        latitudes (list of float): 地点の緯度のリスト
+        longitudes (list of float): 地点の経度のリスト
+        cell_size (float): 格子の間隔 (度)
+
+    """
+
+    def __init__(
+        self, ids: list, latitudes: list, longitudes: list, cell_size: float = 0.05
+    ):
+        self.__cell_size = cell_size
+        self.__ids = np.asarray(ids, dtype=np.int64)
+        self.__latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.__longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        rows = np.floor(self.__latitudes / cell_size).astype(np.int64)
+        columns = np.floor(self.__longitudes / cell_size).astype(np.int64)
+        order = np.lexsort((columns, rows))
+        cells, starts = np.unique(
+            np.stack([rows[order], columns[order]], axis=1), axis=0, return_index=True
+        )
+        self.__cells = {
+            (int(row), int(column)): positions
+            for (row, column), positions in zip(cells, np.split(order, starts[1:]))
+        }
+        if len(cells):
+            self.__min_cell = cells.min(axis=0)
+            self.__max_cell = cells.max(axis=0)
+
+    def __len__(self):
+        return len(self.__ids)
+
+    @classmethod
+    def from_queryset(cls, queryset, **kwargs) -> "SpatialIndex":
+        """位置情報が紐付いた発熱外来から空間索引を作成する
+
+        Args:
+            queryset (:obj:`QuerySet`): 発熱外来の QuerySet
+
+        Returns:
+            index (:obj:`SpatialIndex`): 空間索引
+
+        """
+        rows = list(
+            queryset.filter(location__isnull=False).values_list(
+                "id", "location__latitude", "location__longitude"
+            )
+        )
+        ids, latitudes, longitudes = zip(*rows) if rows else ((), (), ())
+        return cls(ids, latitudes, longitudes, **kwargs)
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 10,
+        allowed_ids: Optional[list] = None,
+    ) -> list:
+        """指定した地点から近い順に地点を返す
+
+        Args:
+            latitude (float): 検索地点の緯度
+            longitude (float): 検索地点の経度
+            k (int): 返す地点の最大数
+            allowed_ids (list of int): 検索対象とする地点の ID のリスト
+                省略した場合はすべての地点を対象とする。
+
+        Returns:
+            neighbors (list of :obj:`Neighbor`): 距離の近い順の地点の ID と距離 (km)
+
+        """
+        if not len(self) or k < 1:
+            return list()
+
+        allowed = (
+            None
+            if allowed_ids is None
+            else np.isin(self.__ids, np.asarray(list(allowed_ids), dtype=np.int64))
+        )
+        row = math.floor(latitude / self.__cell_size)
+        column = math.floor(longitude / self.__cell_size)
+        # 地点のある格子の範囲より内側の輪は空なので、範囲に届く半径から調べる
+        min_radius = int(
+            max(
+                np.maximum(self.__min_cell - (row, column), 0).max(),
+                np.maximum((row, column) - self.__max_cell, 0).max(),
+            )
+        )
+        max_radius = int(
+            max(
+                np.abs(self.__min_cell - (row, column)).max(),
+                np.abs(self.__max_cell - (row, column)).max(),
+            )
+        )
+
+        candidates = list()
+        for radius in range(min_radius, max_radius + 1):
+            candidates.extend(self.__ring(row, column, radius, allowed))
+            if len(candidates) < k:
+                continue
+
+            # 調べた格子の外側にある地点は、少なくともこの距離だけ離れている
+            positions = np.concatenate(candidates)
+            distances = haversine(
+                latitude,
+                longitude,
+                self.__latitudes[positions],
+                self.__longitudes[positions],
+            )
+            kth_distance = np.partition(distances, k - 1)[k - 1]
+            if kth_distance <= self.__covered_distance(latitude, radius):
+                break
+        else:
+            if not candidates:
+                return list()
+            positions = np.concatenate(candidates)
+            distances = haversine(
+                latitude,
+                longitude,
+                self.__latitudes[positions],
+                self.__longitudes[positions],
+            )
+
+        nearest = np.argsort(distances, kind="stable")[:k]
+        return [
+            Neighbor(int(self.__ids[positions[i]]), float(distances[i]))
+            for i in nearest
+        ]
+
+    def __ring(self, row: int, column: int, radius: int, allowed) -> list:
+        min_row, min_column = self.__min_cell
+        max_row, max_column = self.__max_cell
+        ring = list()
+        ring_rows = range(max(row - radius, min_row), min(row + radius, max_row) + 1)
+        for ring_row in ring_rows:
+            if abs(ring_row - row) == radius:
+                ring_columns = range(
+                    max(column - radius, min_column),
+                    min(column + radius, max_column) + 1,
+                )
+            else:
+                ring_columns = {column - radius, column + radius}
+            for ring_column in ring_columns:
+                positions = self.__cells.get((ring_row, ring_column))
+                if positions is None:
+                    continue
+                if allowed is not None:
+                    positions = positions[allowed[positions]]
+                if len(positions):
+                    ring.append(positions)
+        return ring
+
+    def __covered_distance(self, latitude: float, radius: int) -> float:
+        degrees = radius * self.__cell_size
+        # 経度 1 度あたりの距離は高緯度ほど短いため、調べた範囲で最も短い値を使う
+        highest_latitude = min(abs(latitude) + degrees, 90.0)
+        return degrees * KM_PER_DEGREE * math.cos(math.radians(highest_latitude))
+
+    @property
+    def cell_size(self) -> float:
+        return self.__cell_size
+
+
+def get_spatial_index() -> SpatialIndex:
+    """最新のデータから作成した発熱外来の空間索引を返す
+
+    データのバージョンが変わっていれば作り直す。
+
+    Returns:
+        index (:obj:`SpatialIndex`): 空間索引
+
+    """
+    return get_or_build(
+        "spatial_index", lambda: SpatialIndex.from_queryset(Outpatient.objects.all())
+    )
@@ -1,14 +1,70 @@
-from io import BytesIO
+import csv
+import datetime
+import json
+import logging
+from io import BytesIO, StringIO
 
+import numpy as np
+import openpyxl
+import pandas as pd
 import pytest
 import requests
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.base import memcache_key_warnings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
 from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
 
-from outpatients.models import (DownloadCSV, DownloadExcel, DownloadJSON,
-                                Location, Outpatient, ScrapeOpendataLocation,
+from benchmarks.adapter import FixtureAdapter
+from benchmarks.datasets import EXCEL_URL, build_dataset, yolp_response
+from benchmarks.run import compare
+from benchmarks.suite import BENCHMARK_SETTINGS, clear_database
+from outpatients import instrumentation, models, views
+from outpatients.geocoding import Coordinates, Geocoder, RateLimiter
+from outpatients.instrumentation import RunReport
+from outpatients.management.commands import update_outpatients
+from outpatients.matching import LocationMatcher, Match, block_key, name_key
+from outpatients.models import (ChangeLog, DownloadCSV, DownloadExcel,
+                                DownloadJSON, GeocodeCache, HTTPClient,
+                                IngestRun, Location, Normalizer, OpeningHours,
+                                Outpatient, ScrapeOpendataLocation,
                                 ScrapeOutpatient, ScrapeOutpatientSourceURL,
                                 ScrapeYOLPLocation)
+from outpatients.query_budget import QueryBudgetExceeded, query_budget
+from outpatients.schedule import parse_opening_hours
+from outpatients.search import SearchIndex
+from outpatients.spatial import SpatialIndex, haversine
+from outpatients.text import fold
+
+
+@pytest.fixture(autouse=True)
+def download_cache_dir(settings, tmp_path):
+    settings.DOWNLOAD_CACHE_DIR = tmp_path / "download_cache"
+    return settings.DOWNLOAD_CACHE_DIR
+
+
+@pytest.fixture()
+def yolp_app_id(mocker):
+    mocker.patch.object(models, "YOLP_APP_ID", "test")
+    return "test"
+
+
+@pytest.fixture(autouse=True)
+def query_budget_strict(settings):
+    settings.QUERY_BUDGET_STRICT = True
+
+
+@pytest.fixture(autouse=True)
+def page_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    caches["default"].clear()
+    return caches["default"]
 
 
 @pytest.mark.django_db
@@ -130,6 +186,25 @@ class TestOutpatient:
             == "かかりつけ患者及び保健所からの紹介患者に限ります。 https://www.city.asahikawa.hokkaido.jp/hospital/3100/d075882.html"
         )
 
+    def test_create_outpatient_by_form_duplicate(self, client, test_data):
+        client.post("/outpatients/new/", test_data["市立旭川病院"])
+        response = client.post("/outpatients/new/", test_data["市立旭川病院"])
+        assert response.status_code == 200
+        assert response.context["form"].non_field_errors()
+        assert Outpatient.objects.count() == 1
+
+    def test_edit_outpatient_by_form_duplicate(self, client, test_data):
+        client.post("/outpatients/new/", test_data["市立旭川病院"])
+        client.post("/outpatients/new/", test_data["旭川赤十字病院"])
+        outpatient = Outpatient.objects.get(medical_institution_name="旭川赤十字病院")
+        response = client.post(
+            "/outpatients/{}/edit/".format(outpatient.id), test_data["市立旭川病院"]
+        )
+        assert response.status_code == 200
+        assert response.context["form"].non_field_errors()
+        outpatient.refresh_from_db()
+        assert outpatient.medical_institution_name == "旭川赤十字病院"
+
     def test_upsert_create_outpatient(self, test_data, user):
         create_result = Outpatient.objects.upsert(
             source=test_data["市立旭川病院"], user=user
@@ -165,6 +240,107 @@ class TestOutpatient:
         outpatient = Outpatient.objects.get(medical_institution_name="市立旭川病院")
         assert outpatient.memo == "アップデートのテスト"
 
+    def test_bulk_upsert_outpatient(self, test_data, user):
+        Outpatient.objects.upsert(source=test_data["市立旭川病院"], user=user)
+        test_update_data = dict(test_data["市立旭川病院"], memo="アップデートのテスト")
+        sources = [
+            test_update_data,
+            test_data["JA北海道厚生連旭川厚生病院"],
+            test_data["旭川赤十字病院"],
+        ]
+        with CaptureQueriesContext(connection) as context:
+            result = Outpatient.objects.bulk_upsert(sources=sources, user=user)
+        assert result == (2, 1, 0)
+        assert [
+            query["sql"].split()[0]
+            for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ] == ["INSERT"]
+        assert Outpatient.objects.count() == 3
+        outpatient = Outpatient.objects.get(medical_institution_name="市立旭川病院")
+        assert outpatient.memo == "アップデートのテスト"
+
+    def test_bulk_upsert_change_logs(self, test_data, user):
+        first_run = IngestRun.objects.create()
+        sources = list(test_data.values())
+        Outpatient.objects.bulk_upsert(sources=sources, user=user, run=first_run)
+        assert sorted(
+            first_run.change_logs.values_list("action", "medical_institution_name")
+        ) == sorted(("insert", name) for name in test_data.keys())
+
+        second_run = IngestRun.objects.create()
+        sources[0] = dict(sources[0], memo="アップデートのテスト")
+        result = Outpatient.objects.bulk_upsert(
+            sources=sources[:2], user=user, run=second_run
+        )
+        assert result == (0, 1, 1)
+        deleted_count = Outpatient.objects.delete_missing(
+            [source["medical_institution_name"] for source in sources[:2]],
+            run=second_run,
+        )
+        assert deleted_count == len(sources) - 2
+
+        change_logs = list(ChangeLog.objects.between(first_run))
+        assert [
+            (change_log.action, change_log.medical_institution_name)
+            for change_log in change_logs
+        ] == [("update", sources[0]["medical_institution_name"])] + [
+            ("delete", source["medical_institution_name"]) for source in sources[2:]
+        ]
+        # 更新は値が変わった項目だけを記録する
+        assert change_logs[0].changes == {
+            "memo": [test_data[change_logs[0].medical_institution_name]["memo"]]
+            + ["アップデートのテスト"]
+        }
+        assert ChangeLog.objects.between(first_run, first_run).count() == 0
+        assert [
+            change_log.action
+            for change_log in ChangeLog.objects.history(
+                "outpatient", sources[0]["medical_institution_name"]
+            )
+        ] == ["insert", "update"]
+
+    def test_unique_medical_institution_name(self, test_data, user):
+        Outpatient.objects.upsert(source=test_data["市立旭川病院"], user=user)
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Outpatient.objects.create(created_by=user, **test_data["市立旭川病院"])
+
+    def test_bulk_upsert_unchanged_outpatient(self, test_data, user):
+        sources = list(test_data.values())
+        Outpatient.objects.bulk_upsert(sources=sources, user=user)
+        update_at = Outpatient.objects.get(
+            medical_institution_name="旭川赤十字病院"
+        ).update_at
+        sources[0] = dict(sources[0], memo="アップデートのテスト")
+        result = Outpatient.objects.bulk_upsert(sources=sources, user=user)
+        assert result == (0, 1, 3)
+        # 変更のないデータだけなら書き込みのクエリを発行しない
+        with CaptureQueriesContext(connection) as context:
+            result = Outpatient.objects.bulk_upsert(sources=sources, user=user)
+        assert result == (0, 0, 4)
+        assert not [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE"))
+        ]
+        outpatient = Outpatient.objects.get(medical_institution_name="市立旭川病院")
+        assert outpatient.memo == "アップデートのテスト"
+        outpatient = Outpatient.objects.get(medical_institution_name="旭川赤十字病院")
+        assert outpatient.update_at == update_at
+
+    def test_save_clears_source_hash(self, test_data, user):
+        Outpatient.objects.bulk_upsert(sources=[test_data["市立旭川病院"]], user=user)
+        outpatient = Outpatient.objects.get(medical_institution_name="市立旭川病院")
+        assert outpatient.source_hash == Outpatient.objects.fingerprint(
+            test_data["市立旭川病院"]
+        )
+        outpatient.memo = "フォームからの更新"
+        outpatient.save()
+        result = Outpatient.objects.bulk_upsert(
+            sources=[test_data["市立旭川病院"]], user=user
+        )
+        assert result == (0, 1, 0)
+
     def test_delete_outpatient(self, test_data, user):
         Outpatient.objects.upsert(source=test_data["市立旭川病院"], user=user)
         result = Outpatient.objects.delete("市立旭川病院")
@@ -175,6 +351,20 @@ class TestOutpatient:
         result = Outpatient.objects.delete("旭川赤十字病院")
         assert result is False
 
+    def test_delete_missing_outpatient(
+        self, test_data, user, django_assert_num_queries
+    ):
+        for value in test_data.values():
+            Outpatient.objects.upsert(source=value, user=user)
+
+        # 削除対象の取得、診療時間の削除、発熱外来の削除
+        with django_assert_num_queries(3):
+            result = Outpatient.objects.delete_missing(["市立旭川病院", "旭川赤十字病院"])
+        assert result == 2
+        assert sorted(Outpatient.objects.medical_institution_names_list()) == sorted(
+            ["市立旭川病院", "旭川赤十字病院"]
+        )
+
     def test_medical_institution_names_list(self, test_data, user):
         for value in test_data.values():
             Outpatient.objects.upsert(source=value, user=user)
@@ -190,6 +380,323 @@ class TestOutpatient:
         ]
         assert medical_institution_names_list == expect
 
+    def test_open_at(self, test_data, user):
+        Outpatient.objects.bulk_upsert(sources=test_data.values(), user=user)
+        OpeningHours.objects.rebuild(Outpatient.objects.all())
+        outpatient = Outpatient.objects.get(medical_institution_name="市立旭川病院")
+        outpatient.sat = "22:00～02:00"
+        outpatient.save()
+
+        # 2022-07-04 は月曜日
+        monday = datetime.datetime(2022, 7, 4, 10, 0)
+        assert sorted(
+            Outpatient.objects.open_at(monday).values_list(
+                "medical_institution_name", flat=True
+            )
+        ) == sorted(["市立旭川病院", "JA北海道厚生連旭川厚生病院"])
+        assert not Outpatient.objects.open_at(monday.replace(hour=20)).exists()
+
+        # 土曜日の 22 時から日曜日の 2 時まで
+        sunday = datetime.datetime(2022, 7, 10, 1, 0)
+        assert list(
+            Outpatient.objects.filter(city="旭川市")
+            .open_at(sunday)
+            .values_list("medical_institution_name", flat=True)
+        ) == ["市立旭川病院"]
+
+    def test_link_locations(self, test_data, user, django_assert_num_queries):
+        Outpatient.objects.bulk_upsert(sources=test_data.values(), user=user)
+        location = Location.objects.create(
+            medical_institution_name="市立旭川病院",
+            latitude=43.778144,
+            longitude=142.365952,
+            created_by=user,
+        )
+        assert Outpatient.objects.link_locations() == 1
+        assert Outpatient.objects.link_locations() == 0
+        assert Outpatient.objects.get(
+            medical_institution_name="市立旭川病院"
+        ).location_match_confidence == pytest.approx(1.0)
+        assert Outpatient.objects.unlinked_names_list() == [
+            "JA北海道厚生連旭川厚生病院",
+            "旭川赤十字病院",
+            "おうみや内科クリニック",
+        ]
+
+        with django_assert_num_queries(1):
+            coordinates = [
+                (outpatient.location.latitude, outpatient.location.longitude)
+                for outpatient in Outpatient.objects.select_related(
+                    "location"
+                ).filter(location__isnull=False)
+            ]
+        assert coordinates == [(43.778144, 142.365952)]
+
+        location.delete()
+        assert Outpatient.objects.unlinked_names_list() == list(test_data.keys())
+
+    def test_link_locations_fuzzy(self, test_data, user):
+        Outpatient.objects.bulk_upsert(sources=test_data.values(), user=user)
+        # 名称は一部だけ一致し、住所のブロックが同じ位置情報
+        location = Location.objects.create(
+            medical_institution_name="旭川厚生病院",
+            address="旭川市1条通24丁目111番地3",
+            created_by=user,
+        )
+        # 名称は一部だけ一致するが、住所のブロックが異なる位置情報
+        Location.objects.create(
+            medical_institution_name="旭川赤十字",
+            address="旭川市神楽岡1条1丁目",
+            created_by=user,
+        )
+        assert Outpatient.objects.link_locations() == 1
+        outpatient = Outpatient.objects.get(
+            medical_institution_name="JA北海道厚生連旭川厚生病院"
+        )
+        assert outpatient.location == location
+        assert outpatient.location_match_confidence == pytest.approx(0.9)
+        assert Outpatient.objects.fuzzy_linked_list() == [
+            ("JA北海道厚生連旭川厚生病院", "旭川厚生病院", pytest.approx(0.9))
+        ]
+        assert Outpatient.objects.link_locations(threshold=0.95) == 1
+        assert Outpatient.objects.fuzzy_linked_list() == []
+
+    def test_save_links_location(self, test_data, user):
+        location = Location.objects.create(
+            medical_institution_name="市立旭川病院", created_by=user
+        )
+        outpatient = Outpatient(created_by=user, **test_data["市立旭川病院"])
+        outpatient.save()
+        assert outpatient.location == location
+
+    def test_save_links_location_fuzzy(self, test_data, user, mocker):
+        location = Location.objects.create(
+            medical_institution_name="旭川厚生病院",
+            address="旭川市1条通24丁目111番地3",
+            created_by=user,
+        )
+        Location.objects.bulk_create(
+            Location(
+                medical_institution_name="札幌第{}病院".format(i),
+                address="札幌市中央区北{}条西1丁目".format(i),
+                created_by=user,
+            )
+            for i in range(10)
+        )
+        location_matcher = mocker.spy(models, "LocationMatcher")
+        outpatient = Outpatient(
+            created_by=user, **test_data["JA北海道厚生連旭川厚生病院"]
+        )
+        outpatient.save()
+        assert outpatient.location == location
+        assert outpatient.location_match_confidence == pytest.approx(0.9)
+        # 住所のブロックが異なる位置情報は読み込まない
+        (locations,) = location_matcher.call_args.args
+        assert [candidate["id"] for candidate in locations] == [location.id]
+
+
+@pytest.mark.django_db
+class TestTopPageCache:
+    @pytest.fixture()
+    def user(self):
+        UserModel = get_user_model()
+        user = UserModel.objects.create(
+            username="test_user",
+            email="test@example.com",
+            password="top_secret_pass0001",
+        )
+        return user
+
+    @pytest.fixture()
+    def outpatient(self, user, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            return Outpatient.objects.create(
+                medical_institution_name="市立旭川病院", created_by=user
+            )
+
+    def test_cached_for_anonymous(self, outpatient, django_assert_num_queries):
+        client = Client()
+        response = client.get("/")
+        assert "市立旭川病院" in response.content.decode("utf-8")
+        with django_assert_num_queries(0):
+            cached_response = client.get("/")
+        assert cached_response.content == response.content
+
+    def test_invalidated_on_save(
+        self, user, outpatient, django_capture_on_commit_callbacks
+    ):
+        client = Client()
+        client.get("/")
+        with django_capture_on_commit_callbacks(execute=True):
+            Outpatient.objects.create(
+                medical_institution_name="旭川赤十字病院", created_by=user
+            )
+        assert "旭川赤十字病院" in client.get("/").content.decode("utf-8")
+
+    def test_invalidated_on_delete_missing(
+        self, user, outpatient, django_capture_on_commit_callbacks
+    ):
+        client = Client()
+        client.get("/")
+        with django_capture_on_commit_callbacks(execute=True):
+            Outpatient.objects.delete_missing([])
+        assert "市立旭川病院" not in client.get("/").content.decode("utf-8")
+
+    def test_cache_key(self, outpatient, mocker, django_assert_num_queries):
+        get_or_render = mocker.spy(views, "get_or_render")
+        client = Client()
+        blank_filters = {
+            "q": "",
+            "city": "",
+            "public_health_care_center": "",
+            "is_positive_patients": "unknown",
+            "is_target_not_family": "unknown",
+            "is_pediatrics": "unknown",
+            "is_online_for_positive_patients": "unknown",
+            "is_home_visitation_for_positive_patients": "unknown",
+        }
+        response = client.get("/", blank_filters)
+        with django_assert_num_queries(0):
+            assert client.get("/", {"page": "1", "junk": "x"}).content == (
+                response.content
+            )
+        (key,) = {call.args[0] for call in get_or_render.call_args_list}
+        assert len(key) == len("top:") + 64 + len(":1")
+        cache_key = "outpatients:{}:{}".format("0" * 32, key)
+        assert list(memcache_key_warnings(cache_key)) == []
+
+        response = client.get("/", {"city": "札幌市", "junk": "x"})
+        assert "市立旭川病院" not in response.content.decode("utf-8")
+        assert "junk" not in response.content.decode("utf-8")
+
+    def test_invalidated_on_queryset_delete(
+        self, user, outpatient, django_capture_on_commit_callbacks
+    ):
+        client = Client()
+        client.get("/")
+        # 管理画面の一括削除と同じく QuerySet.delete で削除する
+        with django_capture_on_commit_callbacks(execute=True):
+            Outpatient.objects.filter(pk=outpatient.pk).delete()
+        assert "市立旭川病院" not in client.get("/").content.decode("utf-8")
+
+    def test_invalidated_on_user_delete(
+        self, user, outpatient, django_capture_on_commit_callbacks
+    ):
+        client = Client()
+        client.get("/")
+        with django_capture_on_commit_callbacks(execute=True):
+            get_user_model().objects.filter(pk=user.pk).delete()
+        assert "市立旭川病院" not in client.get("/").content.decode("utf-8")
+
+    def test_not_cached_for_authenticated_user(self, user, outpatient):
+        client = Client()
+        client.force_login(user)
+        assert "ログアウト" in client.get("/").content.decode("utf-8")
+        assert "ログアウト" not in Client().get("/").content.decode("utf-8")
+
+
+@pytest.mark.django_db
+class TestTopPage:
+    @pytest.fixture()
+    def user(self):
+        UserModel = get_user_model()
+        user = UserModel.objects.create(
+            username="test_user",
+            email="test@example.com",
+            password="top_secret_pass0001",
+        )
+        return user
+
+    @pytest.fixture()
+    def client(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    @pytest.fixture()
+    def outpatients(self, user):
+        return Outpatient.objects.bulk_create(
+            [
+                Outpatient(
+                    medical_institution_name="医療機関{}".format(i),
+                    city="旭川市" if i % 2 == 0 else "鷹栖町",
+                    is_pediatrics=i % 3 == 0,
+                    created_by=user,
+                )
+                for i in range(60)
+            ]
+        )
+
+    def test_paginate(self, client, outpatients):
+        response = client.get("/")
+        assert len(response.context["outpatients"]) == 50
+        assert response.context["page_obj"].paginator.count == 60
+        response = client.get("/", {"page": 2})
+        assert len(response.context["outpatients"]) == 10
+
+    def test_filter(self, client, outpatients):
+        response = client.get("/", {"city": "旭川市", "is_pediatrics": "true"})
+        names = [
+            outpatient.medical_institution_name
+            for outpatient in response.context["outpatients"]
+        ]
+        assert names == ["医療機関{}".format(i) for i in range(0, 60, 6)]
+        assert response.context["querystring"] == (
+            "city=%E6%97%AD%E5%B7%9D%E5%B8%82&is_pediatrics=true"
+        )
+
+    def test_search(self, client, user, outpatients):
+        Outpatient.objects.bulk_create(
+            [
+                Outpatient(
+                    medical_institution_name="JA北海道厚生連旭川厚生病院",
+                    address="旭川市1条通24丁目111番地",
+                    created_by=user,
+                ),
+                Outpatient(
+                    medical_institution_name="厚生クリニック",
+                    memo="旭川厚生病院の近く",
+                    created_by=user,
+                ),
+            ]
+        )
+        response = client.get("/", {"q": "旭川厚生"})
+        names = [
+            outpatient.medical_institution_name
+            for outpatient in response.context["outpatients"]
+        ]
+        assert names == ["JA北海道厚生連旭川厚生病院", "厚生クリニック"]
+
+    def test_empty(self, client, outpatients):
+        content = client.get("/", {"city": "札幌市"}).content.decode("utf-8")
+        assert "条件に一致する発熱外来はありません。" in content
+        assert "発熱外来はまだ作成されていません。" not in content
+        Outpatient.objects.all().delete()
+        content = client.get("/", {"is_pediatrics": "unknown"}).content.decode("utf-8")
+        assert "発熱外来はまだ作成されていません。" in content
+
+    def test_cached_per_page(self, outpatients, django_assert_num_queries):
+        client = Client()
+        first = client.get("/").content
+        last = client.get("/", {"page": 2}).content
+        assert "医療機関59<" in last.decode("utf-8")
+        # 整数でないページ番号は最初のページ、範囲外のページ番号は最後のページの
+        # キャッシュを使う
+        with django_assert_num_queries(0):
+            assert client.get("/", {"page": "9" * 5000}).content == first
+            assert client.get("/", {"page": "abc"}).content == first
+            assert client.get("/", {"page": 1000}).content == last
+            assert client.get("/", {"page": 1001}).content == last
+            assert client.get("/", {"page": -1}).content == last
+
+    def test_cached_per_query(self, outpatients):
+        client = Client()
+        content = client.get("/", {"city": "鷹栖町"}).content.decode("utf-8")
+        assert "医療機関1<" in content
+        assert "医療機関0<" not in content
+        content = client.get("/", {"city": "旭川市"}).content.decode("utf-8")
+        assert "医療機関0<" in content
+
 
 @pytest.mark.django_db
 class TestLocation:
@@ -246,6 +753,20 @@ class TestLocation:
         outpatient = Location.objects.get(medical_institution_name="市立旭川病院")
         assert outpatient.longitude == 143
 
+    def test_bulk_upsert_location(self, test_data, user):
+        Location.objects.upsert(source=test_data["市立旭川病院"], user=user)
+        test_update_data = {
+            "medical_institution_name": "市立旭川病院",
+            "longitude": 143,
+            "latitude": 44,
+        }
+        result = Location.objects.bulk_upsert(
+            sources=[test_update_data, test_data["森山病院"]], user=user
+        )
+        assert result == (1, 1, 0)
+        location = Location.objects.get(medical_institution_name="市立旭川病院")
+        assert location.longitude == 143
+
     def test_delete_outpatient(self, test_data, user):
         Location.objects.upsert(source=test_data["市立旭川病院"], user=user)
         result = Location.objects.delete("市立旭川病院")
@@ -256,6 +777,35 @@ class TestLocation:
         result = Location.objects.delete("旭川赤十字病院")
         assert result is False
 
+    def test_delete_missing_location(self, test_data, user):
+        for value in test_data.values():
+            Location.objects.upsert(source=value, user=user)
+
+        result = Location.objects.delete_missing(["森山病院"])
+        assert result == 3
+        assert list(
+            Location.objects.values_list("medical_institution_name", flat=True)
+        ) == ["森山病院"]
+
+
+class TestHTTPClient:
+    def test_get(self, mocker):
+        get_mock = mocker.patch.object(requests.Session, "get")
+        client = HTTPClient(timeout=(1, 2), retries=5)
+        client.get("http://dummy.local", headers={"If-None-Match": '"abc"'})
+        assert get_mock.call_args.kwargs["timeout"] == (1, 2)
+        assert get_mock.call_args.kwargs["headers"] == {"If-None-Match": '"abc"'}
+        assert client.session.get_adapter("https://dummy.local").max_retries.total == 5
+
+    def test_get_default(self, settings):
+        HTTPClient.reset_default()
+        settings.DOWNLOADER = {"TIMEOUT": (3, 4), "USER_AGENT": "opendata-test"}
+        client = HTTPClient.get_default()
+        assert client is HTTPClient.get_default()
+        assert client.timeout == (3, 4)
+        assert client.session.headers["User-Agent"] == "opendata-test"
+        HTTPClient.reset_default()
+
 
 class TestDownloadCSV:
     @pytest.fixture()
@@ -272,11 +822,86 @@ No,全国地方公共団体コード,都道府県名,市区町村名,公表_年
         responce_mock = mocker.Mock()
         responce_mock.status_code = 200
         responce_mock.content = csv_content
+        responce_mock.iter_content.return_value = [csv_content]
         responce_mock.headers = {"content-type": "text/csv"}
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         csv_file = DownloadCSV(url="http://dummy.local", encoding="cp932")
         assert csv_file.content.getvalue() == csv_content.decode("cp932")
 
+    def test_iter_lines(self, csv_content, mocker):
+        responce_mock = mocker.Mock()
+        responce_mock.status_code = 200
+        responce_mock.headers = {"content-type": "text/csv"}
+        # マルチバイト文字の途中で分割されたチャンクもデコードできることを確認する
+        responce_mock.iter_content.return_value = [
+            csv_content[i : i + 7] for i in range(0, len(csv_content), 7)
+        ]
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
+        csv_file = DownloadCSV(url="http://dummy.local", encoding="cp932")
+        lines = list(csv_file.iter_lines())
+        assert "".join(lines) == csv_content.decode("cp932")
+        assert all(line.endswith("\n") for line in lines[:-1])
+
+
+class TestDownloadCache:
+    @pytest.fixture()
+    def csv_content(self):
+        return "医療機関名,緯度,経度\n市立旭川病院,43.778144,142.365952\n".encode(
+            "cp932"
+        )
+
+    def test_not_modified(self, csv_content, mocker):
+        responce_mock = mocker.Mock()
+        responce_mock.status_code = 200
+        responce_mock.content = csv_content
+        responce_mock.iter_content.return_value = [csv_content]
+        responce_mock.headers = {"content-type": "text/csv", "ETag": '"abc"'}
+        not_modified_mock = mocker.Mock()
+        not_modified_mock.status_code = 304
+        not_modified_mock.content = b""
+        not_modified_mock.headers = {"ETag": '"abc"'}
+        get_mock = mocker.patch.object(
+            requests.Session, "get", side_effect=[responce_mock, not_modified_mock]
+        )
+        first_csv_file = DownloadCSV(url="http://dummy.local", encoding="cp932")
+        assert first_csv_file.not_modified is False
+        assert first_csv_file.content.getvalue() == csv_content.decode("cp932")
+        csv_file = DownloadCSV(url="http://dummy.local", encoding="cp932")
+        assert csv_file.not_modified
+        assert csv_file.content.getvalue() == csv_content.decode("cp932")
+        assert get_mock.call_args.kwargs["headers"]["If-None-Match"] == '"abc"'
+
+    def test_meta_without_url(self, csv_content, download_cache_dir, mocker):
+        responce_mock = mocker.Mock()
+        responce_mock.status_code = 200
+        responce_mock.content = csv_content
+        responce_mock.iter_content.return_value = [csv_content]
+        responce_mock.headers = {"ETag": '"abc"'}
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
+        DownloadCSV(url="http://dummy.local/?appid=secret", encoding="cp932").content
+        (meta_path,) = download_cache_dir.glob("*.json")
+        assert "secret" not in meta_path.read_text(encoding="utf-8")
+
+    def test_skip_if_not_modified(self, csv_content, mocker):
+        responce_mock = mocker.Mock()
+        responce_mock.status_code = 200
+        responce_mock.content = csv_content
+        responce_mock.iter_content.return_value = [csv_content]
+        responce_mock.headers = {"Last-Modified": "Wed, 01 Mar 2023 00:00:00 GMT"}
+        not_modified_mock = mocker.Mock()
+        not_modified_mock.status_code = 304
+        not_modified_mock.content = b""
+        not_modified_mock.headers = {}
+        mocker.patch.object(
+            requests.Session, "get", side_effect=[responce_mock, not_modified_mock]
+        )
+        ScrapeOpendataLocation("http://dummy.local").lists
+        location_data = ScrapeOpendataLocation(
+            "http://dummy.local", skip_if_not_modified=True
+        )
+        assert location_data.not_modified
+        assert location_data.lists == []
+
 
 class TestDownloadJSON:
     @pytest.fixture()
@@ -312,7 +937,7 @@ class TestDownloadJSON:
         responce_mock.status_code = 200
         responce_mock.content = json_content
         responce_mock.headers = {"content-type": "application/json"}
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         json_file = DownloadJSON("http://dummy.local")
         assert json_file.content == json_content
 
@@ -329,11 +954,44 @@ class TestDownloadExcel:
         responce_mock.headers = {
             "content-type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         }
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         excel_file = DownloadExcel("http://dummy.local")
         assert isinstance(excel_file.content, BytesIO)
 
 
+class TestNormalizer:
+    def test_normalize(self):
+        normalizer = Normalizer(maxsize=2)
+        assert normalizer.normalize("ＪＡ北海道厚生連　旭川厚生病院\n") == "JA北海道厚生連 旭川厚生病院"
+        assert normalizer.normalize("0") == ""
+        assert normalizer.normalize(None) == ""
+
+    def test_cache_info(self):
+        normalizer = Normalizer(maxsize=2)
+        for text in ["○", "○", "08:30:00", "○"]:
+            normalizer.normalize(text)
+        cache_info = normalizer.cache_info()
+        assert cache_info.hits == 2
+        assert cache_info.misses == 2
+        assert normalizer.hit_rate == 0.5
+        normalizer.cache_clear()
+        assert normalizer.hit_rate == 0.0
+
+
+class TestParseOpeningHours:
+    def test_parse(self):
+        assert parse_opening_hours("08:30～11:30、13:00～17:00") == (
+            (510, 690),
+            (780, 1020),
+        )
+        assert parse_opening_hours("8時30分～17時") == ((510, 1020),)
+        assert parse_opening_hours("22:00～02:00") == ((1320, 1560),)
+
+    def test_parse_invalid(self):
+        assert parse_opening_hours("") == ()
+        assert parse_opening_hours("当番制のため不定期") == ()
+
+
 class TestScrapeOutpatient:
     @pytest.fixture()
     def excel_lists(self):
@@ -526,9 +1184,9 @@ class TestScrapeOutpatient:
         responce_mock.headers = {
             "content-type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         }
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         mocker.patch.object(
-            ScrapeOutpatient, "_get_excel_lists", return_value=excel_lists
+            ScrapeOutpatient, "_get_excel_frame", return_value=pd.DataFrame(excel_lists)
         )
         scraper = ScrapeOutpatient(excel_url="http://dummy.local")
         expect = [
@@ -602,6 +1260,57 @@ class TestScrapeOutpatient:
         assert scraper.lists == expect
 
 
+    def test_get_outpatients_matches_rows(self, excel_lists, mocker):
+        mocker.patch.object(
+            ScrapeOutpatient, "_get_excel_frame", return_value=pd.DataFrame()
+        )
+        scraper = ScrapeOutpatient(excel_url="http://dummy.local")
+        # 列単位の変換と行単位の変換で同じ結果になることを確認する
+        excel_lists = excel_lists + [
+            ["", "", "", "", "", "", "", "", "", "0"] + ["08:30:00", "", "11:30:00"] * 16
+        ]
+        expect = [scraper._get_outpatient(excel_row) for excel_row in excel_lists]
+        assert scraper._get_outpatients(pd.DataFrame(excel_lists)) == expect
+
+
+    @pytest.fixture()
+    def excel_content(self, excel_lists):
+        workbook = openpyxl.Workbook()
+        worksheet = workbook.active
+        worksheet.title = "Sheet1"
+        for _ in range(3):
+            worksheet.append(["見出し"])
+        for excel_row in excel_lists:
+            worksheet.append(
+                [
+                    datetime.time(int(value[:2]), int(value[3:5]))
+                    if value.endswith(":00") and len(value) == 8
+                    else value
+                    for value in excel_row
+                ]
+            )
+        worksheet.append([])
+        worksheet.append([1, 0.5, None, "医療機関"] + [""] * 54)
+        worksheet.append([])
+        excel_io = BytesIO()
+        workbook.save(excel_io)
+        return excel_io.getvalue()
+
+    def test_lists_by_openpyxl(self, excel_content, mocker):
+        responce_mock = mocker.Mock()
+        responce_mock.status_code = 200
+        responce_mock.content = excel_content
+        responce_mock.headers = {
+            "content-type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        }
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
+        # openpyxl で 1 行ずつ読み込んだ場合と pandas で読み込んだ場合で同じ結果になることを確認する
+        expect = ScrapeOutpatient(excel_url="http://dummy.local", engine="pandas").lists
+        scraper = ScrapeOutpatient(excel_url="http://dummy.local", engine="openpyxl")
+        assert scraper.lists == expect
+        assert len(expect) == 5
+
+
 class TestScrapeOpendataLocation:
     @pytest.fixture()
     def csv_content(self):
@@ -618,25 +1327,32 @@ class TestScrapeOpendataLocation:
         responce_mock = mocker.Mock()
         responce_mock.status_code = 200
         responce_mock.content = csv_content
+        responce_mock.iter_content.return_value = [csv_content]
         responce_mock.headers = {"content-type": "text/csv"}
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         location_data = ScrapeOpendataLocation("http://dummy.local")
         result = location_data.lists
         expect = [
             {
                 "medical_institution_name": "市立旭川病院",
+                "address": "旭川市金星町1丁目1番65号",
                 "longitude": 142.365952,
                 "latitude": 43.778144,
+                "is_geocoded": False,
             },
             {
                 "medical_institution_name": "旭川赤十字病院",
+                "address": "旭川市曙1条1丁目1番1号",
                 "longitude": 142.348394,
                 "latitude": 43.769637,
+                "is_geocoded": False,
             },
             {
                 "medical_institution_name": "JA北海道厚生連旭川厚生病院",
+                "address": "旭川市1条通24丁目111番地3",
                 "longitude": 142.384931,
                 "latitude": 43.758732,
+                "is_geocoded": False,
             },
         ]
         assert expect == result
@@ -676,13 +1392,26 @@ class TestScrapeYOLPLocation:
         responce_mock.status_code = 200
         responce_mock.content = json_content
         responce_mock.headers = {"content-type": "application/json"}
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         location_data = ScrapeYOLPLocation("市立旭川病院")
         result = location_data.lists[0]
         assert result["medical_institution_name"] == "市立旭川病院"
         assert result["longitude"] == 142.365976388889
         assert result["latitude"] == 43.778422777778
 
+    def test_not_cached(self, json_content, download_cache_dir, yolp_app_id, mocker):
+        responce_mock = mocker.Mock()
+        responce_mock.status_code = 200
+        responce_mock.content = json_content
+        responce_mock.headers = {"content-type": "application/json", "ETag": '"abc"'}
+        get_mock = mocker.patch.object(
+            requests.Session, "get", return_value=responce_mock
+        )
+        ScrapeYOLPLocation("市立旭川病院")
+        ScrapeYOLPLocation("市立旭川病院")
+        assert "If-None-Match" not in get_mock.call_args.kwargs["headers"]
+        assert not download_cache_dir.exists()
+
 
 class TestScrapeOutpatientSourceURL:
     @pytest.fixture()
@@ -748,10 +1477,846 @@ class TestScrapeOutpatientSourceURL:
             "content-type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         }
         responce_mock.content = html_content
-        mocker.patch.object(requests, "get", return_value=responce_mock)
+        mocker.patch.object(requests.Session, "get", return_value=responce_mock)
         url = ScrapeOutpatientSourceURL.get("http://dummy.local")
         expect = (
             "https://www.pref.hokkaido.lg.jp/"
             + "fs/8/6/1/1/7/8/8/_/%E3%80%90%E6%97%AD%E5%B7%9D%E5%B8%82%E3%80%91%E5%A4%96%E6%9D%A5%E5%AF%BE%E5%BF%9C%E5%8C%BB%E7%99%82%E6%A9%9F%E9%96%A2(R5.6.7).xlsx"
         )
         assert url == expect
+
+
+@pytest.mark.django_db
+class TestUpdateOutpatientsCommand:
+    @pytest.fixture()
+    def admin_user(self):
+        UserModel = get_user_model()
+        return UserModel.objects.create(
+            username="admin",
+            email="admin@example.com",
+            password="top_secret_pass0001",
+        )
+
+    @pytest.fixture()
+    def responses(self):
+        html_content = """
+<article>
+    <div><p><a href="/fs/asahikawa.xlsx"><img alt="02E_旭川.jpg" /></a></p></div>
+</article>
+"""
+        workbook = openpyxl.Workbook()
+        worksheet = workbook.active
+        worksheet.title = "Sheet1"
+        for _ in range(3):
+            worksheet.append(["見出し"])
+        for name, address in [
+            ("市立旭川病院", "北海道旭川市金星町1丁目1番65号"),
+            ("旭川赤十字病院", "北海道旭川市曙1条1丁目1番1号"),
+        ]:
+            worksheet.append(
+                ["○", "○", "旭川", name, "旭川市", address, "0166-00-0000", "", "○"]
+                + ["08:30:00", "", "17:00:00", "00:00:00", "", "00:00:00"] * 7
+                + ["○", "", "", "", "", "", ""]
+            )
+        excel_io = BytesIO()
+        workbook.save(excel_io)
+
+        def csv_content(name, latitude, longitude):
+            header = ",".join(["列" + str(i) for i in range(37)])
+            row = [
+                "010006",
+                "1",
+                "北海道",
+                "上川総合振興局",
+                "旭川市",
+                name,
+                "",
+                "病院",
+                "070-0000",
+                "旭川市",
+                "",
+                latitude,
+                longitude,
+            ] + [""] * 24
+            return (header + "\n" + ",".join(row) + "\n").encode("cp932")
+
+        return {
+            update_outpatients.OUTPATIENTS_URL: html_content.encode("utf-8"),
+            "https://www.pref.hokkaido.lg.jp/fs/asahikawa.xlsx": excel_io.getvalue(),
+            update_outpatients.HOSPITAL_OPENDATA_URL: csv_content(
+                "市立旭川病院", "43.778144", "142.365952"
+            ),
+            update_outpatients.CLINIC_OPENDATA_URL: csv_content(
+                "旭川赤十字病院", "43.769637", "142.348394"
+            ),
+        }
+
+    @pytest.fixture()
+    def session_get(self, responses, mocker):
+        def get(url, headers=None, **kwargs):
+            etag = '"{}"'.format(len(responses[url]))
+            responce_mock = mocker.Mock()
+            responce_mock.headers = {"ETag": etag}
+            if headers and headers.get("If-None-Match") == etag:
+                responce_mock.status_code = 304
+                responce_mock.content = b""
+                responce_mock.iter_content.return_value = []
+            else:
+                responce_mock.status_code = 200
+                responce_mock.content = responses[url]
+                responce_mock.iter_content.return_value = [responses[url]]
+            return responce_mock
+
+        return mocker.patch.object(requests.Session, "get", side_effect=get)
+
+    def test_handle(self, admin_user, session_get):
+        stdout = StringIO()
+        call_command("update_outpatients", stdout=stdout)
+        assert sorted(Outpatient.objects.medical_institution_names_list()) == sorted(
+            ["市立旭川病院", "旭川赤十字病院"]
+        )
+        assert Outpatient.objects.get(medical_institution_name="市立旭川病院").mon == (
+            "08:30～17:00"
+        )
+        assert Location.objects.count() == 2
+        assert (
+            Outpatient.objects.get(medical_institution_name="市立旭川病院").location
+            == Location.objects.get(medical_institution_name="市立旭川病院")
+        )
+        assert "発熱外来: 新規 2 件、更新 0 件、変更なし 0 件、削除 0 件" in stdout.getvalue()
+        assert "位置情報が見つからない発熱外来" not in stdout.getvalue()
+        assert OpeningHours.objects.count() == 14
+        assert "正規化キャッシュ" in stdout.getvalue()
+
+    def test_handle_change_logs(self, admin_user, session_get):
+        call_command("update_outpatients", stdout=StringIO())
+        run = IngestRun.objects.get()
+        assert run.finished_at is not None
+        assert run.change_logs.filter(target="outpatient").count() == 2
+        assert run.change_logs.filter(target="location").count() == 2
+
+        stdout = StringIO()
+        call_command(
+            "list_changes", str(run.id - 1), "--target", "outpatient", stdout=stdout
+        )
+        assert "#{} 発熱外来 新規: 市立旭川病院".format(run.id) in stdout.getvalue()
+        assert "位置情報" not in stdout.getvalue()
+        assert "変更履歴: 2 件" in stdout.getvalue()
+
+        stdout = StringIO()
+        call_command("list_changes", stdout=stdout)
+        assert stdout.getvalue().startswith("#{} ".format(run.id))
+
+        with pytest.raises(CommandError):
+            call_command("list_changes", str(run.id), str(run.id - 1))
+
+    def test_handle_report_file(self, admin_user, session_get, tmp_path, caplog):
+        report_file = tmp_path / "report.json"
+        with caplog.at_level("INFO"):
+            call_command(
+                "update_outpatients",
+                "--report-file",
+                str(report_file),
+                stdout=StringIO(),
+            )
+        report = json.loads(report_file.read_text(encoding="utf-8"))
+        assert report["status"] == "succeeded"
+        assert report["run_id"] == IngestRun.objects.get().id
+        stages = {stage["name"]: stage for stage in report["stages"]}
+        assert {
+            "fetch",
+            "fetch_outpatients",
+            "fetch_outpatients.download",
+            "fetch_outpatients.read_excel",
+            "fetch_locations",
+            "upsert_outpatients",
+            "upsert_outpatients.rebuild_opening_hours",
+            "upsert_locations",
+            "link_locations",
+        } <= set(stages)
+        assert stages["fetch_outpatients"]["bytes_downloaded"] > 0
+        assert stages["fetch_outpatients.read_excel"]["rows_parsed"] > 0
+        assert stages["upsert_outpatients"]["rows_written"] >= 2
+        assert stages["upsert_outpatients"]["queries"] > 0
+        assert report["totals"]["rows_written"] >= 4
+        assert [
+            record.report for record in caplog.records if hasattr(record, "report")
+        ] == [report]
+
+    def test_handle_report_failed(self, admin_user, session_get, mocker, caplog):
+        mocker.patch.object(
+            Outpatient.objects, "bulk_upsert", side_effect=RuntimeError("error")
+        )
+        with pytest.raises(RuntimeError):
+            call_command("update_outpatients", stdout=StringIO())
+        (record,) = [record for record in caplog.records if hasattr(record, "report")]
+        assert record.report["status"] == "failed"
+        assert record.report["error"] == "RuntimeError('error')"
+        assert record.report["stages"][-1]["name"] == "upsert_outpatients"
+
+    def test_handle_not_modified(self, admin_user, session_get):
+        call_command("update_outpatients", stdout=StringIO())
+        stdout = StringIO()
+        call_command("update_outpatients", stdout=stdout)
+        assert "発熱外来一覧が更新されていないため" in stdout.getvalue()
+        assert "位置情報が更新されていないため" in stdout.getvalue()
+        assert Outpatient.objects.count() == 2
+
+    def test_handle_after_failure(self, admin_user, session_get, mocker):
+        bulk_upsert = mocker.patch.object(
+            Outpatient.objects, "bulk_upsert", side_effect=RuntimeError("error")
+        )
+        with pytest.raises(RuntimeError):
+            call_command("update_outpatients", stdout=StringIO())
+        assert Outpatient.objects.count() == 0
+
+        # 取り込み元は更新されていないが、前回の失敗で反映されていないため取り込む
+        mocker.stop(bulk_upsert)
+        stdout = StringIO()
+        call_command("update_outpatients", stdout=stdout)
+        assert "前回の取り込みが完了していないため" in stdout.getvalue()
+        assert Outpatient.objects.count() == 2
+        assert Location.objects.count() == 2
+
+    def test_handle_max_workers(self, admin_user, session_get):
+        call_command("update_outpatients", "--max-workers", "1", stdout=StringIO())
+        assert Outpatient.objects.count() == 2
+        assert Location.objects.count() == 2
+        assert session_get.call_count == 4
+
+    def test_handle_force(self, admin_user, session_get):
+        call_command("update_outpatients", stdout=StringIO())
+        stdout = StringIO()
+        call_command("update_outpatients", "--force", stdout=stdout)
+        assert "発熱外来: 新規 0 件、更新 0 件、変更なし 2 件、削除 0 件" in stdout.getvalue()
+        assert "位置情報: 新規 0 件、更新 0 件、変更なし 2 件、削除 0 件" in stdout.getvalue()
+
+    def test_handle_geocode(self, admin_user, responses, session_get, yolp_app_id):
+        # 旭川赤十字病院がオープンデータにない場合
+        responses[update_outpatients.CLINIC_OPENDATA_URL] = responses[
+            update_outpatients.CLINIC_OPENDATA_URL
+        ].replace("旭川赤十字病院".encode("cp932"), "旭川医療センター".encode("cp932"))
+        responses[
+            "https://map.yahooapis.jp/search/local/V1/localSearch?appid="
+            + yolp_app_id
+            + "&query=%E6%97%AD%E5%B7%9D%E8%B5%A4%E5%8D%81%E5%AD%97%E7%97%85%E9%99%A2"
+            + "&ac=01204&gc=0401&sort=-match&detail=simple&output=json"
+        ] = json.dumps(
+            {
+                "ResultInfo": {"Count": 1},
+                "Feature": [{"Geometry": {"Coordinates": "142.348394,43.769637"}}],
+            }
+        ).encode("utf-8")
+
+        stdout = StringIO()
+        call_command("update_outpatients", "--geocode", stdout=stdout)
+        assert "緯度経度の検索: 1 件中 1 件が見つかりました (API 呼び出し 1 件)" in (
+            stdout.getvalue()
+        )
+        location = Outpatient.objects.get(
+            medical_institution_name="旭川赤十字病院"
+        ).location
+        assert (location.latitude, location.longitude) == (43.769637, 142.348394)
+
+        # 検索した位置情報は削除せず、キャッシュを使う
+        stdout = StringIO()
+        call_command("update_outpatients", "--geocode", "--force", stdout=stdout)
+        assert "位置情報: 新規 0 件、更新 0 件、変更なし 2 件、削除 0 件" in stdout.getvalue()
+        assert "位置情報が見つからない発熱外来" not in stdout.getvalue()
+
+        # --geocode を指定しない実行でオープンデータが更新されても、検索した位置情報は残す
+        responses[update_outpatients.HOSPITAL_OPENDATA_URL] = responses[
+            update_outpatients.HOSPITAL_OPENDATA_URL
+        ].replace(b"43.778144", b"43.7781445")
+        stdout = StringIO()
+        call_command("update_outpatients", stdout=stdout)
+        assert "位置情報: 新規 0 件、更新 1 件、変更なし 1 件、削除 0 件" in stdout.getvalue()
+        assert Location.objects.get(pk=location.pk).is_geocoded
+        outpatient = Outpatient.objects.get(medical_institution_name="旭川赤十字病院")
+        assert outpatient.location_id == location.pk
+
+        # オープンデータに追加された場合は、オープンデータの位置情報として上書きする
+        responses[update_outpatients.CLINIC_OPENDATA_URL] = responses[
+            update_outpatients.CLINIC_OPENDATA_URL
+        ].replace("旭川医療センター".encode("cp932"), "旭川赤十字病院".encode("cp932"))
+        call_command("update_outpatients", stdout=StringIO())
+        assert not Location.objects.get(pk=location.pk).is_geocoded
+
+
+@pytest.mark.django_db
+class TestAPI:
+    @pytest.fixture()
+    def user(self):
+        UserModel = get_user_model()
+        user = UserModel.objects.create(
+            username="test_user",
+            email="test@example.com",
+            password="top_secret_pass0001",
+        )
+        return user
+
+    @pytest.fixture()
+    def outpatients(self, user):
+        return Outpatient.objects.bulk_create(
+            [
+                Outpatient(
+                    medical_institution_name="医療機関{}".format(i),
+                    city="旭川市",
+                    is_pediatrics=i % 2 == 0,
+                    created_by=user,
+                )
+                for i in range(5)
+            ]
+        )
+
+    def test_outpatients_list(self, outpatients):
+        response = Client().get("/api/outpatients/", {"page_size": 2})
+        data = response.json()
+        assert [result["medical_institution_name"] for result in data["results"]] == [
+            "医療機関0",
+            "医療機関1",
+        ]
+        data = Client().get(data["next"]).json()
+        assert [result["medical_institution_name"] for result in data["results"]] == [
+            "医療機関2",
+            "医療機関3",
+        ]
+
+    def test_outpatients_fields_and_filter(self, outpatients):
+        response = Client().get(
+            "/api/outpatients/",
+            {"fields": "id,medical_institution_name,unknown", "is_pediatrics": "true"},
+        )
+        results = response.json()["results"]
+        assert [set(result) for result in results] == [
+            {"id", "medical_institution_name"}
+        ] * 3
+
+    def test_outpatient_detail_etag(self, outpatients, django_assert_num_queries):
+        url = "/api/outpatients/{}/".format(outpatients[0].id)
+        response = Client().get(url)
+        assert response.json()["medical_institution_name"] == "医療機関0"
+        with django_assert_num_queries(0):
+            response = Client().get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+
+    def test_outpatients_nearest(self, outpatients):
+        for i, outpatient in enumerate(outpatients):
+            outpatient.location = Location.objects.create(
+                medical_institution_name=outpatient.medical_institution_name,
+                latitude=43.77 + 0.1 * i,
+                longitude=142.36,
+                created_by=outpatient.created_by,
+            )
+            outpatient.save()
+
+        response = Client().get(
+            "/api/outpatients/nearest/", {"lat": 44.0, "lon": 142.36, "k": 3}
+        )
+        assert [result["medical_institution_name"] for result in response.json()] == [
+            "医療機関2",
+            "医療機関3",
+            "医療機関1",
+        ]
+        assert response.json()[0]["distance"] == pytest.approx(3.336, abs=0.01)
+
+        response = Client().get(
+            "/api/outpatients/nearest/",
+            {"lat": 44.0, "lon": 142.36, "k": 2, "is_pediatrics": "true"},
+        )
+        assert [result["medical_institution_name"] for result in response.json()] == [
+            "医療機関2",
+            "医療機関4",
+        ]
+
+        outpatients[4].refresh_from_db()
+        for field in ("mon", "tue", "wed", "thu", "fri", "sat", "sun"):
+            setattr(outpatients[4], field, "00:00～23:59")
+        outpatients[4].save()
+        response = Client().get(
+            "/api/outpatients/nearest/",
+            {"lat": 44.0, "lon": 142.36, "open_now": "true"},
+        )
+        assert [result["medical_institution_name"] for result in response.json()] == [
+            "医療機関4"
+        ]
+
+    def test_outpatients_nearest_invalid(self, outpatients):
+        response = Client().get("/api/outpatients/nearest/", {"lat": 100})
+        assert response.status_code == 400
+
+    def test_outpatients_search(self, user, outpatients):
+        Outpatient.objects.create(
+            medical_institution_name="アサヒカワ内科",
+            city="旭川市",
+            created_by=user,
+        )
+        response = Client().get(
+            "/api/outpatients/search/", {"q": "あさひかわ", "fields": "id,city"}
+        )
+        assert response.json() == [
+            {"id": Outpatient.objects.latest("id").id, "city": "旭川市"}
+        ]
+        response = Client().get(
+            "/api/outpatients/search/", {"q": "医療機関", "is_pediatrics": "true"}
+        )
+        assert [result["medical_institution_name"] for result in response.json()] == [
+            "医療機関0",
+            "医療機関2",
+            "医療機関4",
+        ]
+        assert Client().get("/api/outpatients/search/").status_code == 400
+
+    def test_locations_list(self, user):
+        Location.objects.create(
+            medical_institution_name="市立旭川病院",
+            latitude=43.778144,
+            longitude=142.365952,
+            created_by=user,
+        )
+        response = Client().get(
+            "/api/locations/", {"medical_institution_name": "市立旭川病院"}
+        )
+        assert response.json()["results"][0]["latitude"] == 43.778144
+
+
+@pytest.mark.django_db
+class TestExport:
+    @pytest.fixture()
+    def user(self):
+        UserModel = get_user_model()
+        user = UserModel.objects.create(
+            username="test_user",
+            email="test@example.com",
+            password="top_secret_pass0001",
+        )
+        return user
+
+    @pytest.fixture()
+    def outpatients(self, user):
+        Location.objects.create(
+            medical_institution_name="医療機関0",
+            latitude=43.77,
+            longitude=142.36,
+            created_by=user,
+        )
+        outpatients = Outpatient.objects.bulk_create(
+            [
+                Outpatient(
+                    medical_institution_name="医療機関{}".format(i),
+                    city="旭川市",
+                    is_pediatrics=i % 2 == 0,
+                    created_by=user,
+                )
+                for i in range(3)
+            ]
+        )
+        Outpatient.objects.link_locations()
+        return outpatients
+
+    def test_csv(self, outpatients):
+        response = Client().get("/outpatients/export.csv")
+        assert response.streaming
+        assert response["Content-Type"] == "text/csv; charset=utf-8"
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        rows = list(csv.reader(StringIO(content)))
+        index = rows[0].index("medical_institution_name")
+        assert [row[index] for row in rows[1:]] == ["医療機関0", "医療機関1", "医療機関2"]
+
+    def test_ndjson_filtered(self, outpatients):
+        response = Client().get("/outpatients/export.ndjson", {"is_pediatrics": "true"})
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        assert [json.loads(line)["medical_institution_name"] for line in lines] == [
+            "医療機関0",
+            "医療機関2",
+        ]
+
+    def test_geojson(self, outpatients):
+        response = Client().get("/outpatients/export.geojson")
+        data = json.loads(b"".join(response.streaming_content))
+        assert data["type"] == "FeatureCollection"
+        assert len(data["features"]) == 3
+        assert data["features"][0]["geometry"] == {
+            "type": "Point",
+            "coordinates": [142.36, 43.77],
+        }
+        assert data["features"][1]["geometry"] is None
+        assert data["features"][0]["properties"]["city"] == "旭川市"
+
+    def test_unknown_format(self, outpatients):
+        assert Client().get("/outpatients/export.xml").status_code == 404
+
+
+class TestSpatialIndex:
+    def test_nearest(self):
+        rng = np.random.default_rng(0)
+        latitudes = rng.uniform(41.0, 45.5, 2000)
+        longitudes = rng.uniform(139.5, 146.0, 2000)
+        index = SpatialIndex(range(2000), latitudes, longitudes)
+        for latitude, longitude in [(43.77, 142.36), (35.68, 139.76)]:
+            distances = haversine(latitude, longitude, latitudes, longitudes)
+            neighbors = index.nearest(latitude, longitude, k=5)
+            assert [neighbor.outpatient_id for neighbor in neighbors] == list(
+                np.argsort(distances)[:5]
+            )
+            assert [neighbor.distance for neighbor in neighbors] == pytest.approx(
+                np.sort(distances)[:5]
+            )
+
+    def test_nearest_allowed_ids(self):
+        index = SpatialIndex([1, 2, 3], [43.0, 43.1, 43.2], [142.0, 142.0, 142.0])
+        neighbors = index.nearest(43.0, 142.0, k=2, allowed_ids=[2, 3])
+        assert [neighbor.outpatient_id for neighbor in neighbors] == [2, 3]
+        assert index.nearest(43.0, 142.0, k=2, allowed_ids=[]) == []
+
+
+class TestLocationMatcher:
+    @pytest.fixture()
+    def matcher(self):
+        return LocationMatcher(
+            [
+                {
+                    "id": 1,
+                    "medical_institution_name": "旭川厚生病院",
+                    "address": "旭川市1条通24丁目111番地3",
+                },
+                {
+                    "id": 2,
+                    "medical_institution_name": "医療法人社団 おうみや内科クリニック",
+                    "address": "旭川市東光1条1丁目",
+                },
+                {
+                    "id": 3,
+                    "medical_institution_name": "旭川厚生病院",
+                    "address": "札幌市中央区北1条西",
+                },
+            ]
+        )
+
+    def test_name_key(self):
+        assert name_key("醫療法人 髙橋・内科") == "高橋内科"
+        assert name_key("ＡＢＣクリニック") == "abcくりにっく"
+        assert block_key("北海道上川郡東神楽町南1条") == "南1条"
+        assert block_key(None) == ""
+
+    def test_exact(self, matcher):
+        assert matcher.match("おうみや内科クリニック") == Match(2, 1.0)
+        # 同じ名称の位置情報は住所のブロックが同じものを優先する
+        assert matcher.match("旭川厚生病院", "札幌市中央区北1条西1丁目") == Match(3, 1.0)
+        assert matcher.match("旭川厚生病院") == Match(1, 1.0)
+
+    def test_fuzzy(self, matcher):
+        assert matcher.match(
+            "JA北海道厚生連旭川厚生病院", "旭川市1条通24丁目111番地"
+        ) == Match(1, pytest.approx(0.9))
+        # 住所のブロックが異なる位置情報とは比較しない
+        assert matcher.match("JA北海道厚生連旭川厚生病院", "旭川市東光1条") is None
+        assert matcher.match("") is None
+
+
+class TestSearchIndex:
+    @pytest.fixture()
+    def index(self):
+        return SearchIndex(
+            [
+                {
+                    "id": 1,
+                    "medical_institution_name": "市立旭川病院",
+                    "address": "旭川市金星町1丁目1番65号",
+                    "memo": "",
+                },
+                {
+                    "id": 2,
+                    "medical_institution_name": "旭川赤十字病院",
+                    "address": "旭川市曙1条1丁目1番1号",
+                    "memo": None,
+                },
+                {
+                    "id": 3,
+                    "medical_institution_name": "ｵｳﾐﾔ内科クリニック",
+                    "address": "旭川市東光14条5丁目6番6号",
+                    "memo": "市立旭川病院の紹介患者",
+                },
+            ]
+        )
+
+    def test_fold(self):
+        assert fold("ｵｳﾐﾔ 内科　ＡＢＣ") == "おうみや内科abc"
+
+    def test_search(self, index):
+        assert [result.outpatient_id for result in index.search("旭川病院")] == [1, 3]
+        assert [result.outpatient_id for result in index.search("旭川")] == [2, 1, 3]
+        assert [result.outpatient_id for result in index.search("おうみや")] == [3]
+        assert [result.outpatient_id for result in index.search("東光 内科")] == [3]
+        assert [result.outpatient_id for result in index.search("市")] == [1, 3, 2]
+
+    def test_search_not_found(self, index):
+        assert index.search("札幌") == []
+        assert index.search("川旭") == []
+        assert index.search(" ") == []
+
+
+@pytest.mark.django_db
+class TestQueryBudget:
+    @pytest.fixture()
+    def user(self):
+        UserModel = get_user_model()
+        user = UserModel.objects.create(
+            username="test_user",
+            email="test@example.com",
+            password="top_secret_pass0001",
+        )
+        return user
+
+    @pytest.fixture()
+    def client(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    @pytest.fixture()
+    def outpatients(self, user):
+        Outpatient.objects.bulk_create(
+            [
+                Outpatient(
+                    medical_institution_name="医療機関{}".format(i),
+                    city="旭川市",
+                    mon="08:30～17:00",
+                    memo="備考" * 100,
+                    created_by=user,
+                )
+                for i in range(10000)
+            ],
+            batch_size=1000,
+        )
+        OpeningHours.objects.rebuild(Outpatient.objects.all())
+        return Outpatient.objects.order_by("id")
+
+    def test_top(self, client, outpatients):
+        assert client.get("/").status_code == 200
+        assert client.get("/", {"page": 100, "city": "旭川市"}).status_code == 200
+        assert client.get("/", {"q": "医療機関9999", "open_now": "on"}).status_code == 200
+        assert Client().get("/").status_code == 200
+
+    def test_detail(self, client, outpatients):
+        outpatient = outpatients.last()
+        assert client.get("/outpatients/{}/".format(outpatient.id)).status_code == 200
+        assert Client().get("/outpatients/{}/".format(outpatient.id)).status_code == 200
+
+    def test_edit(self, client, outpatients):
+        outpatient = outpatients.last()
+        url = "/outpatients/{}/edit/".format(outpatient.id)
+        assert client.get(url).status_code == 200
+        data = {
+            field: value
+            for field, value in client.get(url).context["form"].initial.items()
+            if value is not None
+        }
+        data["memo"] = "更新"
+        assert client.post(url, data).status_code == 302
+
+    def test_exceeded(self, rf, user):
+        @query_budget(0)
+        def view(request):
+            return HttpResponse(Outpatient.objects.count())
+
+        with pytest.raises(QueryBudgetExceeded):
+            view(rf.get("/"))
+
+    def test_exceeded_not_strict(self, rf, user, settings, caplog):
+        settings.QUERY_BUDGET_STRICT = False
+
+        @query_budget(0)
+        def view(request):
+            return HttpResponse(Outpatient.objects.count())
+
+        assert view(rf.get("/")).status_code == 200
+        assert "view の SQL が上限の 0 件を超えました: 1 件" in caplog.text
+
+
+class TestRunReport:
+    @pytest.mark.django_db
+    def test_stage(self):
+        report = RunReport("test")
+        with report.stage("outer", url="https://example.com"):
+            instrumentation.count(bytes_downloaded=10)
+            with instrumentation.stage("inner"):
+                instrumentation.count(rows_parsed=2)
+                Outpatient.objects.count()
+        with report.stage("other"):
+            instrumentation.count(rows_written=3)
+        report.set(status="succeeded")
+        report.finish()
+
+        result = report.to_dict()
+        assert result["name"] == "test"
+        assert result["status"] == "succeeded"
+        outer, inner, other = result["stages"]
+        assert outer["name"] == "outer"
+        assert outer["url"] == "https://example.com"
+        assert (outer["bytes_downloaded"], outer["rows_parsed"]) == (10, 2)
+        assert outer["queries"] == inner["queries"] == 1
+        assert inner["name"] == "outer.inner"
+        assert (inner["bytes_downloaded"], inner["rows_parsed"]) == (0, 2)
+        assert other["rows_written"] == 3
+        assert result["totals"] == {
+            "queries": 1,
+            "bytes_downloaded": 10,
+            "rows_parsed": 2,
+            "rows_written": 3,
+        }
+
+    def test_without_stage(self):
+        with instrumentation.stage("inner") as stage:
+            instrumentation.count(rows_parsed=1)
+        assert stage is None
+
+    def test_emit(self, tmp_path, caplog):
+        report = RunReport("test")
+        with caplog.at_level("INFO"):
+            result = report.emit(logging.getLogger("test"), tmp_path / "report.json")
+        assert caplog.records[0].report == result
+        assert json.loads(caplog.records[0].getMessage().split(": ", 1)[1]) == result
+        assert json.loads((tmp_path / "report.json").read_text()) == result
+
+
+@pytest.mark.django_db
+class TestGeocoder:
+    @pytest.fixture()
+    def session_get(self, mocker, yolp_app_id):
+        def get(url, headers=None, **kwargs):
+            responce_mock = mocker.Mock()
+            responce_mock.status_code = 200
+            responce_mock.headers = {"content-type": "application/json"}
+            if "query=%E7%A9%BA" in url:
+                raise requests.ConnectionError("接続できません")
+            if "query=%E5%B8%82%E7%AB%8B" in url:
+                responce_mock.content = json.dumps(
+                    {
+                        "ResultInfo": {"Count": 1},
+                        "Feature": [
+                            {"Geometry": {"Coordinates": "142.365976,43.778422"}}
+                        ],
+                    }
+                )
+            else:
+                responce_mock.content = json.dumps({"ResultInfo": {"Count": 0}})
+            return responce_mock
+
+        return mocker.patch.object(requests.Session, "get", side_effect=get)
+
+    def test_geocode_many(self, session_get):
+        geocoder = Geocoder(rate_limit=0)
+        result = geocoder.geocode_many(["市立旭川病院", "市立旭川病院 ", "存在しない病院"])
+        assert result == {
+            "市立旭川病院": Coordinates(43.778422, 142.365976),
+            "市立旭川病院 ": Coordinates(43.778422, 142.365976),
+            "存在しない病院": None,
+        }
+        assert geocoder.api_calls == 2
+
+        # 見つからなかった結果もキャッシュする
+        geocoder = Geocoder(rate_limit=0)
+        assert geocoder.geocode("存在しない病院") is None
+        assert geocoder.geocode("市立旭川病院") == Coordinates(43.778422, 142.365976)
+        assert geocoder.api_calls == 0
+        assert session_get.call_count == 2
+
+    def test_ttl(self, session_get):
+        Geocoder(rate_limit=0).geocode_many(["市立旭川病院", "存在しない病院"])
+        GeocodeCache.objects.update(
+            fetched_at=timezone.now() - datetime.timedelta(days=8)
+        )
+        geocoder = Geocoder(rate_limit=0)
+        geocoder.geocode_many(["市立旭川病院", "存在しない病院"])
+        assert geocoder.api_calls == 1
+
+    def test_error_not_cached(self, session_get):
+        geocoder = Geocoder(rate_limit=0)
+        assert geocoder.geocode_many(["空"]) == {}
+        assert not GeocodeCache.objects.exists()
+
+    def test_rate_limiter(self, mocker):
+        sleep = mocker.patch("outpatients.geocoding.time.sleep")
+        rate_limiter = RateLimiter(10)
+        for _ in range(3):
+            rate_limiter.acquire()
+        assert sleep.call_count == 2
+        assert sleep.call_args_list[-1].args[0] == pytest.approx(0.2, abs=0.05)
+
+
+class TestBenchmarks:
+    @pytest.fixture()
+    def dataset(self):
+        return build_dataset(30)
+
+    @pytest.fixture()
+    def adapter(self, dataset):
+        HTTPClient.reset_default()
+        adapter = FixtureAdapter(
+            dataset.responses, hosts={"map.yahooapis.jp": yolp_response}
+        )
+        adapter.mount(HTTPClient.get_default())
+        yield adapter
+        HTTPClient.reset_default()
+
+    def test_dataset(self, dataset, adapter):
+        assert (
+            ScrapeOutpatientSourceURL.get(update_outpatients.OUTPATIENTS_URL)
+            == EXCEL_URL
+        )
+        outpatients = ScrapeOutpatient(EXCEL_URL).lists
+        assert len(outpatients) == 30
+        assert outpatients[0]["medical_institution_name"] == "医療法人社団旭川第0病院"
+        assert outpatients[0]["address"] == "旭川市1条通1丁目1番地"
+        assert outpatients == ScrapeOutpatient(EXCEL_URL, engine="openpyxl").lists
+
+        names = {outpatient["medical_institution_name"] for outpatient in outpatients}
+        locations = [
+            location
+            for url in (
+                update_outpatients.HOSPITAL_OPENDATA_URL,
+                update_outpatients.CLINIC_OPENDATA_URL,
+            )
+            for location in ScrapeOpendataLocation(url).lists
+        ]
+        assert locations
+        assert {location["medical_institution_name"] for location in locations} <= (
+            names
+        )
+        assert adapter.requests_count == 5
+
+    @pytest.mark.django_db
+    def test_yolp(self, adapter, settings, yolp_app_id):
+        settings.GEOCODING = {"RATE_LIMIT": 0}
+        coordinates = Geocoder.from_settings().geocode("旭川第1クリニック")
+        assert coordinates is not None
+        assert Geocoder.from_settings().geocode("旭川第1クリニック") == coordinates
+
+    @pytest.mark.django_db
+    def test_caches_isolated(self, page_cache):
+        page_cache.set("key", "value")
+        with override_settings(**BENCHMARK_SETTINGS):
+            caches["default"].set("key", "benchmark")
+            clear_database()
+        assert page_cache.get("key") == "value"
+
+    def test_compare(self):
+        baseline = [
+            {"name": "a", "rows": 10, "median_seconds": 1.0, "peak_memory_bytes": 100},
+            {"name": "b", "rows": 10, "median_seconds": 1.0, "peak_memory_bytes": None},
+        ]
+        results = [
+            {"name": "a", "rows": 10, "median_seconds": 1.1, "peak_memory_bytes": 130},
+            {"name": "b", "rows": 10, "median_seconds": 0.5, "peak_memory_bytes": 1},
+            {"name": "c", "rows": 10, "median_seconds": 9.0, "peak_memory_bytes": 1},
+        ]
+        comparisons = compare(results, baseline, threshold=0.2)
+        assert [
+            (comparison["name"], comparison["metric"], comparison["regressed"])
+            for comparison in comparisons
+        ] == [
+            ("a", "median_seconds", False),
+            ("a", "peak_memory_bytes", True),
+            ("b", "median_seconds", False),
+        ]
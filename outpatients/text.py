@@ -0,0 +1,27 @@
+import re
+import unicodedata
+from typing import Optional
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# カタカナ (ァ から ヶ) をひらがなに変換する表
+KANA_TABLE = str.maketrans(
+    {chr(code): chr(code - 0x60) for code in range(ord("ァ"), ord("ヶ") + 1)}
+)
+
+
+def fold(text: Optional[str]) -> str:
+    """検索のために表記の揺れをなくした文字列を返す
+
+    NFKC 正規化、小文字化、カタカナからひらがなへの変換を行い、空白を削除する。
+
+    Args:
+        text (str): 変換したい文字列
+
+    Returns:
+        folded_text (str): 変換した文字列
+
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower().translate(KANA_TABLE)
+    return WHITESPACE_PATTERN.sub("", text)
@@ -4,6 +4,11 @@ from outpatients import views
 
 urlpatterns = [
     path("new/", views.outpatient_new, name="outpatient_new"),
+    path(
+        "export.<str:export_format>",
+        views.outpatient_export,
+        name="outpatient_export",
+    ),
     path("<int:outpatient_id>/", views.outpatient_detail, name="outpatient_detail"),
     path("<int:outpatient_id>/edit/", views.outpatient_edit, name="outpatient_edit"),
 ]
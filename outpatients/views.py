@@ -1,25 +1,108 @@
+import csv
+import hashlib
+import json
+
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.core.paginator import Paginator
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 
-from outpatients.forms import OutpatientForm
+from outpatients.cache import get_or_render, get_or_set
+from outpatients.forms import OutpatientFilterForm, OutpatientForm
 from outpatients.models import Outpatient
+from outpatients.query_budget import query_budget
+from outpatients.serializers import OutpatientSerializer
+
+OUTPATIENTS_PER_PAGE = 50
 
 
+@query_budget(5)
 def top(request):
-    outpatients = Outpatient.objects.all()
-    context = {"outpatients": outpatients}
-    return render(request, "outpatients/top.html", context)
+    # ログインしていない利用者には同じ内容を返すため、データのバージョンと
+    # 検索条件ごとに描画結果をキャッシュし、データベースにアクセスせずに返す
+    # 現在診療中の絞り込みは時刻によって結果が変わるためキャッシュしない
+    # 入力が正しくない場合はエラーを表示するため、キャッシュせずに描画する
+    if not request.user.is_authenticated:
+        form = OutpatientFilterForm(request.GET)
+        if form.is_valid() and not form.cleaned_data["open_now"]:
+            # キーが長くなったり余分なパラメーターでキャッシュが分かれたりしないよう、
+            # 正規化した検索条件と表示するページ番号のハッシュ値をキーにし、
+            # 同じ条件で描画する
+            query = form.get_query()
+            key = hashlib.sha256(query.urlencode().encode("utf-8")).hexdigest()
+            num_pages = get_or_set(
+                "top-pages:" + key,
+                lambda: Paginator(
+                    _get_top_outpatients(form), OUTPATIENTS_PER_PAGE
+                ).num_pages,
+            )
+            number = _get_page_number(request.GET.get("page"), num_pages)
+            if 1 < number:
+                query["page"] = str(number)
+            content = get_or_render(
+                "top:{}:{}".format(key, number),
+                lambda: render_to_string(
+                    "outpatients/top.html", _get_top_context(query), request
+                ).encode("utf-8"),
+            )
+            return HttpResponse(content)
+
+    return render(request, "outpatients/top.html", _get_top_context(request.GET))
+
+
+def _get_page_number(page, num_pages: int) -> int:
+    """``Paginator.get_page`` と同じ規則で、表示するページ番号を返す
+
+    整数でない場合は最初のページ、範囲外の場合は最後のページにする。
+
+    """
+    try:
+        number = int(page)
+    except (TypeError, ValueError):
+        return 1
+    if number < 1 or num_pages < number:
+        return num_pages
+    return number
+
+
+def _get_top_outpatients(form):
+    # 一覧に表示する項目だけを作成者と合わせて 1 回の SQL で読み込む
+    return form.filter(
+        Outpatient.objects.select_related("created_by")
+        .only("id", "medical_institution_name", "created_at", "created_by__username")
+        .order_by("id")
+    )
+
+
+def _get_top_context(query) -> dict:
+    form = OutpatientFilterForm(query)
+    paginator = Paginator(_get_top_outpatients(form), OUTPATIENTS_PER_PAGE)
+    page_obj = paginator.get_page(query.get("page"))
+    querystring = query.copy()
+    querystring.pop("page", None)
+    return {
+        "form": form,
+        "outpatients": page_obj.object_list,
+        "page_obj": page_obj,
+        "querystring": querystring.urlencode(),
+        "is_filtered": bool(form.get_query()),
+    }
 
 
 @login_required
 def outpatient_new(request):
     if request.method == "POST":
         form = OutpatientForm(request.POST)
+        # 医療機関名と作成者の一意制約を検証するため、検証の前に作成者を設定する
+        form.instance.created_by = request.user
         if form.is_valid():
-            outpatient = form.save(commit=False)
-            outpatient.created_by = request.user
-            outpatient.save()
+            outpatient = form.save()
             return redirect(outpatient_detail, outpatient_id=outpatient.pk)
     else:
         form = OutpatientForm()
@@ -27,6 +110,7 @@ def outpatient_new(request):
 
 
 @login_required
+@query_budget(9)
 def outpatient_edit(request, outpatient_id):
     outpatient = get_object_or_404(Outpatient, pk=outpatient_id)
     if outpatient.created_by_id != request.user.id:
@@ -42,8 +126,92 @@ def outpatient_edit(request, outpatient_id):
     return render(request, "outpatients/outpatient_edit.html", {"form": form})
 
 
+@query_budget(3)
 def outpatient_detail(request, outpatient_id):
-    outpatient = get_object_or_404(Outpatient, pk=outpatient_id)
+    outpatient = get_object_or_404(
+        Outpatient.objects.select_related("created_by"), pk=outpatient_id
+    )
     return render(
         request, "outpatients/outpatient_detail.html", {"outpatient": outpatient}
     )
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """書き込まれた値をそのまま返す、 csv.writer 用の疑似ファイル"""
+
+    def write(self, value):
+        return value
+
+
+def outpatient_export(request, export_format):
+    """発熱外来の全件を CSV 、 JSON Lines 、 GeoJSON 形式で 1 行ずつ出力する
+
+    QuerySet を ``iterator`` で少しずつ読み込みながら出力するため、件数によらず
+    メモリ使用量は一定で、最初の行からすぐに送信を始める。
+    トップページと同じ条件で絞り込める。
+
+    """
+    fields = [field for field in OutpatientSerializer.Meta.fields if field != "id"]
+    outpatients = OutpatientFilterForm(request.GET).filter(
+        Outpatient.objects.order_by("id")
+    )
+    if export_format == "csv":
+        content = _export_csv(outpatients, fields)
+        content_type = "text/csv; charset=utf-8"
+    elif export_format == "ndjson":
+        content = _export_ndjson(outpatients, fields)
+        content_type = "application/x-ndjson; charset=utf-8"
+    elif export_format == "geojson":
+        content = _export_geojson(outpatients, fields)
+        content_type = "application/geo+json; charset=utf-8"
+    else:
+        raise Http404("指定された形式には対応していません。")
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="outpatients.{}"'.format(
+        export_format
+    )
+    return response
+
+
+def _iter_values(outpatients, fields):
+    for row in outpatients.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(fields, row))
+
+
+def _export_csv(outpatients, fields):
+    writer = csv.writer(Echo())
+    # Excel で文字化けしないよう BOM を付ける
+    yield "\ufeff" + writer.writerow(fields)
+    for values in _iter_values(outpatients, fields):
+        yield writer.writerow(
+            [
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in values.values()
+            ]
+        )
+
+
+def _export_ndjson(outpatients, fields):
+    for values in _iter_values(outpatients, fields):
+        yield json.dumps(values, ensure_ascii=False, default=str) + "\n"
+
+
+def _export_geojson(outpatients, fields):
+    yield '{"type":"FeatureCollection","features":['
+    separator = ""
+    for values in _iter_values(
+        outpatients, fields + ["location__latitude", "location__longitude"]
+    ):
+        latitude = values.pop("location__latitude")
+        longitude = values.pop("location__longitude")
+        geometry = None
+        if latitude is not None and longitude is not None:
+            geometry = {"type": "Point", "coordinates": [longitude, latitude]}
+        feature = {"type": "Feature", "geometry": geometry, "properties": values}
+        yield separator + json.dumps(feature, ensure_ascii=False, default=str)
+        separator = ","
+    yield "]}"